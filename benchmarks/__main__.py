@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+python -m benchmarks [--size N] [--mix raid] [--output results.json]
+                     [--compare baseline.json] [--only match,normalize]
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.corpus import MIXES
+from benchmarks.suite import compare, import_times, run_suite
+
+
+def print_result(name, result):
+    print(f"{name:<28} {result['ns_per_op']:>12,.0f} ns/op "
+          f"{result['ops_per_sec']:>14,.0f} ops/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--mix", choices=sorted(MIXES), default='raid')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--only", type=lambda value: value.split(","), default=None,
+        help="comma-separated substrings of benchmark names to run")
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument(
+        "--imports", type=int, metavar="N",
+        help="only list the N slowest imports of main.py (-X importtime)")
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        times = import_times("main")
+        slowest = sorted(times, key=lambda entry: entry[2], reverse=True)
+        for module, own, cumulative in slowest[:args.imports]:
+            print(f"{module:<40} {cumulative / 1000:>9.1f} ms "
+                  f"({own / 1000:.1f} ms own)")
+        return 0
+
+    results = run_suite(
+        size=args.size, mix=args.mix, seed=args.seed, repeat=args.repeat,
+        only=args.only, report=print_result)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\nvs {baseline['meta'].get('revision')}:")
+        for name, before, after, ratio in compare(baseline, results):
+            print(f"{name:<28} {before:>12,.0f} -> {after:>12,.0f} ns/op "
+                  f"({ratio:.2f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
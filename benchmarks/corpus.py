@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic member-name corpora for benchmarking the screening path.
+
+Corpora are generated from a seed, so the same arguments always produce the
+same names and results can be compared across commits.  Names are yielded
+lazily; a 10M-name corpus never has to be held in memory unless the caller
+asks for a list.
+"""
+import datetime
+import itertools
+import random
+import string
+
+
+NAME_CHARS = string.ascii_letters + string.digits + "_ ."
+CONFUSABLES = {  # Cyrillic look-alikes, and a fullwidth full stop
+    'a': '\u0430', 'c': '\u0441', 'e': '\u0435', 'i': '\u0456',
+    'o': '\u043e', 'p': '\u0440', 'h': '\u04bb', 'x': '\u0445',
+    'y': '\u0443', '.': '\uff0e',
+}
+ZERO_WIDTH = '\u200b\u200c\u200d\u2060\ufeff'
+CAMPAIGNS = (
+    "twitter.com/h0nde",
+    "twitter.com/h0nde_bot",
+    "discord.gg/freenitro",
+)
+# Campaigns no rule knows about, for the raid detector to find.
+RAID_STEMS = (
+    "steamgift.ru/promo",
+    "nitro drop ",
+    "free-robux.gg/",
+    "claim your gift @ ",
+)
+# Shares the campaign prefixes but never completes them; each one is a
+# prefilter hit that the rules must then reject.
+ADVERSARIAL_UNIT = "twitter.com/h0nd"
+
+MIXES = {
+    'benign': {'benign': 1.0},
+    'raid': {'benign': 0.7, 'campaign': 0.25, 'adversarial': 0.05},
+    'adversarial': {'adversarial': 1.0},
+}
+
+
+def benign_name(rng):
+    return "".join(rng.choices(NAME_CHARS, k=rng.randint(2, 32)))
+
+
+def disguise(name, rng):
+    """Swap in homoglyphs and scatter zero-width characters."""
+    chars = [
+        CONFUSABLES.get(char, char) if rng.random() < 0.3 else char
+        for char in name]
+    for _ in range(rng.randint(0, 2)):
+        chars.insert(rng.randrange(len(chars) + 1), rng.choice(ZERO_WIDTH))
+    return "".join(chars)
+
+
+def campaign_name(rng):
+    name = rng.choice(CAMPAIGNS)
+    if rng.random() < 0.5:
+        name = name.upper() if rng.random() < 0.5 else name.title()
+    if rng.random() < 0.5:
+        name = disguise(name, rng)
+    return name
+
+
+def adversarial_name(rng):
+    return ADVERSARIAL_UNIT * rng.randint(2, 60) + benign_name(rng)
+
+
+GENERATORS = {
+    'benign': benign_name,
+    'campaign': campaign_name,
+    'adversarial': adversarial_name,
+}
+
+
+def generate(size, mix='raid', seed=0):
+    """Yield `size` names drawn from the kinds in `mix` (a name in MIXES or
+    a {kind: weight} mapping)."""
+    if isinstance(mix, str):
+        mix = MIXES[mix]
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = list(itertools.accumulate(mix[kind] for kind in kinds))
+    for _ in range(size):
+        kind = rng.choices(kinds, cum_weights=weights)[0]
+        yield GENERATORS[kind](rng)
+
+
+def corpus(size, mix='raid', seed=0):
+    return list(generate(size, mix, seed))
+
+
+def join_stream(size, guild_count=4, rate=10000.0, raid_share=0.1,
+                burst=500, seed=0):
+    """Yield (seconds, guild id, name) for `size` joins arriving `rate` a
+    second.  `raid_share` of them are near-identical names from one of
+    RAID_STEMS, in bursts on one guild at a time that switch stem and guild
+    every `burst` joins; the rest are benign joins to any guild."""
+    rng = random.Random(seed)
+    stem = guild_id = None
+    for index in range(size):
+        if not index % burst:
+            stem = rng.choice(RAID_STEMS)
+            guild_id = rng.randrange(guild_count)
+        if rng.random() < raid_share:
+            name = f"{stem}{rng.randint(0, 99999)}"
+            if rng.random() < 0.3:
+                name = disguise(name, rng)
+            yield index / rate, guild_id, name
+        else:
+            yield index / rate, rng.randrange(guild_count), benign_name(rng)
+
+
+def accounts(size, now, raid_share=0.1, seed=0):
+    """Yield (snowflake id, joined_at, has avatar) for `size` members as of
+    `now` (epoch seconds).  Most accounts are years old, have an avatar and
+    joined long after they were made; `raid_share` of them were made in
+    bunches a few hours ago, without one, and joined minutes later."""
+    rng = random.Random(seed)
+    discord_epoch = 1420070400
+    raid_made = now - rng.uniform(3600, 86400)
+    for index in range(size):
+        if rng.random() < raid_share:
+            if not index % 50:
+                raid_made = now - rng.uniform(3600, 86400)
+            made = raid_made + rng.uniform(0, 300)
+            joined = made + rng.uniform(60, 1800)
+            avatar = False
+        else:
+            made = rng.uniform(discord_epoch, now - 86400)
+            joined = rng.uniform(made, now)
+            avatar = rng.random() < 0.8
+        member_id = (int((made - discord_epoch) * 1000) << 22) | (
+            index & 0x3fffff)
+        yield member_id, datetime.datetime.utcfromtimestamp(joined), avatar
+
+
+def repeated(names, distinct, seed=0):
+    """Draw len(names) names from the first `distinct`, the way a raid
+    repeats the same few names over and over."""
+    rng = random.Random(seed)
+    pool = names[:distinct]
+    return [rng.choice(pool) for _ in names]
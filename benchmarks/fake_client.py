@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+In-process stand-ins for the parts of discord.py the screening path uses.
+
+`FakeClient` has just enough of `discord.Client` for
+`CoreApplication.sweep`, its shutdown and the ban executor: guilds,
+`get_all_members`, `get_guild`, `close` and `Guild.fetch_members`;
+`FakeMember.ban` records the call and optionally sleeps to simulate the
+REST round trip.
+"""
+import asyncio
+import itertools
+
+
+class FakeGuild:
+
+    def __init__(self, guild_id, name=None):
+        self.id = guild_id
+        self.name = name or f"guild-{guild_id}"
+        self.members = []
+        self.bans = []
+
+    def get_member(self, member_id):
+        for member in self.members:
+            if member.id == member_id:
+                return member
+        return None
+
+    async def fetch_members(self, limit=None):
+        members = self.members if limit is None else self.members[:limit]
+        for member in members:
+            yield member
+
+
+class FakeMember:
+    __slots__ = ['id', 'name', 'nick', 'guild', 'latency', 'avatar',
+                 'joined_at']
+
+    def __init__(self, member_id, name, guild, nick=None, latency=0.0,
+                 avatar=None, joined_at=None):
+        # pylint: disable=too-many-arguments
+        self.id = member_id
+        self.name = name
+        self.nick = nick
+        self.guild = guild
+        self.latency = latency
+        self.avatar = avatar
+        self.joined_at = joined_at
+
+    @property
+    def display_name(self):
+        return self.nick or self.name
+
+    async def ban(self, reason=None, delete_message_days=1):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.guild.bans.append((self.id, reason, delete_message_days))
+
+
+class FakeClient:
+
+    def __init__(self, guilds=()):
+        self.guilds = list(guilds)
+        self.closed = False
+
+    @classmethod
+    def from_names(cls, names, guild_count=1, latency=0.0):
+        """Spread `names` round-robin over `guild_count` guilds."""
+        guilds = [
+            FakeGuild(guild_id) for guild_id in range(1, guild_count + 1)]
+        ids = itertools.count(1)
+        for name, guild in zip(names, itertools.cycle(guilds)):
+            guild.members.append(
+                FakeMember(next(ids), name, guild, latency=latency))
+        return cls(guilds)
+
+    def get_all_members(self):
+        for guild in self.guilds:
+            yield from guild.members
+
+    def get_guild(self, guild_id):
+        for guild in self.guilds:
+            if guild.id == guild_id:
+                return guild
+        return None
+
+    async def close(self):
+        self.closed = True
+
+    @property
+    def bans(self):
+        return [ban for guild in self.guilds for ban in guild.bans]
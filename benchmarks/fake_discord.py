@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for Discord's gateway and REST API.
+
+`FakeDiscord` is an aiohttp application discord.py can log in to.  Its REST
+side answers the few routes the daemon uses: login, the gateway URL, member
+pages for `stream_members`, and the ban and bulk-ban routes.  Both are rate
+limited per guild the way Discord does it, with `X-RateLimit-*` headers and
+429s carrying `retry_after`; a bulk ban takes one request's worth of the
+limit however many members it bans.  The gateway serves a guild snapshot
+(recorded or synthetic) as GUILD_CREATEs and member chunks, then, once
+`storm` is called, a storm of GUILD_MEMBER_ADDs.
+
+Every ban is timestamped, and so is every join sent, so the harness in
+`benchmarks.replay` can read off bans per second and event-to-ban latency.
+"""
+import asyncio
+import collections
+import csv
+import datetime
+import json
+import math
+import pathlib
+import random
+import threading
+import time
+
+from aiohttp import WSMsgType, web
+
+from benchmarks import corpus
+
+
+API_PATH = "/api/v7"
+DISCORD_EPOCH = 1420070400  # seconds
+BOT_ID = 1 << 22
+BAN_LIMIT = 50  # ban requests per guild ...
+BAN_PERIOD = 1.0  # ... per this many seconds
+CHUNK_SIZE = 1000  # members per GUILD_MEMBERS_CHUNK, as Discord sends them
+HEARTBEAT_INTERVAL = 41250  # ms
+SHARED_RETRY_AFTER = 0.5  # seconds, for 429s from `rate_limit_share`
+BULK_BAN_MAX = 200  # user ids per bulk-ban request
+
+
+def snowflake(seconds, sequence=0):
+    """A Discord id made at `seconds` (epoch)."""
+    return (int((seconds - DISCORD_EPOCH) * 1000) << 22) | (
+        sequence & 0x3fffff)
+
+
+def guild_snowflake(index):
+    """Guild ids that spread over shards the way real ones do."""
+    return (index + 1) << 22
+
+
+def json_response(data, status=200, headers=None):
+    """discord.py only parses a body whose content type is exactly
+    application/json, without the charset aiohttp would add."""
+    return web.Response(
+        body=json.dumps(data).encode('utf-8'), status=status,
+        headers=dict(headers or {}, **{'Content-Type': "application/json"}))
+
+
+def _timestamp(seconds):
+    return datetime.datetime.utcfromtimestamp(seconds).strftime(
+        "%Y-%m-%dT%H:%M:%S+00:00")
+
+
+class FakeMember:
+    """One member as the fake serves it."""
+    __slots__ = ['id', 'name', 'nick', 'avatar', 'joined_at']
+
+    def __init__(self, member_id, name, nick=None, avatar=None,
+                 joined_at=None):
+        self.id = member_id
+        self.name = name
+        self.nick = nick
+        self.avatar = avatar
+        self.joined_at = joined_at if joined_at is not None else time.time()
+
+    def payload(self, guild_id=None):
+        member = {
+            'user': {
+                'id': str(self.id), 'username': self.name,
+                'discriminator': f"{self.id % 10000:04d}",
+                'avatar': self.avatar},
+            'nick': self.nick, 'roles': [],
+            'joined_at': _timestamp(self.joined_at),
+            'deaf': False, 'mute': False}
+        if guild_id is not None:
+            member['guild_id'] = str(guild_id)
+        return member
+
+
+def synthetic_snapshot(size, guild_count=4, mix='raid', seed=0,
+                       largest_share=None):
+    """Guild id -> members for `size` corpus names, spread round-robin over
+    `guild_count` guilds, or with `largest_share` of them in the first."""
+    now = time.time()
+    guild_ids = [guild_snowflake(index) for index in range(guild_count)]
+    guilds = {guild_id: [] for guild_id in guild_ids}
+    rng = random.Random(seed)
+    accounts = corpus.accounts(size, now, seed=seed)
+    for index, (name, (member_id, joined_at, avatar)) in enumerate(
+            zip(corpus.generate(size, mix, seed), accounts)):
+        if largest_share is not None and guild_count > 1:
+            guild_id = guild_ids[0] if rng.random() < largest_share else (
+                guild_ids[1 + index % (guild_count - 1)])
+        else:
+            guild_id = guild_ids[index % guild_count]
+        guilds[guild_id].append(FakeMember(
+            member_id, name, avatar=f"{member_id:x}" if avatar else None,
+            joined_at=joined_at.replace(
+                tzinfo=datetime.timezone.utc).timestamp()))
+    return guilds
+
+
+def load_snapshot(path):
+    """Guild id -> members from a member export (the CSV or JSON Lines the
+    offline screen reads: `id` and `name`, `nick` and `guild` optional)."""
+    path = pathlib.Path(path)
+    with open(path, 'r', encoding='utf-8', newline='') as export:
+        if path.suffix.lower() == '.csv':
+            rows = list(csv.DictReader(export))
+        else:
+            rows = [json.loads(line) for line in export if line.strip()]
+    now = time.time()
+    guilds = collections.defaultdict(list)
+    for sequence, row in enumerate(rows):
+        guild_id = int(row.get('guild') or guild_snowflake(0))
+        member_id = int(row.get('id') or snowflake(now, sequence))
+        guilds[guild_id].append(FakeMember(
+            member_id, row['name'], row.get('nick') or None))
+    return dict(guilds)
+
+
+def synthetic_joins(size, guild_ids, rate=1000.0, mix='raid', seed=0):
+    """(seconds from the start of the storm, guild id, member) for `size`
+    joins of corpus names arriving `rate` a second, spread at random over
+    `guild_ids`, all by accounts made in the last day."""
+    now = time.time()
+    rng = random.Random(seed)
+    names = corpus.generate(size, mix, seed + 1)
+    for sequence, name in enumerate(names):
+        offset = sequence / rate
+        made = now - rng.uniform(600, 86400)
+        yield offset, rng.choice(guild_ids), FakeMember(
+            snowflake(made, sequence), name, joined_at=now + offset)
+
+
+def load_joins(path):
+    """Joins recorded as JSON Lines: `t` (seconds from the start of the
+    storm), `guild`, `name`, and optionally `id` and `nick`."""
+    now = time.time()
+    with open(path, 'r', encoding='utf-8') as recorded:
+        for sequence, line in enumerate(recorded):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            offset = float(row.get('t', 0.0))
+            yield offset, int(row['guild']), FakeMember(
+                int(row.get('id') or snowflake(now, sequence)), row['name'],
+                row.get('nick') or None, joined_at=now + offset)
+
+
+class GuildBucket:
+    """Fixed-window ban limit for one guild, as Discord reports it."""
+    __slots__ = ['limit', 'period', 'reset', 'remaining']
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.reset = 0.0
+        self.remaining = limit
+
+    def take(self, now):
+        """Returns (allowed, remaining, seconds until the window resets)."""
+        if now >= self.reset:
+            self.reset = now + self.period
+            self.remaining = self.limit
+        if self.remaining <= 0:
+            return False, 0, self.reset - now
+        self.remaining -= 1
+        return True, self.remaining, self.reset - now
+
+
+class FakeDiscord:
+    """The fake API and gateway, serving `guilds` (guild id -> members)."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, guilds, token=None, ban_limit=BAN_LIMIT,
+                 ban_period=BAN_PERIOD, rate_limit_share=0.0, latency=0.0,
+                 chunk_size=CHUNK_SIZE, bulk_ban=True, seed=0):
+        # pylint: disable=too-many-arguments
+        self.guilds = {
+            guild_id: {member.id: member for member in members}
+            for guild_id, members in guilds.items()}
+        self.ban_limit = ban_limit
+        self.ban_period = ban_period
+        # 429s the headers gave no warning of, as shared limits cause
+        self.rate_limit_share = rate_limit_share
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.bulk_ban = bulk_ban  # False answers the bulk-ban route 404
+        self.token = token
+        self.buckets = {}
+        self.sessions = []
+        self.identified = threading.Event()
+        self.identifies = collections.Counter()  # shard id -> logins
+        self.requests = collections.Counter()
+        self.rate_limited = 0
+        self.bans = []  # (monotonic time, guild id, member id)
+        self.banned = set()
+        self.joins_sent = {}  # (guild id, member id) -> monotonic time
+        self.join_latencies = []
+        self.url = None
+        self._runner = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def api_base(self):
+        return f"{self.url}{API_PATH}"
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get(f"{API_PATH}/users/@me", self.get_me),
+            web.get(f"{API_PATH}/gateway", self.get_gateway),
+            web.get(f"{API_PATH}/gateway/bot", self.get_gateway),
+            web.get(
+                f"{API_PATH}/guilds/{{guild_id}}/members", self.get_members),
+            web.put(
+                f"{API_PATH}/guilds/{{guild_id}}/bans/{{member_id}}",
+                self.put_ban),
+            web.post(
+                f"{API_PATH}/guilds/{{guild_id}}/bulk-ban",
+                self.post_bulk_ban),
+            web.get("/gateway", self.gateway),
+        ])
+        return app
+
+    # REST
+
+    async def _respond(self, request, route):
+        """Count the request, simulate the round trip and check the token
+        (any will do unless `token` is set)."""
+        self.requests[route] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        token = request.headers.get('Authorization', '').partition(' ')[2]
+        if not token or self.token is not None and token != self.token:
+            raise web.HTTPUnauthorized()
+
+    async def get_me(self, request):
+        await self._respond(request, 'users/@me')
+        return json_response({
+            'id': str(BOT_ID), 'username': "ban-h0nde",
+            'discriminator': "0001", 'avatar': None, 'bot': True,
+            'verified': True, 'mfa_enabled': False, 'flags': 0})
+
+    async def get_gateway(self, request):
+        await self._respond(request, 'gateway')
+        return json_response({
+            'url': f"{self.url.replace('http', 'ws', 1)}/gateway",
+            'shards': 1, 'session_start_limit': {
+                'total': 1000, 'remaining': 1000, 'reset_after': 0,
+                'max_concurrency': 1}})
+
+    async def get_members(self, request):
+        await self._respond(request, 'members')
+        members = self.guilds.get(int(request.match_info['guild_id']))
+        if members is None:
+            raise web.HTTPNotFound()
+        limit = min(int(request.query.get('limit', 1)), 1000)
+        after = int(request.query.get('after', 0))
+        page = sorted(
+            member_id for member_id in members if member_id > after)[:limit]
+        return json_response([
+            members[member_id].payload() for member_id in page])
+
+    def take(self, guild_id):
+        """Take one ban from `guild_id`'s limit; returns the headers to
+        send, and the seconds to retry after if it was exhausted."""
+        try:
+            bucket = self.buckets[guild_id]
+        except KeyError:
+            bucket = self.buckets[guild_id] = GuildBucket(
+                self.ban_limit, self.ban_period)
+        now = time.time()
+        allowed, remaining, reset_after = bucket.take(now)
+        headers = {
+            'Via': "1.1 google",
+            'X-RateLimit-Bucket': f"bans-{guild_id}",
+            'X-RateLimit-Limit': str(bucket.limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': f"{now + reset_after:.3f}",
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+        }
+        return headers, None if allowed else reset_after
+
+    def rate_limited_response(self, request, headers, retry_after):
+        """A 429; discord.py asks for `retry_after` in milliseconds."""
+        self.rate_limited += 1
+        headers['Retry-After'] = str(math.ceil(retry_after))
+        if request.headers.get('X-Ratelimit-Precision') == 'millisecond':
+            retry_after *= 1000
+        return json_response({
+            'message': "You are being rate limited.",
+            'retry_after': retry_after, 'global': False},
+            status=429, headers=headers)
+
+    async def put_ban(self, request):
+        await self._respond(request, 'ban')
+        guild_id = int(request.match_info['guild_id'])
+        member_id = int(request.match_info['member_id'])
+        if guild_id not in self.guilds:
+            raise web.HTTPNotFound()
+        headers, retry_after = self.take(guild_id)
+        if retry_after is None and self.rng.random() < self.rate_limit_share:
+            headers['X-RateLimit-Scope'] = "shared"
+            retry_after = SHARED_RETRY_AFTER
+        if retry_after is not None:
+            return self.rate_limited_response(request, headers, retry_after)
+        self.record_ban(guild_id, member_id)
+        return web.Response(status=204, headers=headers)
+
+    async def post_bulk_ban(self, request):
+        await self._respond(request, 'bulk-ban')
+        guild_id = int(request.match_info['guild_id'])
+        if not self.bulk_ban or guild_id not in self.guilds:
+            raise web.HTTPNotFound()
+        user_ids = (await request.json()).get('user_ids') or []
+        if len(user_ids) > BULK_BAN_MAX:
+            return json_response({
+                'message': "Invalid Form Body", 'code': 50035}, status=400)
+        headers, retry_after = self.take(guild_id)
+        if retry_after is not None:
+            return self.rate_limited_response(request, headers, retry_after)
+        members = self.guilds[guild_id]
+        banned, failed = [], []
+        for user_id in user_ids:
+            if int(user_id) in members:
+                self.record_ban(guild_id, int(user_id))
+                banned.append(user_id)
+            else:
+                failed.append(user_id)
+        if not banned:
+            return json_response({
+                'message': "Failed to ban users", 'code': 500000},
+                status=400, headers=headers)
+        return json_response(
+            {'banned_users': banned, 'failed_users': failed}, headers=headers)
+
+    def record_ban(self, guild_id, member_id):
+        key = (guild_id, member_id)
+        if key in self.banned:
+            return
+        now = time.monotonic()
+        self.banned.add(key)
+        self.bans.append((now, guild_id, member_id))
+        sent = self.joins_sent.get(key)
+        if sent is not None:
+            self.join_latencies.append(now - sent)
+        self.guilds[guild_id].pop(member_id, None)
+
+    # Gateway
+
+    async def gateway(self, request):
+        socket = web.WebSocketResponse(max_msg_size=0)
+        await socket.prepare(request)
+        session = {'socket': socket, 'sequence': 0, 'shard': (0, 1)}
+        await socket.send_json({
+            'op': 10, 'd': {'heartbeat_interval': HEARTBEAT_INTERVAL},
+            's': None, 't': None})
+        async for message in socket:
+            if message.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(message.data)
+            op = payload.get('op')
+            if op == 1:
+                await socket.send_json({'op': 11, 'd': None})
+            elif op == 2:
+                await self.identify(session, payload['d'])
+            elif op == 8:
+                await self.send_chunks(session, payload['d'])
+        if session in self.sessions:
+            self.sessions.remove(session)
+        return socket
+
+    async def dispatch(self, session, event, data):
+        session['sequence'] += 1
+        await session['socket'].send_json({
+            'op': 0, 't': event, 's': session['sequence'], 'd': data})
+
+    def session_guilds(self, session):
+        shard_id, shard_count = session['shard']
+        return [
+            guild_id for guild_id in self.guilds
+            if (guild_id >> 22) % shard_count == shard_id]
+
+    async def identify(self, session, data):
+        session['shard'] = tuple(data.get('shard') or (0, 1))
+        guild_ids = self.session_guilds(session)
+        await self.dispatch(session, 'READY', {
+            'v': 6, 'session_id': f"fake-{len(self.sessions)}",
+            'user': {
+                'id': str(BOT_ID), 'username': "ban-h0nde",
+                'discriminator': "0001", 'avatar': None, 'bot': True},
+            'guilds': [
+                {'id': str(guild_id), 'unavailable': True}
+                for guild_id in guild_ids],
+            'private_channels': [], 'relationships': []})
+        for guild_id in guild_ids:
+            await self.dispatch(session, 'GUILD_CREATE', {
+                'id': str(guild_id), 'name': f"guild-{guild_id >> 22}",
+                'owner_id': str(BOT_ID), 'unavailable': False, 'large': True,
+                'member_count': len(self.guilds[guild_id]), 'members': [],
+                'channels': [], 'roles': [{
+                    'id': str(guild_id), 'name': "@everyone",
+                    'permissions': "0", 'position': 0, 'color': 0,
+                    'hoist': False, 'managed': False, 'mentionable': False}],
+                'emojis': [], 'features': [], 'presences': [],
+                'voice_states': []})
+        # A shard that logs in again (its process restarted) replaces the
+        # session it had, whose socket may not have been seen to close yet.
+        self.sessions = [
+            other for other in self.sessions
+            if other['shard'] != session['shard']]
+        self.sessions.append(session)
+        self.identifies[session['shard'][0]] += 1
+        self.identified.set()
+
+    async def send_chunks(self, session, data):
+        self.requests['chunk'] += 1
+        guild_id = int(data['guild_id'])
+        members = list(self.guilds.get(guild_id, {}).values())
+        chunks = [
+            members[start:start + self.chunk_size]
+            for start in range(0, len(members), self.chunk_size)] or [[]]
+        for index, chunk in enumerate(chunks):
+            await self.dispatch(session, 'GUILD_MEMBERS_CHUNK', {
+                'guild_id': str(guild_id), 'chunk_index': index,
+                'chunk_count': len(chunks), 'nonce': data.get('nonce'),
+                'members': [member.payload() for member in chunk]})
+
+    async def storm(self, joins):
+        """Send `joins` ((seconds from now, guild id, member), in order) as
+        GUILD_MEMBER_ADDs to whichever session has the guild."""
+        started = time.monotonic()
+        for offset, guild_id, member in joins:
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.guilds.setdefault(guild_id, {})[member.id] = member
+            for session in self.sessions:
+                if session['socket'].closed:
+                    continue
+                if guild_id in self.session_guilds(session):
+                    self.joins_sent[(guild_id, member.id)] = time.monotonic()
+                    await self.dispatch(
+                        session, 'GUILD_MEMBER_ADD', member.payload(guild_id))
+                    break
+
+    # Running in the background
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve from a thread of its own; returns the base URL."""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(self.app())
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, host, port)
+            self._loop.run_until_complete(site.start())
+            bound_host, bound_port = site._server.sockets[0].getsockname()[:2]
+            self.url = f"http://{bound_host}:{bound_port}"
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(
+            target=serve, name="fake-discord", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def call(self, coroutine):
+        """Run `coroutine` on the server's loop, from another thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end replay of the daemon against `benchmarks.fake_discord`.
+
+python -m benchmarks.replay [--members N] [--guilds N] [--joins N]
+                            [--snapshot export.csv] [--joins-file joins.jsonl]
+                            [--settings settings.json] [--output out.json]
+                            [--compare baseline.json] [--kill-shard S]
+
+The real `CoreApplication.run_client` logs in to the fake, sweeps the
+snapshot and screens the join storm; with `shard_processes` above one in
+the settings, `CoreApplication.main` runs it under the shard supervisor, one
+process per shard range, and `--kill-shard` kills the first of them that
+many seconds after login to see it restarted.  Once every member the rules
+match has been banned, or `--timeout` has passed, it is stopped the way
+`main.py stop` stops it.  Reports bans per second over the sweep and
+join-to-ban latency; with `--compare`, exits 1 if either regressed past
+`--tolerance`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.corpus import MIXES
+from benchmarks.fake_discord import (
+    BAN_LIMIT, BAN_PERIOD, FakeDiscord, load_joins, load_snapshot,
+    synthetic_joins, synthetic_snapshot)
+from common.log_shim import QuietLogManager
+
+
+STORM_DELAY = 3.0  # seconds after login; discord.py waits 2s for guilds
+TIMEOUT = 300.0
+TOLERANCE = 0.2
+# (metric, whether higher is better) checked by --compare
+REGRESSIONS = (
+    ('bans_per_sec', True),
+    ('join_latency_ms.p50', False),
+    ('join_latency_ms.p95', False),
+)
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Nearest-rank percentiles of `samples`, plus the max."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    result = {
+        f"p{point}": ordered[round(point / 100 * last)] for point in points}
+    result['max'] = ordered[-1]
+    return result
+
+
+def expected_bans(app, guilds, joins):
+    """The (guild id, member id) of every member the app's rules match."""
+    def matches(member):
+        return app.screen_name(member.name) is not None or bool(
+            member.nick and app.screen_name(member.nick) is not None)
+    expected = {
+        (guild_id, member.id) for guild_id, members in guilds.items()
+        for member in members if matches(member)}
+    storm = {
+        (guild_id, member.id) for _, guild_id, member in joins
+        if matches(member)}
+    return expected, storm
+
+
+def replay(guilds, joins=(), settings=None, storm_delay=STORM_DELAY,
+           timeout=TIMEOUT, log_manager_class=QuietLogManager,
+           kill_shard=None, **fake_options):
+    """Run the daemon against a FakeDiscord serving `guilds` (guild id ->
+    members) and, `storm_delay` seconds after it logs in, `joins`; returns
+    a dict of what it measured.  `settings` are the daemon's; bans are
+    paced by what the fake's rate limit headers say.  With shard
+    processes, `kill_shard` is the seconds after login to kill the first
+    one."""
+    # pylint: disable=too-many-arguments,too-many-locals
+    from watcher.core_app import CoreApplication
+    joins = list(joins)
+    fake = FakeDiscord(guilds, **fake_options)
+    fake.start()
+    scratch = tempfile.mkdtemp(prefix="ban_h0nde-replay-")
+    settings = dict({'audit': False}, **(settings or {}))
+    settings.update(
+        api_base=fake.api_base, token=settings.get('token') or "replay")
+    with open(os.path.join(scratch, "settings.json"), "w") as settings_file:
+        json.dump(settings, settings_file)
+
+    class ReplayApplication(CoreApplication):
+        _sys_path = scratch
+        log_mgr_class = log_manager_class
+
+    app = ReplayApplication()
+    app.load_config()
+    swept, stormed = expected_bans(app, guilds, joins)
+    expected = swept | stormed
+    started = time.monotonic()
+    finished = threading.Event()  # the client stopped, one way or another
+
+    def supervise():
+        deadline = started + timeout
+        try:
+            while not fake.identified.wait(0.1):
+                if finished.is_set() or time.monotonic() > deadline:
+                    return
+            if kill_shard is not None and app.supervisor is not None:
+                time.sleep(kill_shard)
+                os.kill(app.supervisor.shards[0].process.pid, signal.SIGKILL)
+                time.sleep(max(0.0, storm_delay - kill_shard))
+            else:
+                time.sleep(storm_delay)
+            storm = fake.call(fake.storm(joins))
+            while time.monotonic() < deadline and not finished.is_set():
+                if storm.done() and expected <= fake.banned:
+                    break
+                time.sleep(0.1)
+        finally:
+            app.request_stop()
+
+    supervisor = threading.Thread(target=supervise, name="replay")
+    supervisor.start()
+    # discord.py closes the loop it ran on; give each replay a fresh one.
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    try:
+        if app.config.get('shard_processes', 1) > 1:
+            app.isrunning = True
+            app.main()
+        else:
+            app.run_client(shard_count=app.config.get('shard_count'))
+    finally:
+        finished.set()
+        supervisor.join()
+        fake.stop()
+    elapsed = time.monotonic() - started
+    executor = app.executor
+
+    sweep_times = [
+        when for when, guild_id, member_id in fake.bans
+        if (guild_id, member_id) in swept]
+    sweep_seconds = (
+        max(sweep_times) - min(sweep_times) if len(sweep_times) > 1 else 0.0)
+    return {
+        'members': sum(len(members) for members in guilds.values()),
+        'guilds': len(guilds),
+        'joins': len(joins),
+        'expected': len(expected),
+        'banned': len(expected & fake.banned),
+        'bans': len(fake.bans),
+        'requests': dict(fake.requests),
+        'rate_limited': fake.rate_limited,
+        # 429s the executor saw and retried, and the pace it learned, per
+        # guild (by this process)
+        'retried': executor.stats['rate_limited'] if executor else 0,
+        'ban_rates': {
+            str(guild_id): bucket.rate
+            for guild_id, bucket in sorted(executor.buckets.items())
+        } if executor else {},
+        # by this process: shard processes keep their own counts
+        'screened': sum(app.metrics.screened.values.values()),
+        'logins': {
+            str(shard_id): count
+            for shard_id, count in sorted(fake.identifies.items())},
+        'elapsed': elapsed,
+        'sweep_bans': len(sweep_times),
+        'sweep_seconds': sweep_seconds,
+        'bans_per_sec': (
+            len(sweep_times) / sweep_seconds if sweep_seconds else 0.0),
+        'join_latency_ms': {
+            name: value * 1000
+            for name, value in percentiles(fake.join_latencies).items()},
+    }
+
+
+def metric(result, name):
+    for key in name.split("."):
+        result = (result or {}).get(key)
+    return result
+
+
+def compare(baseline, current, tolerance=TOLERANCE):
+    """Yield (metric, baseline, current, regressed) for the metrics in
+    REGRESSIONS that both results have."""
+    for name, higher_is_better in REGRESSIONS:
+        before, after = metric(baseline, name), metric(current, name)
+        if not before or after is None:
+            continue
+        ratio = after / before
+        regressed = (
+            ratio < 1 - tolerance if higher_is_better
+            else ratio > 1 + tolerance)
+        yield name, before, after, regressed
+
+
+def describe(result):
+    latency = result['join_latency_ms']
+    lines = [
+        f"Replayed {result['members']:,} member(s) in {result['guilds']} "
+        f"guild(s) and {result['joins']:,} join(s) in "
+        f"{result['elapsed']:.1f}s",
+        f"Banned {result['banned']:,} of {result['expected']:,} expected "
+        f"({result['bans']:,} bans, {result['requests'].get('ban', 0):,} "
+        f"ban and {result['requests'].get('bulk-ban', 0):,} bulk-ban "
+        f"requests, {result['rate_limited']:,} rate limited)",
+        f"Sweep: {result['sweep_bans']:,} bans in "
+        f"{result['sweep_seconds']:.2f}s ({result['bans_per_sec']:,.0f}/s)"]
+    if latency:
+        lines.append(
+            "Join to ban: " + ", ".join(
+                f"{name} {value:,.1f}ms" for name, value in latency.items()))
+    logins = result.get('logins') or {}
+    if len(logins) > 1 or any(count > 1 for count in logins.values()):
+        lines.append(
+            "Shard logins: " + ", ".join(
+                f"{shard_id}: {count}" for shard_id, count in logins.items()))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replay")
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--guilds", type=int, default=4)
+    parser.add_argument(
+        "--largest-share", type=float,
+        help="share of the members in the first guild (default: even)")
+    parser.add_argument("--mix", choices=sorted(MIXES), default='raid')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--joins", type=int, default=1000)
+    parser.add_argument("--join-rate", type=float, default=500.0)
+    parser.add_argument(
+        "--snapshot", help="member export (CSV or JSON Lines) to serve")
+    parser.add_argument(
+        "--joins-file", help="JSON Lines of joins to send ({t, guild, name})")
+    parser.add_argument("--ban-limit", type=int, default=BAN_LIMIT)
+    parser.add_argument("--ban-period", type=float, default=BAN_PERIOD)
+    parser.add_argument(
+        "--rate-limit-share", type=float, default=0.0,
+        help="share of ban requests answered 429 without warning")
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="seconds added to every REST round trip")
+    parser.add_argument(
+        "--no-bulk-ban", action="store_true",
+        help="answer the bulk-ban route 404, as if it were unsupported")
+    parser.add_argument("--settings", help="daemon settings.json to apply")
+    parser.add_argument("--storm-delay", type=float, default=STORM_DELAY)
+    parser.add_argument(
+        "--kill-shard", type=float,
+        help="seconds after login to kill the first shard process")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--verbose", action="store_true", help="echo the daemon's log")
+    args = parser.parse_args(argv)
+
+    if args.snapshot:
+        guilds = load_snapshot(args.snapshot)
+    else:
+        guilds = synthetic_snapshot(
+            args.members, args.guilds, args.mix, args.seed,
+            args.largest_share)
+    if args.joins_file:
+        joins = load_joins(args.joins_file)
+    else:
+        joins = synthetic_joins(
+            args.joins, sorted(guilds), args.join_rate, args.mix, args.seed)
+    settings = None
+    if args.settings:
+        with open(args.settings, "r") as settings_file:
+            settings = json.load(settings_file)
+    log_manager_class = QuietLogManager
+    if args.verbose:
+        from common.posix_daemon import EchoLogManager
+        log_manager_class = EchoLogManager
+
+    result = replay(
+        guilds, joins, settings, storm_delay=args.storm_delay,
+        timeout=args.timeout, log_manager_class=log_manager_class,
+        kill_shard=args.kill_shard, ban_limit=args.ban_limit,
+        ban_period=args.ban_period,
+        rate_limit_share=args.rate_limit_share, latency=args.latency,
+        bulk_ban=not args.no_bulk_ban, seed=args.seed)
+    for line in describe(result):
+        print(line)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+    status = 0
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\nvs {args.compare}:")
+        for name, before, after, regressed in compare(
+                baseline, result, args.tolerance):
+            print(f"{name:<24} {before:>12,.1f} -> {after:>12,.1f}"
+                  f"{'  REGRESSED' if regressed else ''}")
+            status = status or int(regressed)
+    if result['banned'] < result['expected']:
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the screening hot path.
+
+Each benchmark is a setup function registered with `@benchmark`; it takes a
+`BenchContext` and returns `(run, ops)`, where `run()` performs `ops`
+operations.  `run_suite` times every `run` a few times over and reports
+nanoseconds per operation, in the same shape `compare` reads back, so a
+results file from one commit can be diffed against another.
+"""
+import asyncio
+import io
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common.log_shim import QuietLogManager
+
+from benchmarks import corpus
+from benchmarks.fake_client import FakeClient
+
+
+BENCHMARKS = {}
+# The pattern the matcher replaced, kept as a baseline.
+BAD_NAME = re.compile(
+    r'.*([Tt][Ww][Ii][Tt]{2}[Ee][Rr]\.[Cc][Oo][Mm])(\/)[Hh]0[Nn][Dd][Ee].*')
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (.+)$")
+
+
+class BenchContext:
+    """Corpora shared by every benchmark in a run, built on first use."""
+
+    def __init__(self, size, mix='raid', seed=0):
+        self.size = size
+        self.mix = mix
+        self.seed = seed
+        self.scratch = tempfile.mkdtemp(prefix="ban_h0nde-bench-")
+        self._names = None
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = corpus.corpus(self.size, self.mix, self.seed)
+        return self._names
+
+    def app(self, **config):
+        from watcher.core_app import CoreApplication
+
+        class BenchApplication(CoreApplication):
+            log_mgr_class = QuietLogManager
+
+        app = BenchApplication()
+        # No settings.json here, so the default rules apply.
+        app.settings_conf = os.path.join(self.scratch, "settings.json")
+        app.load_config()
+        app.config = dict(app.config, **config)
+        return app
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark("match.bad_name_regex")
+def bench_bad_name(ctx):
+    names = ctx.names
+    match = BAD_NAME.match
+
+    def run():
+        for name in names:
+            match(name)
+    return run, len(names)
+
+
+@benchmark("match.name_matcher")
+def bench_matcher(ctx):
+    from watcher.matcher import NameMatcher
+    names = ctx.names
+    match = NameMatcher().match
+
+    def run():
+        for name in names:
+            match(name)
+    return run, len(names)
+
+
+@benchmark("match.screen_name")
+def bench_screen_name(ctx):
+    names = ctx.names
+    screen_name = ctx.app().screen_name
+
+    def run():
+        for name in names:
+            screen_name(name)
+    return run, len(names)
+
+
+@benchmark("normalize.slugify")
+def bench_slugify(ctx):
+    from common.assist import slugify
+    names = ctx.names
+
+    def run():
+        for name in names:
+            slugify(name)
+    return run, len(names)
+
+
+@benchmark("normalize.fold_uncached")
+def bench_fold(ctx):
+    from watcher.normalize import fold_name
+    names = ctx.names
+
+    def run():
+        for name in names:
+            fold_name(name)
+    return run, len(names)
+
+
+@benchmark("normalize.cached_raid")
+def bench_cached_raid(ctx):
+    from watcher.normalize import NameNormalizer
+    names = corpus.repeated(ctx.names, 50, ctx.seed)
+
+    def run():
+        normalize = NameNormalizer()
+        for name in names:
+            normalize(name)
+    return run, len(names)
+
+
+@benchmark("raid.replay")
+def bench_raid_replay(ctx):
+    """Joins, folded and fed to the raid detector, as `on_member_join`
+    does; 10,000 joins/s needs 100,000 ns/op or less."""
+    from watcher.normalize import NameNormalizer
+    from watcher.raid import RaidDetector
+    joins = list(corpus.join_stream(ctx.size, seed=ctx.seed))
+
+    def run():
+        detector = RaidDetector()
+        normalize = NameNormalizer()
+        observe = detector.observe
+        for now, guild_id, name in joins:
+            observe(guild_id, normalize(name), now)
+    return run, len(joins)
+
+
+@benchmark("scoring.batch")
+def bench_scoring(ctx):
+    """Account-metadata scoring of the whole corpus in the daemon's batch
+    size, with NumPy if it is installed."""
+    from benchmarks.fake_client import FakeGuild, FakeMember
+    from watcher.scoring import MemberScorer
+    names = ctx.names
+    guild = FakeGuild(1)
+    members = [
+        FakeMember(
+            member_id, name, guild, avatar="a" if avatar else None,
+            joined_at=joined_at)
+        for name, (member_id, joined_at, avatar) in zip(
+            names, corpus.accounts(len(names), time.time(), seed=ctx.seed))]
+    scorer = MemberScorer()
+
+    def run():
+        size = scorer.batch_size
+        for start in range(0, len(members), size):
+            scorer.score(members[start:start + size])
+    return run, len(members)
+
+
+@benchmark("fargable.new_delorean")
+def bench_new_delorean(ctx):
+    from common.flux import NewDelorean
+    ops = max(1, ctx.size // 100)
+
+    def run():
+        for _ in range(ops):
+            NewDelorean()
+    return run, ops
+
+
+@benchmark("fargable.smtp_client")
+def bench_smtp_client(ctx):
+    """Argument resolution for an SMTPClient; the connection it would open
+    is stubbed out."""
+    from unittest import mock
+    from common.mail_relay import SMTPClient
+    ops = max(1, ctx.size // 100)
+
+    def run():
+        with mock.patch(
+                "common.mail_relay.smtplib.SMTP", new=lambda *args: None):
+            for _ in range(ops):
+                SMTPClient(
+                    ["ops@example.com"], "subject", "body",
+                    host="localhost", port=25, sender="bot@example.com")
+    return run, ops
+
+
+@benchmark("flux.likely_tz")
+def bench_likely_tz(ctx):
+    """Offset-to-zone lookups, across every quarter-hour offset in use."""
+    from common.flux import likely_tz
+    offsets = [quarter / 4 for quarter in range(-48, 57)]
+    likely_tz(0)  # the index is built once per process, not per lookup
+    ops = max(len(offsets), ctx.size // 100)
+
+    def run():
+        for index in range(ops):
+            likely_tz(offsets[index % len(offsets)])
+    return run, ops
+
+
+@benchmark("log.delorean_timestamp")
+def bench_delorean_timestamp(ctx):
+    """What EchoLogManager used to pay per line just for its timestamp."""
+    from common.constants import ERRTS
+    from common.flux import NewDelorean
+    ops = max(1, ctx.size // 100)
+
+    def run():
+        for _ in range(ops):
+            NewDelorean().format_datetime(ERRTS)
+    return run, ops
+
+
+@benchmark("log.echo_info")
+def bench_echo_log(ctx):
+    """Caller-side cost of logging a ban; the listener thread formats and
+    writes the line."""
+    from common.posix_daemon import EchoLogManager
+
+    class BenchLogManager(EchoLogManager):
+        echo_stream = io.StringIO()
+
+    log_manager = BenchLogManager()
+    ops = max(1, ctx.size // 10)
+
+    def run():
+        for index in range(ops):
+            log_manager.LogInfoMsg("Banned %s! (rule: %s)", (
+                index, "twitter-h0nde"))
+    return run, ops
+
+
+@benchmark("dispatch.executor")
+def bench_executor(ctx):
+    from watcher.executor import BanExecutor
+    names = ctx.names
+    ops = len(names)
+
+    def run():
+        client = FakeClient.from_names(names, guild_count=4)
+        executor = BanExecutor(
+            QuietLogManager(), rate=1e9, burst=1e9, progress_every=0)
+
+        async def dispatch():
+            executor.start()
+            for member in client.get_all_members():
+                executor.submit(member, "bench")
+            await executor.join()
+            await executor.close()
+        asyncio.run(dispatch())
+    return run, ops
+
+
+@benchmark("dispatch.sweep")
+def bench_sweep(ctx):
+    from watcher.executor import BanExecutor
+    names = ctx.names
+    client = FakeClient.from_names(names, guild_count=4)
+
+    def run():
+        app = ctx.app(state_db=os.path.join(
+            ctx.scratch, f"state-{time.perf_counter_ns()}.sqlite3"))
+        app.executor = BanExecutor(
+            app.log_manager, rate=1e9, burst=1e9, progress_every=0)
+        app.open_state()
+
+        async def sweep():
+            app.executor.start()
+            await app.sweep(client)
+            await app.executor.join()
+            await app.executor.close()
+        asyncio.run(sweep())
+        app.state.close()
+    return run, len(names)
+
+
+@benchmark("startup.import_main")
+def bench_import_main(ctx):  # pylint: disable=unused-argument
+    """A fresh interpreter importing the daemon, as every invocation does."""
+    def run():
+        import_times("main")
+    return run, 1
+
+
+@benchmark("startup.status")
+def bench_status(ctx):  # pylint: disable=unused-argument
+    """`main.py status` end to end (nothing is running, so it is a pid file
+    miss, as with `stop`)."""
+    def run():
+        subprocess.run(
+            [sys.executable, "main.py", "status"], cwd=REPO_DIR,
+            capture_output=True, check=False)
+    return run, 1
+
+
+def import_times(module):
+    """Import `module` in a fresh interpreter under `-X importtime`; return
+    (module, self us, cumulative us) for every module it loaded, in the
+    order they finished loading."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True).stderr
+    times = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            times.append((
+                match.group(3).strip(), int(match.group(1)),
+                int(match.group(2))))
+    return times
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def time_benchmark(run, ops, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    per_op = [timing / ops * 1e9 for timing in timings]
+    return {
+        'ops': ops,
+        'runs_s': timings,
+        'ns_per_op': statistics.median(per_op),
+        'ns_per_op_min': min(per_op),
+        'ns_per_op_stdev': statistics.stdev(per_op) if repeat > 1 else 0.0,
+        'ops_per_sec': ops / statistics.median(timings),
+    }
+
+
+def run_suite(size=100000, mix='raid', seed=0, repeat=5, only=None,
+              report=None):
+    ctx = BenchContext(size, mix, seed)
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if only and not any(term in name for term in only):
+            continue
+        run, ops = setup(ctx)
+        results[name] = time_benchmark(run, ops, repeat)
+        if report is not None:
+            report(name, results[name])
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'size': size,
+            'mix': mix,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(baseline, current):
+    """Yield (name, baseline ns/op, current ns/op, ratio) for benchmarks in
+    both result sets; a ratio below 1 means `current` is faster."""
+    for name, result in current['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            continue
+        ratio = result['ns_per_op'] / before['ns_per_op']
+        yield name, before['ns_per_op'], result['ns_per_op'], ratio
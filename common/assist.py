@@ -5,12 +5,14 @@ import functools
 import json
 import logging
 import re
-import unidecode
 from frozendict import frozendict
 from common.constants import UUID_REGEX_EXPR
 from common.exceptions import force_text
+from common.lazy import lazy_import
 
 
+unidecode = lazy_import('unidecode')
+
 DIT_GRP = re.compile(r'^(\.?[\w\.]+?)\.(\w+?)$')
 UUID_RE = re.compile(UUID_REGEX_EXPR)
 
@@ -573,6 +575,18 @@ def slugify(text, trim_trailing=False):
     return result
 
 
+def fold_text(text):
+    '''
+    convert unicode text ("ｔｗіｔｔｅｒ．ｃｏｍ")
+    to lowercase ascii, keeping punctuation ("twitter.com")
+    '''
+    if not isinstance(text, str):
+        text = str(text)
+    if not text.isascii():
+        text = unidecode.unidecode(text)
+    return text.lower()
+
+
 def slugify_csv(csv_text, trim_trailing=False):
     '''
     convert comma-sep unicode text ("XQUR%%&_egU, uětn991")
@@ -0,0 +1,118 @@
+"""
+Local control socket.
+
+A daemon serves a Unix-domain socket; a client connects, writes one command
+line (a name and optional arguments, separated by spaces) and reads back one
+line of JSON.  Commands run on the server's threads, so they should only
+read shared state or hand work over to the thread that owns it.
+"""
+import json
+import pathlib
+import socket
+import threading
+
+from common.lazy import lazy_import
+from common.exceptions import ControlError
+
+
+socketserver = lazy_import('socketserver')
+DEFAULT_TIMEOUT = 5.0
+MAX_LINE = 4096
+
+
+class ControlServer:
+    """Serves `commands`, a dict of command names to callables, at `path`
+    from a background thread."""
+
+    def __init__(self, path, commands):
+        self.path = pathlib.Path(path)
+        self.commands = commands
+        self.server = None
+        self.thread = None
+        self._pid = None
+
+    def start(self):
+        """Bind and serve; a no-op if already serving in this process.
+        Raises OSError if another process is serving at `path`."""
+        if self._pid == pathlib.os.getpid():
+            return
+        commands = self.commands
+
+        class ControlHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline(MAX_LINE).decode('utf-8')
+                name, *args = line.split() or [""]
+                command = commands.get(name)
+                if command is None:
+                    reply = {
+                        'ok': False,
+                        'error': f"Unknown command {name!r}; expected one "
+                                 f"of {', '.join(sorted(commands))}"}
+                else:
+                    try:
+                        reply = {'ok': True, 'result': command(*args)}
+                    except Exception as e:  # pylint: disable=broad-except
+                        reply = {'ok': False, 'error': str(e)}
+                self.wfile.write(
+                    json.dumps(reply, default=str).encode('utf-8') + b"\n")
+
+        if self.path.exists():
+            if _answers(self.path):
+                raise OSError(f"{self.path} is served by another process")
+            self.path.unlink()  # left behind by a daemon that died
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.server = socketserver.ThreadingUnixStreamServer(
+            str(self.path), ControlHandler)
+        self.server.daemon_threads = True
+        pathlib.os.chmod(self.path, 0o600)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="control", daemon=True)
+        self.thread.start()
+        self._pid = pathlib.os.getpid()
+
+    def close(self):
+        if self.server is not None and self._pid == pathlib.os.getpid():
+            self.server.shutdown()
+            self.server.server_close()
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        self.server = None
+        self.thread = None
+        self._pid = None
+
+
+def _answers(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+def control_request(path, command, *args, timeout=DEFAULT_TIMEOUT):
+    """Send `command` to the daemon serving `path` and return its result.
+
+    Raises OSError if nothing is serving there, and ControlError if the
+    command failed.
+    """
+    line = " ".join(str(part) for part in (command,) + args)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.sendall(line.encode('utf-8') + b"\n")
+        received = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            received.append(chunk)
+    try:
+        reply = json.loads(b"".join(received))
+    except ValueError as e:
+        raise ControlError(f"Unreadable reply to {command!r}: {e}") from e
+    if not reply.get('ok'):
+        raise ControlError(reply.get('error', "Unknown error"))
+    return reply.get('result')
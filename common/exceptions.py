@@ -3,7 +3,11 @@ from __future__ import absolute_import, unicode_literals
 
 from decimal import Decimal
 import datetime
-import pprint
+
+from common.lazy import lazy_import
+
+
+pprint = lazy_import('pprint')
 
 
 _PROTECTED_TYPES = (
@@ -15,6 +19,10 @@ class NoConfiguration(Exception):
     pass
 
 
+class ControlError(Exception):
+    """Raised when a daemon answers a control command with an error."""
+
+
 # Shamelessly copied from django.utils.encoding
 class DjangoUnicodeDecodeError(UnicodeDecodeError):
     def __init__(self, obj, *args):
@@ -3,15 +3,63 @@ from copy import deepcopy
 from frozendict import frozendict
 
 from common.exceptions import force_text, ValidationError
-from common.assist import (
-    coercelist, coercedict, getor, oara_argkwarg, kwargset)
+from common.assist import coercelist, coercedict, getor, kwargset
+
+
+def _names(arguments):
+    """Argument names as a tuple, the way `coercelist` would list them."""
+    # pylint: disable=unidiomatic-typecheck
+    if type(arguments) in (list, tuple):
+        return tuple(arguments)
+    return tuple(coercelist(arguments))
 
 
 class FargAble:
+    """Resolves a class's declared arguments (`_rargs`, required, and
+    `_oargs`, optional) against the positional and keyword arguments it was
+    constructed with, and hands the result (`fargs`) on to the next
+    `__init__` in the MRO.
+
+    Argument signatures are compiled once per class (and per distinct set
+    of names, since `__mid_init__` may change them), and `fargs` is only
+    resolved again once `request`, `rargs` or `oargs` have changed.
+    Defaults come from the class.
+    """
     _rargs = tuple()  # required arguments (that is, args w/o defaults)
     _oargs = tuple()  # optional arguments
     __odefs = frozendict({})  # persistent optional argument defaults
     __base_default = None  # default optional argument value
+    _declared = ((), ())
+    _signatures = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._declared = (_names(cls._rargs), _names(cls._oargs))
+        cls._signatures = {}
+        cls._signature(*cls._declared)
+
+    @classmethod
+    def _signature(cls, rargs, oargs):
+        """(required names, ordered names, defaults, any callable default)
+        for a pair of argument name tuples, laid out the way
+        `oara_argkwarg` lays them out."""
+        try:
+            return cls._signatures[(rargs, oargs)]
+        except KeyError:
+            pass
+        ordered = list(rargs)
+        oarg_defaults = {}
+        if oargs:
+            odefs = {a: cls.__base_default for a in oargs}
+            odefs.update(cls.__odefs)
+            ordered.extend(oargs)
+            oarg_defaults = coercedict(list(oargs), odefs)
+        defaults = {arg: None for arg in ordered}
+        defaults.update(oarg_defaults)
+        signature = cls._signatures[(rargs, oargs)] = (
+            frozenset(rargs), tuple(ordered), defaults,
+            any(callable(default) for default in defaults.values()))
+        return signature
 
     @property
     def odefs(self):
@@ -26,26 +74,90 @@ class FargAble:
         args.extend(coercelist(self.oargs))
         return args
 
+    def _request_key(self):
+        """What `fargs` was resolved from; None if it can't be told."""
+        request = self.request
+        if type(request) is not dict:  # pylint: disable=unidiomatic-typecheck
+            return None
+        kwargs = request.get('kwargs')
+        if type(kwargs) is dict:  # pylint: disable=unidiomatic-typecheck
+            kwargs = tuple(kwargs.items())
+        return (
+            request.get('args'), kwargs, _names(self.rargs),
+            _names(self.oargs))
+
     @property
     def fargs(self):  # invoked arguments based on args, kwargs, and defaults
-        args = getor(getattr(self, 'request', None), 'args', tuple())
-        kwargs = getor(getattr(self, 'request', None), 'kwargs', dict())
+        key = self._request_key()
+        try:
+            fresh = key is not None and key == self._fargs_key
+        except Exception:  # an argument that can't be compared
+            fresh = False
+        if not fresh:
+            self._fargs, renamed = self._resolve_fargs()
+            self._fargs_key = self._request_key() if renamed else key
+        return dict(self._fargs)
+
+    def _resolve_fargs(self):
+        """Same result as `oara_argkwarg` over the compiled signature;
+        also says whether reserved kwargs had to be renamed."""
+        request = self.request
+        if isinstance(request, dict):
+            args = request.get('args') or tuple()
+            kwargs = request.get('kwargs') or dict()
+        else:
+            args = getor(request, 'args', tuple())
+            kwargs = getor(request, 'kwargs', dict())
+        renamed = False
         for reserved_kwarg in ['req_args', 'opt_defaults']:
             if kwargs.get(reserved_kwarg, None):
                 kwargs['__{}'.format(reserved_kwarg)] = kwargs[reserved_kwarg]
                 del kwargs[reserved_kwarg]
-        return oara_argkwarg(
-            self.oargs, req_args=self.rargs, opt_defaults=self.odefs,
-            *args, **kwargs)
+                renamed = True
+        required, ordered, defaults, converters = self._signature(
+            _names(self.rargs), _names(self.oargs))
+        kwargs = dict(kwargs)
+        fargs = dict(defaults)
+        if args:
+            positional = [arg for arg in ordered if arg not in kwargs]
+            for arg, value in zip(positional, args):
+                fargs[arg] = value
+        if args or converters:
+            for key, val in fargs.items():
+                # A default (or positional value) that can be called
+                # converts the value passed in; anything else stays put.
+                if not callable(val):
+                    continue
+                try:
+                    if key in kwargs:
+                        fargs[key] = val(kwargs[key])
+                        del kwargs[key]
+                    else:
+                        fargs[key] = val()
+                except Exception:
+                    pass
+        fargs.update(kwargs)
+        missing = [
+            f for f in required
+            if fargs.get(f) is None and f not in kwargs]
+        if missing:
+            raise TypeError("fargs expected {} arguments, got {}".format(
+                len(required), len(required) - len(missing)))
+        return fargs, renamed
 
     def __mid_init__(self, *args, **kwargs):
         pass
 
     def __init__(self, *args, **kwargs):
-        self.rargs = coercelist(self._rargs)
-        self.oargs = coercelist(self._oargs)
-        self._odefs = coercedict(self.__odefs)
-        self._base_default = deepcopy(self.__base_default)
+        self._fargs = None
+        self._fargs_key = None
+        rargs, oargs = self._declared
+        self.rargs = list(rargs)
+        self.oargs = list(oargs)
+        self._odefs = dict(self.__odefs)
+        base_default = self.__base_default
+        self._base_default = (
+            base_default if base_default is None else deepcopy(base_default))
         self.request = {'args': args, 'kwargs': kwargs}
         try:
             self.__mid_init__(*args, **kwargs)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime as dt
+import json
 import delorean
 # import holidays
 # from pandas import bdate_range
@@ -31,11 +32,22 @@ DELOREAN_FREQ = {
     'interface': delorean.interface
 }
 
-TIMEZONE_COUNTRY = {
-    timezone: countrycode
-    for countrycode in delorean.dates.pytz.country_timezones
-    for timezone in delorean.dates.pytz.country_timezones[countrycode]
-}
+
+def _timezone_country():
+    return {
+        timezone: countrycode
+        for countrycode in delorean.dates.pytz.country_timezones
+        for timezone in delorean.dates.pytz.country_timezones[countrycode]
+    }
+
+
+def __getattr__(name):
+    # TIMEZONE_COUNTRY reads every country's zones out of pytz, so it is
+    # only built the first time it is asked for.
+    if name == 'TIMEZONE_COUNTRY':
+        table = globals()['TIMEZONE_COUNTRY'] = _timezone_country()
+        return table
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # def get_business_day(src_dt, direction, num_shifts=1):
@@ -57,39 +69,78 @@ def iso_delcap(dt_string, dayfirst=None, yearfirst=None):
         dt_string, dayfirst=dayfirst, yearfirst=yearfirst)
 
 
-def possible_timezones(tz_offset, common_only=True):
-    favored_tz_names = set([
-        'Pacific/Midway', 'Europe/Paris', 'Europe/Athens', 'Europe/Moscow',
-        'Asia/Dubai', 'Asia/Karachi', 'Antarctica/Vostok', 'Asia/Bangkok',
-        'Asia/Hong_Kong', 'Asia/Tokyo', 'Australia/Sydney', 'Pacific/Auckland'
-    ])
-    # pick one of the timezone collections
+FAVORED_TZ_NAMES = frozenset([
+    'Pacific/Midway', 'Europe/Paris', 'Europe/Athens', 'Europe/Moscow',
+    'Asia/Dubai', 'Asia/Karachi', 'Antarctica/Vostok', 'Asia/Bangkok',
+    'Asia/Hong_Kong', 'Asia/Tokyo', 'Australia/Sydney', 'Pacific/Auckland'
+])
+TZ_INDEX_CACHE = None  # set to a file path to persist the offset index
+_TZ_INDEX = {}
+
+
+def _build_tz_index(common_only):
+    """Map each UTC offset (in seconds) to the timezones whose latest
+    transition lands on it, with a favored name (if any) repeated last."""
     timezones = (
         delorean.dates.pytz.common_timezones
         if common_only else delorean.dates.pytz.all_timezones)
-    # convert the float hours offset to a timedelta
-    offset_days, offset_seconds = 0, int(tz_offset * 3600)
-    if offset_seconds < 0:
-        offset_days = -1
-        offset_seconds += 24 * 3600
-    desired_delta = delorean.dates.timedelta(offset_days, offset_seconds)
-    # Loop through the timezones and find any with matching offsets
     null_delta = delorean.dates.timedelta(0, 0)
-    results = []
+    index = {}
     for tz_name in timezones:
         tz = delorean.dates.pytz.timezone(tz_name)
         non_dst_offset = getattr(tz, '_transition_info', [[null_delta]])[-1]
-        if desired_delta == non_dst_offset[0]:
-            results.append(tz_name)
-    preferred_name = set(results) & favored_tz_names
-    if preferred_name:
-        results.append(preferred_name.pop())
-    return results
+        offset = int(non_dst_offset[0].total_seconds())
+        index.setdefault(offset, []).append(tz_name)
+    for tz_names in index.values():
+        preferred_names = sorted(set(tz_names) & FAVORED_TZ_NAMES)
+        if preferred_names:
+            tz_names.append(preferred_names[0])
+    return index
+
+
+def _load_tz_index(common_only):
+    key = 'common' if common_only else 'all'
+    if not TZ_INDEX_CACHE:
+        return _build_tz_index(common_only)
+    version = delorean.dates.pytz.__version__
+    try:
+        with open(TZ_INDEX_CACHE, 'r') as cache_file:
+            cached = json.load(cache_file)
+        if cached.get('pytz') != version:
+            raise ValueError("index built with another pytz")
+    except (OSError, ValueError, AttributeError):
+        cached = {'pytz': version}
+    if key in cached:
+        return {
+            int(offset): tz_names for offset, tz_names in cached[key].items()}
+    index = cached[key] = _build_tz_index(common_only)
+    try:
+        with open(TZ_INDEX_CACHE, 'w') as cache_file:
+            json.dump(cached, cache_file)
+    except OSError:
+        pass
+    return index
+
+
+def timezone_index(common_only=True):
+    """The offset index for common (or all) timezones, built on first use
+    and, with `TZ_INDEX_CACHE` set, read from or saved to that file."""
+    try:
+        return _TZ_INDEX[common_only]
+    except KeyError:
+        index = _TZ_INDEX[common_only] = _load_tz_index(common_only)
+        return index
+
+
+def possible_timezones(tz_offset, common_only=True):
+    # match the float hours offset to whole seconds, as a timedelta would
+    offset_seconds = int(tz_offset * 3600)
+    return list(timezone_index(common_only).get(offset_seconds, ()))
 
 
 def likely_tz(tz_offset):
     try:
-        result = possible_timezones(tz_offset)[-1]
+        result = timezone_index()[int(tz_offset * 3600)][-1]
     except Exception:
         result = None
     return result
@@ -337,10 +388,9 @@ class NewDelorean(FargAble, MyDelorean):
         if not astz:
             astz = 'utc'
         elif isinstance(astz, (int, float)):
-            try:
-                astz = possible_timezones(astz)[-1]
-            except Exception:
-                astz = 'utc'
+            astz = likely_tz(astz) or 'utc'
+            # the offset itself is no name Delorean can localize to
+            argtz = astz
         try:
             if isinstance(date_thing, delorean.Delorean):
                 if argtz:
@@ -396,10 +446,21 @@ class NewDelorean(FargAble, MyDelorean):
         del self.request['args']
         self.request['kwargs'] = obj_kwargs
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        for attr, val in DELOREAN_FREQ.items():
-            setattr(self, attr, val)
-
     def __repr__(self):
         return f"New{super().__repr__()}"
+
+
+def batch_epochs(datetimes, now=None):
+    """Epoch seconds of each of `datetimes` (naive ones taken as UTC, None
+    left as None), with the timezone math done once for the whole batch:
+    each is offset from one reading of `now` (a NewDelorean, taken if not
+    given) instead of being made a Delorean of its own."""
+    if now is None:
+        now = NewDelorean()
+    anchor = now.epoch
+    naive = now.naive
+    aware = now.datetime
+    return [
+        None if when is None else anchor - (
+            (naive if when.tzinfo is None else aware) - when).total_seconds()
+        for when in datetimes]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred imports, kept apart from `common.assist` so modules on the light
+command-line paths can use them without importing all of it.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """Return module `name`, only executed when an attribute of it is first
+    read, so importing what uses it stays cheap for paths that never do."""
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition('.')
+    if parent:
+        # as the import system would, so `import parent` finds it too
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -1,6 +1,20 @@
+import logging
+from logging import handlers
+import pathlib
+import queue
+import time
+import weakref
+
 from frozendict import frozendict
 
-from common.assist import coercelist
+from common.constants import ERRTS_STRFTIME
+from common.lazy import lazy_import
+
+
+# Only needed once a record has arguments, or a mail goes out; `stop` and
+# `status` have neither.
+assist = lazy_import('common.assist')
+mail_relay = lazy_import('common.mail_relay')
 
 
 LOG_LEVELS = frozendict({
@@ -19,20 +33,149 @@ class LoggingUndefined(Exception):
     """Indicates that logging is undefined."""
 
 
+class ShimLogRecord(logging.LogRecord):
+    """LogRecord that fills in its arguments the way LoggingShim always has:
+    `%`-style first, falling back to `str.format`.  Filling is deferred until
+    a handler needs the text.
+
+    Only what handlers and formatters read is set up; caller-location and
+    process/thread details are left at their class defaults, which is most
+    of what a stock LogRecord costs to build.
+    """
+    pathname = filename = module = ""
+    lineno = 0
+    funcName = None
+    thread = threadName = None
+    process = processName = None
+    taskName = None
+    relativeCreated = 0.0
+    exc_info = exc_text = stack_info = None
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, name, level, msg, args):
+        self.name = name
+        self.msg = msg
+        self.args = args
+        self.levelno = level
+        self.levelname = logging.getLevelName(level)
+        self.created = time.time()
+        self.msecs = (self.created - int(self.created)) * 1000
+
+    def getMessage(self):
+        message = str(self.msg)
+        if self.args:
+            try:
+                message = message % self.args
+            except TypeError:
+                message = message.format(*self.args)
+        return message
+
+
+class CachedTimeFormatter(logging.Formatter):
+    """Formatter that renders each second's timestamp only once."""
+    converter = time.gmtime
+
+    def __init__(self, fmt=None, datefmt=ERRTS_STRFTIME):
+        super().__init__(fmt, datefmt)
+        self._second = None
+        self._stamp = None
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        if second != self._second:
+            self._stamp = time.strftime(
+                datefmt or self.datefmt, self.converter(second))
+            self._second = second
+        return self._stamp
+
+
+class PipelineHandler(handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    Records are queued as-is, so `%` arguments are only merged (and
+    timestamps only rendered) off the caller's thread.  The listener is
+    started on first use in each process, since a thread started before
+    the daemon forks would not survive it.  It is a daemon thread, so a
+    process that ends without `logging.shutdown` (a shard process, which
+    leaves through `os._exit`) has to `flush` first or lose what is queued.
+    """
+    instances = weakref.WeakSet()
+
+    def __init__(self, *targets):
+        super().__init__(queue.SimpleQueue())
+        self.targets = targets
+        self.listener = None
+        self._pid = None
+        PipelineHandler.instances.add(self)
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        if self._pid != pathlib.os.getpid():
+            if self._pid is not None:
+                # Forked: what was queued is the parent's to write.
+                self.queue = queue.SimpleQueue()
+            self._pid = pathlib.os.getpid()
+            self.listener = handlers.QueueListener(
+                self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+        self.queue.put_nowait(record)
+
+    def flush(self):
+        """Write out every record queued so far; the next one starts the
+        listener again."""
+        with self.lock:
+            if self.listener is not None and (
+                    self._pid == pathlib.os.getpid()):
+                self.listener.stop()
+                self.listener = None
+                self._pid = None
+        for target in self.targets:
+            target.flush()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+def flush_pipelines():
+    """Flush every PipelineHandler, before the process ends."""
+    for handler in list(PipelineHandler.instances):
+        handler.flush()
+
+
 class LoggingShim:
     levels = LOG_LEVELS
+    logger_name = "ban_h0nde"
+    metrics = None  # counts messages by level, once the app has metrics
+
+    def level_for(self, log_type):
+        try:
+            return self.levels[log_type]
+        except KeyError:
+            pass
+        try:
+            return int(log_type)
+        except ValueError:
+            raise ValueError(
+                '`log_type` value invalid, must be one of: '
+                '{}'.format(", ".join(self.levels))) from None
+
+    def make_record(self, log_type, message, args=None, name=None):
+        """Wrap a message in a record without filling in its arguments."""
+        if args is None:
+            args = tuple()
+        elif not isinstance(args, tuple):
+            args = tuple(assist.coercelist(args))
+        return ShimLogRecord(
+            name or self.logger_name, self.level_for(log_type), message, args)
 
     def LogMsg(self, log_type, message, args=None):
         # This is such a placeholder.  A nod towards something resembling ...
         # ... Best Practice.  Uh, yeah.
-        if args is None:
-            args = tuple()
-        else:
-            args = tuple(coercelist(args))
-        try:
-            filled_message = message % args
-        except TypeError:
-            filled_message = message.format(*args)
+        filled_message = self.make_record(
+            log_type, message, args).getMessage()
         raise LoggingUndefined(
             f"Cannot log message `{filled_message}` as `{log_type}` properly, "
             f"logging manager is not defined.")
@@ -50,6 +193,13 @@ class LoggingShim:
         self.LogMsg("WARNING", message, args)
 
 
+class QuietLogManager(LoggingShim):
+    """Drops every message; for benchmarks, tests and replays."""
+
+    def LogMsg(self, log_type, message, args=None):
+        pass
+
+
 class LogManager:
     log_manager = None
     log_mgr_class = LoggingShim
@@ -61,11 +211,34 @@ class LogManager:
 
 
 class EmailLogManager(LogManager):
+    mail_queue = None
 
     def __init__(self, *args, **kwargs):
         self.config = frozendict({})
         super().__init__(*args, **kwargs)
 
-    def email_notify(self, msg, subject=None):  # pylint: disable=unused-argument
-        # email logging would be configured here, but... well ...
-        self.log_manager.LogErrorMsg("Unable to send mail - not configured")
+    def email_notify(self, msg, subject=None):
+        email_config = self.config.get('email')
+        if not email_config:
+            self.log_manager.LogErrorMsg("Unable to send mail - not configured")
+            return
+        if self.mail_queue is None or not self.mail_queue.usable:
+            self.mail_queue = mail_relay.MailQueue.from_config(
+                email_config, self.log_manager)
+        if subject is None:
+            subject = msg.splitlines()[0] if msg else ""
+        context = {
+            'deployed_context': self.config.get('deployed_context', "DEFAULT"),
+            'running_on': self.config.get('running_on', "DEFAULT"),
+        }
+        try:
+            subject = subject.format(**context)
+        except (KeyError, IndexError, ValueError):
+            pass
+        self.mail_queue.notify(subject, msg)
+
+    def close_mail(self, timeout=30.0):
+        """Send any queued notifications before shutting down."""
+        if self.mail_queue is not None and self.mail_queue.usable:
+            self.mail_queue.close(timeout)
+            self.mail_queue = None
@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
-import smtplib
-from email.mime.text import MIMEText
+import pathlib
+import queue
+import threading
+import time
 from frozendict import frozendict
 
+from common.assist import coercelist, lazy_import
 from common.exceptions import ValidationError
 from common.fargable import FargAble, kwargset
 
 
+# Only loaded once mail is actually sent.
+smtplib = lazy_import('smtplib')
+mime_text = lazy_import('email.mime.text')
+
+
 class SMTPClient(FargAble, kwargset):
     """Client that accepts useful arguments and attempts to send mail."""
     # pylint: disable=no-member
@@ -51,7 +59,7 @@ class SMTPClient(FargAble, kwargset):
                 "Can't initialize SMTP connection without login credentials")
 
     def _make_mail(self, recipient):
-        message = MIMEText(self.body, _charset='utf-8')
+        message = mime_text.MIMEText(self.body, _charset='utf-8')
         message['From'] = self.mail_sender
         message['To'] = recipient
         message['Subject'] = self.subject
@@ -69,3 +77,172 @@ class SMTPClient(FargAble, kwargset):
         self.smtp_client.quit()
         if bad_mail:
             raise ValidationError(bad_mail)
+
+
+class PooledSMTPConnection:
+    """One SMTP connection, authenticated once and reused for every send.
+
+    A send that fails because the server dropped the connection reconnects
+    and tries once more before giving up.
+    """
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, host, port=0, username=None, password=None,
+                 starttls=True, timeout=30, idle_timeout=300):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.smtp_client = None
+        self.last_used = 0.0
+
+    def connect(self):
+        self.close()
+        smtp_client = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        smtp_client.ehlo_or_helo_if_needed()
+        if self.starttls:
+            smtp_client.starttls()
+            smtp_client.ehlo()
+        if all((self.username, self.password)):
+            smtp_client.login(self.username, self.password)
+        self.smtp_client = smtp_client
+
+    def _stale(self):
+        return (self.smtp_client is None or
+                time.monotonic() - self.last_used > self.idle_timeout)
+
+    def sendmail(self, sender, recipients, message):
+        if self._stale():
+            self.connect()
+        try:
+            refused = self.smtp_client.sendmail(sender, recipients, message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.connect()
+            refused = self.smtp_client.sendmail(sender, recipients, message)
+        self.last_used = time.monotonic()
+        return refused
+
+    def close(self):
+        if self.smtp_client is None:
+            return
+        try:
+            self.smtp_client.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp_client.close()
+        self.smtp_client = None
+
+
+class MailQueue:
+    """Background notifier that coalesces bursts of notifications.
+
+    `notify` only enqueues, so it never blocks the caller (including the
+    event loop running the bans).  A worker thread waits for the first
+    notification, collects whatever else arrives within `digest_window`
+    seconds and sends it all as one message to every recipient over a
+    PooledSMTPConnection.
+    """
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, connection, sender, recipients, digest_window=30.0,
+                 max_digest=100, log_manager=None):
+        self.connection = connection
+        self.sender = sender
+        self.recipients = coercelist(recipients)
+        self.digest_window = digest_window
+        self.max_digest = max_digest
+        self.log_manager = log_manager
+        self.queue = queue.Queue()
+        self.sent = 0
+        # The worker thread doesn't survive a fork; see `usable`.
+        self.pid = pathlib.os.getpid()
+        self._closing = threading.Event()
+        self._worker = threading.Thread(
+            target=self._run, name="mail-queue", daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_config(cls, email_config, log_manager=None):
+        connection = PooledSMTPConnection(
+            email_config['host'],
+            port=email_config.get('port', 0),
+            username=email_config.get('username'),
+            password=email_config.get('password'),
+            starttls=email_config.get('starttls', True))
+        return cls(
+            connection,
+            email_config['sender'],
+            email_config['to'],
+            digest_window=email_config.get('digest_window', 30.0),
+            log_manager=log_manager)
+
+    @property
+    def usable(self):
+        return self.pid == pathlib.os.getpid() and self._worker.is_alive()
+
+    def notify(self, subject, body):
+        self.queue.put((time.time(), subject, body))
+
+    def _collect(self):
+        try:
+            batch = [self.queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.digest_window
+        while len(batch) < self.max_digest and not self._closing.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        while len(batch) < self.max_digest:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _make_digest(self, batch):
+        if len(batch) == 1:
+            _, subject, body = batch[0]
+        else:
+            subject = f"[{len(batch)} notifications] {batch[0][1]}"
+            body = "\n\n".join(
+                "{} -- {}\n{}".format(
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sent)),
+                    entry_subject, entry_body)
+                for sent, entry_subject, entry_body in batch)
+        message = mime_text.MIMEText(body, _charset='utf-8')
+        message['From'] = self.sender
+        message['To'] = ", ".join(self.recipients)
+        message['Subject'] = subject
+        return message.as_string()
+
+    def _send(self, batch):
+        try:
+            refused = self.connection.sendmail(
+                self.sender, self.recipients, self._make_digest(batch))
+        except Exception as e:  # pylint: disable=broad-except
+            if self.log_manager is not None:
+                self.log_manager.LogErrorMsg(
+                    f"Unable to send {len(batch)} notification(s): {e}")
+            return
+        self.sent += len(batch)
+        if refused and self.log_manager is not None:
+            self.log_manager.LogErrorMsg(f"Recipients refused: {refused}")
+
+    def _run(self):
+        while not (self._closing.is_set() and self.queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._send(batch)
+        self.connection.close()
+
+    def close(self, timeout=30.0):
+        """Send whatever is still queued, then drop the connection."""
+        self._closing.set()
+        self._worker.join(timeout)
@@ -0,0 +1,253 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Updating a metric is a dict update (a list append, for histograms), so it
+can be done for every screened member; rendering, and anything computed
+through a callback, only happens when the endpoint is scraped.
+"""
+from bisect import bisect_left
+import pathlib
+import resource
+import threading
+
+from common.assist import lazy_import
+
+
+http_server = lazy_import('http.server')
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def label_text(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{{{}}}".format(",".join(
+            f'{label}="{_escape(value)}"' for label, value in pairs))
+
+    def samples(self):
+        """Yield (suffix, label text, value) for every sample."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"]
+        lines.extend(
+            f"{self.name}{suffix}{labels} {_format_value(value)}"
+            for suffix, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonic count, optionally split by label values.  With a
+    `function`, the count is taken from it at scrape time instead, for
+    counts something else already keeps."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def samples(self):
+        values = self.values
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        if not self.labels and not values:
+            yield "", "", 0
+        for labels, count in sorted(values.items()):
+            yield "", self.label_text(labels), count
+
+
+class Gauge(Metric):
+    """Value that goes up and down.  With a `function`, the value is taken
+    from it at scrape time: a number, or a dict of label values to numbers."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+        self.values = {}
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def samples(self):
+        values = self.values
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        for labels, value in sorted(values.items()):
+            yield "", self.label_text(labels), value
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed bucket bounds.
+
+    Observations are only appended to a list on the hot path and sorted
+    into buckets in batches, by whichever thread is observing; a scrape
+    reads the buckets plus a copy of the batch in progress.
+    """
+    kind = "histogram"
+    batch_size = 1024
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = {}  # labels -> [count per bucket..., +Inf, sum]
+        self.pending = []
+
+    def observe(self, value, labels=()):
+        pending = self.pending
+        pending.append((labels, value))
+        if len(pending) >= self.batch_size:
+            self.pending = []
+            self._fold(pending, self.counts)
+
+    def _fold(self, observed, counts_by_labels):
+        buckets = self.buckets
+        for labels, value in observed:
+            try:
+                counts = counts_by_labels[labels]
+            except KeyError:
+                counts = counts_by_labels[labels] = [0] * (len(buckets) + 2)
+            counts[bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    @property
+    def count(self):
+        return sum(
+            sum(counts[:-1]) for counts in list(self.counts.values())
+        ) + len(self.pending)
+
+    def samples(self):
+        counts_by_labels = {
+            labels: list(counts)
+            for labels, counts in list(self.counts.items())}
+        self._fold(list(self.pending), counts_by_labels)
+        bounds = self.buckets + (float('inf'),)
+        for labels, counts in sorted(counts_by_labels.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield "_bucket", self.label_text(
+                    labels, [('le', _format_value(float(bound)))]), cumulative
+            yield "_sum", self.label_text(labels), counts[-1]
+            yield "_count", self.label_text(labels), cumulative
+
+
+def resident_memory():
+    """Resident set size in bytes (the peak, where /proc isn't there)."""
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=(), function=None):
+        return self.register(Counter(name, documentation, labels, function))
+
+    def gauge(self, name, documentation, labels=(), function=None):
+        return self.register(Gauge(name, documentation, labels, function))
+
+    def histogram(self, name, documentation, labels=(),
+                  buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        return "\n".join(
+            metric.render() for metric in self.metrics.values()) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry at /metrics from a background thread."""
+
+    def __init__(self, registry, host="127.0.0.1", port=9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+        self._pid = None
+
+    def start(self):
+        """Bind and serve; a no-op if already serving in this process."""
+        if self._pid == pathlib.os.getpid():
+            return
+        registry = self.registry
+
+        class MetricsHandler(http_server.BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass  # scrapes aren't worth a log line each
+
+        self.httpd = http_server.ThreadingHTTPServer(
+            (self.host, self.port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        self._pid = pathlib.os.getpid()
+
+    def close(self):
+        if self.httpd is not None and self._pid == pathlib.os.getpid():
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        self.httpd = None
+        self.thread = None
+        self._pid = None
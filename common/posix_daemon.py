@@ -4,30 +4,38 @@ import pathlib
 import pwd
 import signal
 import sys
+import time
 from daemonize import Daemonize
 
-from common.assist import coercelist
-from common.constants import ERRTS
-from common.flux import NewDelorean
-from common.log_shim import LoggingShim
+from common.control import DEFAULT_TIMEOUT, control_request
+from common.exceptions import ControlError
+from common.log_shim import (
+    CachedTimeFormatter, LoggingShim, PipelineHandler, flush_pipelines)
 
-from watcher.core_app import CoreApplication
+from watcher.settings import DRAIN_TIMEOUT, STOP_GRACE
+
+
+STOP_TIMEOUT = 60.0
 
 
 class EchoLogManager(LoggingShim):
+    echo_stream = None  # sys.stdout, unless set
+    echo_format = "[%(asctime)s] %(levelname)s: %(message)s"
+    _echo_handler = None
+
+    @property
+    def echo_handler(self):
+        if self._echo_handler is None:
+            stream = logging.StreamHandler(self.echo_stream or sys.stdout)
+            stream.setFormatter(CachedTimeFormatter(self.echo_format))
+            self._echo_handler = PipelineHandler(stream)
+        return self._echo_handler
 
     def LogMsg(self, log_type, message, args=None):
-        if args is None:
-            args = tuple()
-        else:
-            args = tuple(coercelist(args))
-        try:
-            filled_message = message % args
-        except TypeError:
-            filled_message = message.format(*args)
-        now = NewDelorean()
-        timestamp = now.format_datetime(ERRTS)
-        print(f"[{timestamp}] {log_type}: {filled_message}")
+        record = self.make_record(log_type, message, args)
+        if self.metrics is not None:
+            self.metrics.log_messages.inc((record.levelname,))
+        self.echo_handler.handle(record)
 
 
 class DaemonLogManager(EchoLogManager):
@@ -41,20 +49,11 @@ class DaemonLogManager(EchoLogManager):
     def LogMsg(self, log_type: str, message: str, args=None):
         if not isinstance(self.logger, logging.Logger):
             return super().LogMsg(log_type, message, args)
-        try:
-            log_type = int(log_type)
-        except ValueError:
-            if log_type not in self.levels:
-                raise ValueError(
-                    '`log_type` value invalid, must be one of: '
-                    '{}'.format(", ".join(self.levels)))
-            else:
-                log_type = self.levels[log_type]
-        if args is None:
-            args = tuple()
-        else:
-            args = tuple(coercelist(args))
-        self.logger.log(log_type, message, *args)
+        record = self.make_record(log_type, message, args, self.logger.name)
+        if self.metrics is not None:
+            self.metrics.log_messages.inc((record.levelname,))
+        if self.logger.isEnabledFor(record.levelno):
+            self.logger.handle(record)
 
 
 class RunAsRoot(Exception):
@@ -114,7 +113,9 @@ class BaseAppServerSvc(Daemonize):
                 formatter = logging.Formatter(
                     "%(asctime)s %(name)s: %(message)s", "%b %e %H:%M:%S")
                 syslog.setFormatter(formatter)
-                self.logger.addHandler(syslog)
+                # Hand records to a listener thread, so the event loop
+                # never waits on the syslog socket.
+                self.logger.addHandler(PipelineHandler(syslog))
                 self.log_manager = self.log_mgr_class(self.logger)
 
     @classmethod
@@ -130,6 +131,7 @@ class BaseAppServerSvc(Daemonize):
         Wrapper to self-invoke
         """
         try:
+            signal.signal(signal.SIGHUP, self.sighup)
             self.load_config()
             self.normal_start_email()
             self.main()
@@ -138,6 +140,8 @@ class BaseAppServerSvc(Daemonize):
             msg = f"Configuration error: {e}"
             self.log_manager.LogErrorMsg(msg)
             self.email_notify(msg)
+        finally:
+            self.close_mail()
 
     def normal_stop_email(self):
         """
@@ -153,9 +157,78 @@ class BaseAppServerSvc(Daemonize):
         self.isrunning = True
         super().start()
 
-    def stop(self):
+    def stop(self, timeout=None):
+        """
+        stop other already running Daemon service, through its control socket
+        (or via SIGTERM, without one), and wait up to `timeout` seconds for it
+        to exit; returns False if it is still running
+        """
+        pid = self.status()
+        if pid is None:
+            self.log_manager.LogWarningMsg(f"{self.app} is not running.")
+            return True
+        try:
+            self.control_daemon('stop')
+        except (OSError, ControlError):
+            self.signal_daemon(signal.SIGTERM)
+        return self.wait_stopped(pid, timeout)
+
+    def wait_stopped(self, pid, timeout=None):
+        """
+        wait up to `timeout` seconds (by default `stop_timeout`) for process
+        `pid` to exit; returns whether it did
+        """
+        if timeout is None:
+            timeout = self.config.get('stop_timeout', STOP_TIMEOUT)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                pathlib.os.kill(pid, 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass  # still there, as another user
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def reload(self):
+        """
+        have the already running Daemon service reload its ruleset, through
+        its control socket (or via SIGHUP, without one)
+        """
+        try:
+            self.control_daemon('reload')
+        except (OSError, ControlError):
+            self.signal_daemon(signal.SIGHUP)
+
+    def control_daemon(self, command, *args, timeout=DEFAULT_TIMEOUT):
+        """
+        send `command` to the already running Daemon service over its control
+        socket and return the result; raises OSError if it serves none
+        """
+        path = self.control_path()
+        if path is None:
+            raise FileNotFoundError("The control socket is disabled.")
+        return control_request(path, command, *args, timeout=timeout)
+
+    def status(self):
+        """
+        report whether the Daemon service is running; returns its pid, or None
+        """
+        try:
+            with open(self.pid, "r") as pidfile:
+                pid = int(pidfile.read())
+            pathlib.os.kill(pid, 0)
+        except (FileNotFoundError, ValueError, ProcessLookupError):
+            return None
+        except PermissionError:
+            pass  # running, as another user
+        return pid
+
+    def signal_daemon(self, signum):
         """
-        stop other already running Daemon service, via SIGTERM
+        send `signum` to the already running Daemon service
         """
         # Change uid
         if self.user:
@@ -172,13 +245,13 @@ class BaseAppServerSvc(Daemonize):
         try:
             with open(self.pid, "r") as old_pidfile:
                 old_pid = old_pidfile.read()
-            pathlib.os.kill(int(old_pid), signal.SIGTERM)
+            pathlib.os.kill(int(old_pid), signum)
         except FileNotFoundError:
             self.log_manager.LogErrorMsg(
                 f"Unable to locate {self.pid} indicating process to end.")
         except PermissionError:
             self.log_manager.LogErrorMsg(
-                f"Unable to terminate process, {self.user} lacks permissions.")
+                f"Unable to signal process, {self.user} lacks permissions.")
         except Exception as e:
             self.log_manager.LogErrorMsg(e)
 
@@ -194,8 +267,18 @@ class BaseAppServerSvc(Daemonize):
             self.email_notify(message)
             self.exit(1)
         signal.signal(signal.SIGALRM, ureg_obs_timeout)
-        self.isrunning = False
-        signal.alarm(10)
+        self.request_stop()
+        # Leave time to drain the ban queue (in every shard process) first.
+        drain_timeout = self.config.get('drain_timeout', DRAIN_TIMEOUT)
+        signal.alarm(int(drain_timeout + 2 * STOP_GRACE))
+
+    def sighup(self, signum, frame):  # pylint: disable=unused-argument
+        """
+        These actions will be done after SIGHUP.
+        """
+        self.log_manager.LogWarningMsg(
+            "Caught signal %s. Reloading ruleset.", signum)
+        self.request_reload()
 
     def exit(self, exit_code=0):  # pylint: disable=arguments-differ
         """
@@ -214,4 +297,9 @@ class BaseAppServerSvc(Daemonize):
                 self.log_manager.LogErrorMsg(message)
             except:  # pylint: disable=bare-except
                 pass
+        try:
+            self.close_mail(timeout=5)
+        except:  # pylint: disable=bare-except
+            pass
+        flush_pipelines()
         sys.exit(exit_code)
@@ -8,8 +8,6 @@ import win32event
 import win32service
 # pylint: enable=import-error
 
-from watcher.core_app import CoreApplication
-
 
 class SMWinservice(win32serviceutil.ServiceFramework):
     '''Base class to create winservice in Python'''
@@ -1,5 +1,5 @@
+import json
 import sys
-import time
 
 try:
     import servicemanager
@@ -11,11 +11,38 @@ except ImportError:
     ON_WINDOWS = False
     SYS_PATH = "/etc/portransferd/"
 
-from watcher.core_app import CoreApplication
+from common.exceptions import ControlError
+from watcher.settings import DRAIN_TIMEOUT, DaemonSettings
 
 
-class AppServerSvc(CoreApplication, BaseAppServerSvc):
+class ControlSvc(DaemonSettings, BaseAppServerSvc):
+    """Finds and commands the running service without loading the
+    application, for stop, status, drain and reload."""
     _sys_path = SYS_PATH
+    # DaemonSettings' LogManager would otherwise shadow the platform's.
+    log_mgr_class = getattr(
+        BaseAppServerSvc, 'log_mgr_class', DaemonSettings.log_mgr_class)
+
+
+def app_server_svc():
+    """The service class proper; the application, and everything it
+    imports, is only loaded by the commands that run it."""
+    if 'AppServerSvc' not in globals():
+        # pylint: disable=import-outside-toplevel
+        from watcher.core_app import CoreApplication
+
+        class AppServerSvc(CoreApplication, ControlSvc):
+            # Found by this name by the Windows service host.
+            __qualname__ = 'AppServerSvc'
+
+        globals()['AppServerSvc'] = AppServerSvc
+    return globals()['AppServerSvc']
+
+
+def __getattr__(name):
+    if name == 'AppServerSvc':
+        return app_server_svc()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
@@ -26,23 +53,74 @@ if __name__ == '__main__':
     if invocation and isinstance(invocation, bool):
         if ON_WINDOWS:
             servicemanager.Initialize()
-            servicemanager.PrepareToHostSingle(AppServerSvc)
+            servicemanager.PrepareToHostSingle(app_server_svc())
             servicemanager.StartServiceCtrlDispatcher()
         else:
-            msg = "Daemon invocation requires {start|stop|restart} argument."
-            daemon = AppServerSvc()
+            msg = ("Daemon invocation requires "
+                   "{start|stop|restart|reload|status} argument, "
+                   "`drain [seconds]` or `screen <export> [output]`.")
+            daemon = ControlSvc()
             daemon.log_manager.LogWarningMsg(msg)
             print(msg)
     elif not ON_WINDOWS and invocation.lower() == "start":
-        daemon = AppServerSvc()
+        daemon = app_server_svc()()
         daemon.start()
     elif not ON_WINDOWS and invocation.lower() == "stop":
-        daemon = AppServerSvc()
-        daemon.stop()
+        daemon = ControlSvc()
+        daemon.read_settings()
+        if not daemon.stop():
+            msg = f"{daemon.app} is still shutting down."
+            daemon.log_manager.LogErrorMsg(msg)
+            sys.exit(1)
+    elif not ON_WINDOWS and invocation.lower() == "status":
+        daemon = ControlSvc()
+        daemon.read_settings()
+        pid = daemon.status()
+        if pid is None:
+            print(f"{daemon.app} is not running")
+            sys.exit(3)
+        try:
+            print(json.dumps(daemon.control_daemon('status'), indent=2))
+        except (OSError, ControlError) as e:
+            print(f"{daemon.app} is running (pid {pid}), "
+                  f"with no live status: {e}")
+    elif not ON_WINDOWS and invocation.lower() == "drain":
+        daemon = ControlSvc()
+        daemon.read_settings()
+        seconds = float(sys.argv[2]) if len(sys.argv) > 2 else (
+            daemon.config.get('drain_timeout', DRAIN_TIMEOUT))
+        try:
+            result = daemon.control_daemon(
+                'drain', seconds, timeout=seconds + 5.0)
+        except (OSError, ControlError) as e:
+            msg = f"Unable to drain {daemon.app}: {e}"
+            daemon.log_manager.LogErrorMsg(msg)
+            sys.exit(1)
+        print(json.dumps(result, indent=2))
+        sys.exit(0 if result['drained'] else 1)
+    elif not ON_WINDOWS and invocation.lower() == "reload":
+        daemon = ControlSvc()
+        daemon.read_settings()
+        daemon.reload()
+    elif not ON_WINDOWS and invocation.lower() == "screen":
+        daemon = app_server_svc()()
+        if len(sys.argv) < 3:
+            msg = "Usage: screen <export.csv|export.jsonl> [output]"
+            daemon.log_manager.LogWarningMsg(msg)
+            print(msg)
+            sys.exit(2)
+        daemon.load_config()
+        totals = daemon.screen_export(*sys.argv[2:4])
+        print(f"{totals['matched']} of {totals['screened']} member(s) "
+              f"matched in {totals['elapsed']:.1f}s")
     elif not ON_WINDOWS and invocation.lower() == "restart":
-        daemon = AppServerSvc()
-        daemon.stop()
-        time.sleep(10)
+        daemon = app_server_svc()()
+        daemon.read_settings()
+        # Start again as soon as the old process is gone, and not before.
+        if not daemon.stop():
+            msg = f"{daemon.app} is still shutting down; not restarting."
+            daemon.log_manager.LogErrorMsg(msg)
+            sys.exit(1)
         daemon.start()
     else:
-        AppServerSvc.parse_command_line()
+        app_server_svc().parse_command_line()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+A `CoreApplication` that logs nowhere and keeps its settings, state and
+rules under the test's tmp_path.
+"""
+import json
+
+import pytest
+
+from common.log_shim import QuietLogManager
+from watcher.core_app import CoreApplication
+from watcher.executor import BanExecutor
+
+
+class App(CoreApplication):
+    log_mgr_class = QuietLogManager
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Return a function making an `App` with the given settings, its
+    executor made and its state store open."""
+    made = []
+
+    def make(**settings):
+        settings.setdefault('state_db', str(tmp_path / "screening.sqlite3"))
+        settings.setdefault('control_socket', False)
+        with open(tmp_path / "settings.json", "w") as settings_file:
+            json.dump(settings, settings_file)
+        app = App()
+        app._sys_path = str(tmp_path)  # pylint: disable=protected-access
+        app.settings_conf = str(tmp_path / "settings.json")
+        app.load_config()
+        app.executor = BanExecutor.from_config(app.log_manager, app.config)
+        app.executor.metrics = app.metrics
+        app.open_state()
+        made.append(app)
+        return app
+
+    yield make
+    for app in made:
+        app.state.close()
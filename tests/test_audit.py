@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+AuditLog: configuration, flushing and rotation.
+"""
+import gzip
+import json
+import time
+
+import pytest
+
+from watcher.audit import AUDIT_FILE, FLUSH_EVERY, AuditLog
+
+
+def read_entries(path):
+    with open(path, "r", encoding="utf-8") as audit_file:
+        return [json.loads(line) for line in audit_file]
+
+
+@pytest.mark.parametrize("audit_config", [True, None, {}])
+def test_from_config_takes_true_for_the_defaults(tmp_path, audit_config):
+    audit = AuditLog.from_config(audit_config, str(tmp_path))
+    assert audit.path == tmp_path / AUDIT_FILE
+    assert audit.flush_every == FLUSH_EVERY
+    assert audit.compress is None
+
+
+def test_from_config_suffix_keeps_shards_apart(tmp_path):
+    audit = AuditLog.from_config(
+        {'path': str(tmp_path / "trail.jsonl")}, str(tmp_path),
+        "-shards-0-3")
+    assert audit.path == tmp_path / "trail-shards-0-3.jsonl"
+
+
+def test_entries_are_buffered_until_flush_every(tmp_path):
+    audit = AuditLog(
+        tmp_path / AUDIT_FILE, flush_every=3, flush_interval=3600)
+    audit.record(event='screen', member=1)
+    audit.record(event='screen', member=2)
+    assert not audit.path.exists()
+    audit.record(event='screen', member=3)
+    assert [entry['member'] for entry in read_entries(audit.path)] == [
+        1, 2, 3]
+    audit.close()
+
+
+def test_flush_if_due_writes_a_quiet_buffer(tmp_path):
+    audit = AuditLog(tmp_path / AUDIT_FILE, flush_interval=0.05)
+    audit.record(event='ban', member=1)  # just after creation: not yet due
+    audit.flush_if_due()
+    assert not audit.path.exists()
+    time.sleep(0.06)
+    audit.flush_if_due()
+    assert [entry['member'] for entry in read_entries(audit.path)] == [1]
+    audit.close()
+
+
+def test_rotates_past_max_bytes(tmp_path):
+    audit = AuditLog(tmp_path / AUDIT_FILE, max_bytes=200, flush_every=1)
+    for member in range(10):
+        audit.record(event='screen', member=member, name="x" * 40)
+    audit.close()
+    rotated = sorted(tmp_path.glob("audit-*.jsonl"))
+    assert rotated
+    members = [
+        entry['member'] for path in rotated + [audit.path]
+        if path.exists() for entry in read_entries(path)]
+    assert sorted(members) == list(range(10))
+
+
+def test_rotated_files_are_compressed(tmp_path):
+    audit = AuditLog(
+        tmp_path / AUDIT_FILE, max_bytes=1, flush_every=1, compress='gzip')
+    audit.record(event='ban', member=7)
+    audit.close()
+    [compressed] = tmp_path.glob("audit-*.jsonl.gz")
+    assert not list(tmp_path.glob("audit-*.jsonl"))
+    with gzip.open(compressed, "rt", encoding="utf-8") as audit_file:
+        assert json.loads(audit_file.read())['member'] == 7
+
+
+def test_unknown_compression_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        AuditLog(tmp_path / AUDIT_FILE, compress='lz4')
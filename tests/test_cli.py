@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+The command line: stop, status, drain and reload stay light.
+"""
+import pathlib
+import subprocess
+import sys
+
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+HEAVY = (
+    'watcher.core_app', 'watcher.executor', 'common.flux', 'common.assist',
+    'common.mail_relay', 'discord')
+
+
+def loaded_by(code):
+    """The modules `code` has executed; `lazy_import`ed ones not yet read
+    from are still `_LazyModule`s."""
+    result = subprocess.run(
+        [sys.executable, "-c",
+         f"import sys\n{code}\nprint('\\n'.join(\n"
+         "    name for name, module in sys.modules.items()\n"
+         "    if type(module).__name__ != '_LazyModule'))"],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def test_control_commands_leave_the_application_unloaded(tmp_path):
+    modules = loaded_by(
+        "import main\n"
+        f"main.ControlSvc._sys_path = {str(tmp_path)!r}\n"
+        "daemon = main.ControlSvc()\n"
+        "daemon.read_settings()\n"
+        "assert daemon.status() is None\n"
+        "daemon.control_path()")
+    assert 'common.control' in modules
+    assert not modules.intersection(HEAVY)
+
+
+def test_the_service_class_loads_the_application():
+    modules = loaded_by(
+        "import main\n"
+        "assert main.AppServerSvc.__qualname__ == 'AppServerSvc'\n"
+        "assert main.app_server_svc() is main.AppServerSvc")
+    assert 'watcher.core_app' in modules
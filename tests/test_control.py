@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+ControlServer and control_request: one command line in, one JSON line out.
+"""
+import pathlib
+import socket
+import tempfile
+
+import pytest
+
+from common.control import ControlServer, control_request
+from common.exceptions import ControlError
+
+
+@pytest.fixture
+def path():
+    # Unix socket paths are short; pytest's tmp_path can be too long.
+    with tempfile.TemporaryDirectory() as directory:
+        yield pathlib.Path(directory) / "control.sock"
+
+
+@pytest.fixture
+def server(path):
+    def fail():
+        raise RuntimeError("not now")
+
+    server = ControlServer(path, {
+        'status': lambda: {'guilds': 3, 'draining': False},
+        'echo': lambda *args: list(args),
+        'fail': fail,
+    })
+    server.start()
+    yield server
+    server.close()
+
+
+def test_commands_round_trip(server, path):
+    assert control_request(path, 'status') == {
+        'guilds': 3, 'draining': False}
+    assert control_request(path, 'echo', 'a', 2) == ['a', '2']
+    assert pathlib.os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_errors_come_back_as_control_errors(server, path):
+    with pytest.raises(ControlError, match="Unknown command 'drain'"):
+        control_request(path, 'drain')
+    with pytest.raises(ControlError, match="not now"):
+        control_request(path, 'fail')
+
+
+def test_nothing_serving_is_an_os_error(path):
+    with pytest.raises(OSError):
+        control_request(path, 'status')
+
+
+def test_a_live_socket_is_not_taken_over(server, path):
+    with pytest.raises(OSError, match="served by another process"):
+        ControlServer(path, {}).start()
+    assert control_request(path, 'echo', 'still') == ['still']
+
+
+def test_a_stale_socket_is_replaced(path):
+    # A socket file that nothing listens on, as a killed daemon leaves.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as dead:
+        dead.bind(str(path))
+    assert path.exists()
+    server = ControlServer(path, {'status': lambda: 'up'})
+    server.start()
+    try:
+        assert control_request(path, 'status') == 'up'
+    finally:
+        server.close()
+    assert not path.exists()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Shutdown: bans a drain can't get through are saved, and the next start
+replays them, once.
+"""
+import asyncio
+
+from benchmarks.fake_client import FakeClient, FakeGuild, FakeMember
+
+
+NAMES = ["twitter.com/h0nde", "alice", "TWITTER.COM/H0NDE_bot", "bob"]
+
+
+def crowd(latency):
+    guild = FakeGuild(1)
+    guild.members = [
+        FakeMember(index, name, guild, latency=latency)
+        for index, name in enumerate(NAMES, 1)]
+    return FakeClient([guild])
+
+
+def test_unmade_bans_are_replayed_once_on_the_next_start(make_app):
+    # Every ban hangs, so the drain times out with both still queued.
+    app = make_app(raid=False, drain_timeout=0.2, ban_workers=1)
+    hung = crowd(latency=3600)
+
+    async def run_then_stop():
+        app.executor.start()
+        await app.sweep(hung)
+        await app.shutdown(hung)
+    asyncio.run(run_then_stop())
+    assert hung.closed
+    assert hung.bans == []
+    assert app.draining
+
+    # The next start, with nothing left to hold the bans up.
+    restarted = make_app(raid=False, drain_timeout=0.2)
+    client = crowd(latency=0.0)
+
+    async def on_ready():
+        restarted.executor.start()
+        await restarted.replay_queued(client)
+        assert len(restarted.executor.pending) == 2
+        await restarted.sweep(client)
+        await restarted.executor.join()
+        await restarted.executor.close()
+    asyncio.run(on_ready())
+    assert sorted(ban[0] for ban in client.bans) == [1, 3]
+    assert sum(restarted.metrics.matches.values.values()) == 2
+
+    # Taken once: a third start has nothing to replay.
+    third = make_app(raid=False)
+    assert third.state.take_queued([1]) == []
+
+
+def test_a_drain_that_finishes_saves_nothing(make_app):
+    app = make_app(raid=False, drain_timeout=5.0)
+    client = crowd(latency=0.0)
+
+    async def run_then_stop():
+        app.executor.start()
+        await app.sweep(client)
+        await app.shutdown(client)
+    asyncio.run(run_then_stop())
+    assert sorted(ban[0] for ban in client.bans) == [1, 3]
+    assert app.state.take_queued([1]) == []
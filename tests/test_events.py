@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Member events: a clean member renamed into a rule is banned ahead of the
+sweep backlog.
+"""
+import asyncio
+import copy
+import types
+
+from benchmarks.fake_client import FakeClient, FakeGuild, FakeMember
+
+
+def backlog(app, guild, count):
+    """Queue `count` sweep bans in `guild`."""
+    for index in range(count):
+        member = FakeMember(1000 + index, "twitter.com/h0nde", guild)
+        guild.members.append(member)
+        app.screen_member(member)
+
+
+def run(app, events):
+    async def dispatch():
+        app.executor.start()
+        result = events()
+        await app.executor.close()
+        return result
+    return asyncio.run(dispatch())
+
+
+def test_a_nickname_into_a_rule_is_banned_first(make_app):
+    app = make_app(raid=False)
+    guild = FakeGuild(1)
+    member = FakeMember(1, "alice", guild)
+    guild.members.append(member)
+
+    def events():
+        assert app.screen_member(member) is None  # the sweep: clean
+        backlog(app, guild, 5)
+        before = copy.copy(member)
+        member.nick = "twitter.com/h0nde"
+        app.member_updated(before, member)
+        return app.executor.scheduler.pop()[0]
+    first = run(app, events)
+    assert first.member is member
+    assert first.urgent
+    assert first.rule_id == 'twitter-h0nde'
+
+
+def test_an_unchanged_name_is_not_screened_again(make_app):
+    app = make_app(raid=False)
+    guild = FakeGuild(1)
+    member = FakeMember(1, "alice", guild)
+
+    def events():
+        app.screen_member(member)
+        app.member_updated(copy.copy(member), member)  # roles, say
+    run(app, events)
+    assert app.metrics.screened.values == {(): 1}
+
+
+def test_a_username_change_is_screened_in_every_guild(make_app):
+    app = make_app(raid=False)
+    guilds = [FakeGuild(1), FakeGuild(2), FakeGuild(3)]
+    for guild in guilds[:2]:
+        guild.members.append(FakeMember(7, "alice", guild))
+    client = FakeClient(guilds)
+
+    def events():
+        for member in client.get_all_members():
+            app.screen_member(member)
+        for member in client.get_all_members():
+            member.name = "Tw\u0456tter.com/H0nde"  # a Cyrillic i
+        app.user_updated(
+            client, types.SimpleNamespace(id=7, name="alice"),
+            types.SimpleNamespace(id=7, name="Tw\u0456tter.com/H0nde"))
+        return sorted(
+            (job.guild_id, job.urgent)
+            for job in app.executor.pending.values())
+    assert run(app, events) == [(1, True), (2, True)]
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+TokenBucket, FairScheduler and BanExecutor: pacing, fairness between
+guilds, urgent jobs, rate limits, and what is left to do.
+"""
+import asyncio
+import types
+
+import discord
+import pytest
+
+from benchmarks.fake_client import FakeGuild, FakeMember
+from common.log_shim import QuietLogManager
+from watcher.executor import BanExecutor, BanJob, FairScheduler, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitedMember(FakeMember):
+    """Answered 429 for its first `limited` bans."""
+    __slots__ = ['limited', 'headers']
+
+    def __init__(self, member_id, guild, limited, headers=None):
+        super().__init__(member_id, f"member {member_id}", guild)
+        self.limited = limited
+        self.headers = headers or {}
+
+    async def ban(self, reason=None, delete_message_days=1):
+        if self.limited:
+            self.limited -= 1
+            response = types.SimpleNamespace(
+                status=429, reason="Too Many Requests", headers=self.headers)
+            raise discord.HTTPException(response, "rate limited")
+        await super().ban(reason, delete_message_days)
+
+
+def test_bucket_paces_after_its_burst():
+    clock = Clock()
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock)
+    for _ in range(3):
+        assert bucket.delay() == 0.0
+        bucket.take()
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now += 0.25
+    assert bucket.delay() == pytest.approx(0.25)
+    clock.now += 10.0
+    assert bucket.delay() == 0.0
+    assert bucket.tokens == 3.0  # no more than the burst
+
+
+def test_bucket_acquire_waits_for_a_token():
+    bucket = TokenBucket(rate=100.0, capacity=1)
+
+    async def acquire_twice():
+        await bucket.acquire()
+        started = bucket.clock()
+        await bucket.acquire()
+        return bucket.clock() - started
+    assert asyncio.run(acquire_twice()) >= 0.009
+
+
+def test_bucket_retune_and_block():
+    clock = Clock()
+    bucket = TokenBucket(rate=5.0, capacity=5, clock=clock)
+    bucket.retune(2, 4.0)
+    assert (bucket.rate, bucket.capacity, bucket.tokens) == (0.5, 2.0, 2.0)
+    bucket.retune(0, 1.0)  # nonsense is ignored
+    assert bucket.rate == 0.5
+    bucket.block(3.0)
+    assert bucket.delay() == pytest.approx(3.0)
+    bucket.block(1.0)  # never shortens a block
+    assert bucket.delay() == pytest.approx(3.0)
+    clock.now += 3.0
+    assert bucket.delay() == 0.0  # refilled while blocked
+
+
+@pytest.mark.parametrize("remaining, reset_after, rate, tokens, delay", [
+    (9, 1.0, 10.0, 5.0, 0.0),  # a window's first request: its length
+    (3, 0.4, 5.0, 3.0, 0.0),  # part way through: only what is left
+    (0, 0.4, 5.0, 0.0, 0.4),  # spent: nothing until it resets
+])
+def test_bucket_syncs_with_the_reported_limit(
+        remaining, reset_after, rate, tokens, delay):
+    bucket = TokenBucket(rate=5.0, capacity=5, clock=Clock())
+    bucket.sync(10, remaining, reset_after)
+    assert bucket.capacity == 10.0
+    assert bucket.rate == rate
+    assert bucket.tokens == tokens
+    assert bucket.delay() == pytest.approx(delay)
+
+
+def jobs_for(guild, count, start=0, urgent=False):
+    return [
+        BanJob(FakeMember(start + index, f"member {index}", guild), 'rule',
+               urgent)
+        for index in range(count)]
+
+
+def drain(scheduler):
+    taken = []
+    while True:
+        job, _ = scheduler.pop()
+        if job is None:
+            return taken
+        taken.append(job)
+
+
+def test_guilds_take_turns_however_deep_their_queue():
+    big, small = FakeGuild(1), FakeGuild(2)
+    scheduler = FairScheduler()
+    for job in jobs_for(big, 100) + jobs_for(small, 3, start=1000):
+        scheduler.push(job)
+    order = [job.guild_id for job in drain(scheduler)[:6]]
+    assert order == [1, 2, 1, 2, 1, 2]
+
+
+def test_weights_share_out_the_rounds():
+    heavy, light = FakeGuild(1), FakeGuild(2)
+    scheduler = FairScheduler(weights={1: 3.0})
+    for job in jobs_for(heavy, 30) + jobs_for(light, 30, start=1000):
+        scheduler.push(job)
+    first = [job.guild_id for job in drain(scheduler)[:20]]
+    assert first.count(1) == 15
+    assert first.count(2) == 5
+
+
+def test_urgent_jobs_go_before_the_backlog():
+    guild = FakeGuild(1)
+    scheduler = FairScheduler()
+    for job in jobs_for(guild, 5):
+        scheduler.push(job)
+    [urgent] = jobs_for(FakeGuild(2), 1, start=1000, urgent=True)
+    scheduler.push(urgent)
+    assert scheduler.pop() == (urgent, None)
+
+
+def test_a_waiting_guild_is_passed_over():
+    slow, fast = FakeGuild(1), FakeGuild(2)
+    scheduler = FairScheduler(
+        delay=lambda guild_id: 2.5 if guild_id == 1 else 0.0)
+    for job in jobs_for(slow, 2) + jobs_for(fast, 2, start=1000):
+        scheduler.push(job)
+    assert [job.guild_id for job in drain(scheduler)] == [2, 2]
+    assert scheduler.pop() == (None, 2.5)
+    assert len(scheduler) == 2
+
+
+def test_promoted_jobs_are_counted_and_served_once():
+    guild = FakeGuild(1)
+    scheduler = FairScheduler()
+    backlog = jobs_for(guild, 5)
+    for job in backlog:
+        scheduler.push(job)
+    assert scheduler.pop() == (backlog[0], None)
+    scheduler.promote(backlog[3])
+    assert len(scheduler) == 4
+    assert scheduler.pop() == (backlog[3], None)
+    assert len(scheduler) == 3
+    assert drain(scheduler) == [backlog[1], backlog[2], backlog[4]]
+    assert len(scheduler) == 0
+    assert scheduler.stale == 0
+
+
+def test_pop_more_skips_promoted_jobs():
+    guild = FakeGuild(1)
+    scheduler = FairScheduler()
+    backlog = jobs_for(guild, 6)
+    for job in backlog:
+        scheduler.push(job)
+    scheduler.promote(backlog[2])
+    first, _ = scheduler.pop()
+    assert first is backlog[2]
+    job, _ = scheduler.pop()
+    more = scheduler.pop_more(job, 10)
+    assert [job] + more == [
+        backlog[0], backlog[1], backlog[3], backlog[4], backlog[5]]
+    assert len(scheduler) == 0
+    assert scheduler.pop() == (None, None)
+
+
+@pytest.mark.parametrize("bulk_size", [1, 200])
+def test_executor_promotes_a_queued_ban(bulk_size):
+    async def run():
+        guild = FakeGuild(1)
+        members = [FakeMember(index, f"m{index}", guild) for index in range(5)]
+        executor = BanExecutor(
+            QuietLogManager(), workers=1, dry_run=True, progress_every=0,
+            bulk_size=bulk_size)
+        executor.start()
+        for member in members:
+            executor.submit(member, 'rule')
+        assert executor.submit(members[4], 'rule', urgent=True) is None
+        assert len(executor.scheduler) == 5
+        assert len(executor.unfinished()) == 5
+        drained = await executor.drain(5.0)
+        await executor.close()
+        return drained, executor
+    drained, executor = asyncio.run(run())
+    assert drained
+    assert executor.stats['shadowed'] == 5
+    assert len(executor.scheduler) == 0
+
+
+def ban_all(members, **options):
+    async def run():
+        executor = BanExecutor(
+            QuietLogManager(), workers=1, rate=1000, burst=1000,
+            progress_every=0, **options)
+        executor.start()
+        for member in members:
+            executor.submit(member, 'rule')
+        await executor.join()
+        await executor.close()
+        return executor
+    return asyncio.run(run())
+
+
+def test_a_rate_limited_ban_is_retried_after_backing_off():
+    guild = FakeGuild(1)
+    headers = {
+        'Retry-After': "0", 'X-RateLimit-Limit': "4",
+        'X-RateLimit-Remaining': "0", 'X-RateLimit-Reset-After': "0.02"}
+    limited = RateLimitedMember(1, guild, 2, headers)
+    other = FakeMember(2, "member 2", guild)
+    executor = ban_all([limited, other], backoff=0.01)
+    assert executor.stats['rate_limited'] == 2
+    assert executor.stats['banned'] == 2
+    assert sorted(ban[0] for ban in guild.bans) == [1, 2]
+    bucket = executor.buckets[1]
+    assert bucket.capacity == 4.0  # from the 429's headers
+    assert bucket.blocked_until > 0.0  # backed off, not retried at once
+    assert not executor.pending
+
+
+def test_a_ban_still_rate_limited_after_its_retries_fails():
+    guild = FakeGuild(1)
+    member = RateLimitedMember(1, guild, 10)
+    executor = ban_all([member], backoff=0.001, max_retries=2)
+    assert executor.stats['rate_limited'] == 2
+    assert executor.stats['failed'] == 1
+    assert not guild.bans
+
+
+def test_retried_jobs_go_back_to_the_head_of_their_queue():
+    guild = FakeGuild(1)
+    executor = BanExecutor(QuietLogManager(), workers=0)
+
+    async def retry():
+        executor.start()
+        jobs = [executor.submit(member, 'rule') for member in (
+            FakeMember(index, f"member {index}", guild)
+            for index in range(4))]
+        taken = [executor.scheduler.pop()[0] for _ in range(2)]
+        for job in taken:
+            job.running = True
+        executor._retry(taken)  # pylint: disable=protected-access
+        return jobs, taken
+    jobs, taken = asyncio.run(retry())
+    assert not any(job.running for job in taken)
+    assert drain(executor.scheduler) == jobs
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+FargAble resolves arguments exactly as `oara_argkwarg` does.
+"""
+import pytest
+from frozendict import frozendict
+
+from common.assist import kwargset, oara_argkwarg
+from common.fargable import FargAble
+
+
+class Mail(FargAble, kwargset):
+    _rargs = ('to', 'subject')
+    _oargs = ('host', 'port', 'sender')
+
+
+class Converted(FargAble, kwargset):
+    _rargs = ('to',)
+    _oargs = ('port', 'retries', 'host')
+    # Callable defaults convert what is passed, or are called for a value.
+    _FargAble__odefs = frozendict({'port': int, 'retries': lambda: 3})
+
+
+def reference(instance, args, kwargs):
+    """What the original FargAble resolved: `oara_argkwarg` over the
+    instance's declared arguments."""
+    return oara_argkwarg(
+        instance.oargs, req_args=instance.rargs, opt_defaults=instance.odefs,
+        *args, **dict(kwargs))
+
+
+@pytest.mark.parametrize("cls, args, kwargs", [
+    # positional
+    (Mail, ("ops@example.com", "hi"), {}),
+    (Mail, ("ops@example.com", "hi", "smtp.example.com", 25), {}),
+    # keyword
+    (Mail, (), {'to': "ops@example.com", 'subject': "hi", 'port': 587}),
+    # positional values skip over the names given as keywords
+    (Mail, ("ops@example.com", "smtp.example.com"), {'subject': "hi"}),
+    # names nobody declared pass straight through
+    (Mail, ("ops@example.com", "hi"), {'password': "secret"}),
+    # callable defaults: converting, and called for a missing value
+    (Converted, ("ops@example.com",), {}),
+    (Converted, ("ops@example.com",), {'port': "2525"}),
+    (Converted, (), {'to': "ops@example.com", 'retries': 5}),
+    (Converted, ("ops@example.com", "465"), {}),
+    # a conversion that fails leaves the default in place
+    (Converted, ("ops@example.com",), {'port': "not a port"}),
+])
+def test_fargs_match_oara_argkwarg(cls, args, kwargs):
+    instance = cls(*args, **dict(kwargs))
+    assert instance.fargs == reference(instance, args, kwargs)
+    # Built once, cached after; the cache gives the same answer.
+    assert instance.fargs == reference(instance, args, kwargs)
+
+
+@pytest.mark.parametrize("cls, args, kwargs", [
+    (Mail, (), {}),
+    (Mail, ("ops@example.com",), {}),
+    (Mail, (), {'subject': "hi"}),
+    (Converted, (), {'port': 25}),
+])
+def test_missing_required_arguments_raise(cls, args, kwargs, capsys):
+    with pytest.raises(TypeError) as raised:
+        cls(*args, **dict(kwargs))
+    with pytest.raises(TypeError) as expected:
+        oara_argkwarg(
+            cls._oargs, *args, req_args=cls._rargs, **dict(kwargs))
+    # Both count the arguments the same way; only the caller's name in
+    # the message differs.
+    assert str(raised.value).split(" expected ")[1] == (
+        str(expected.value).split(" expected ")[1])
+    capsys.readouterr()
+
+
+def test_fargs_follow_a_changed_request():
+    instance = Mail("ops@example.com", "hi")
+    instance.request['kwargs']['port'] = 465
+    assert instance.fargs['port'] == 465
+    instance.oargs = ['host']
+    assert instance.fargs == reference(
+        instance, ("ops@example.com", "hi"), {'port': 465})
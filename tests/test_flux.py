@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+The timezone offset index behind possible_timezones and likely_tz.
+"""
+import datetime
+import json
+
+import delorean
+import pytest
+
+from common import flux
+from common.flux import (
+    FAVORED_TZ_NAMES, NewDelorean, likely_tz, possible_timezones,
+    timezone_index)
+
+
+def scan_timezones(tz_offset):
+    """possible_timezones as it was, walking every zone on each call."""
+    desired = datetime.timedelta(seconds=int(tz_offset * 3600))
+    null_delta = datetime.timedelta(0)
+    results = []
+    for tz_name in delorean.dates.pytz.common_timezones:
+        tz = delorean.dates.pytz.timezone(tz_name)
+        if getattr(tz, '_transition_info', [[null_delta]])[-1][0] == desired:
+            results.append(tz_name)
+    return results
+
+
+@pytest.fixture
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(flux, '_TZ_INDEX', {})
+
+
+def test_index_matches_a_scan_of_every_zone():
+    for offset_seconds, tz_names in timezone_index().items():
+        scanned = scan_timezones(offset_seconds / 3600)
+        favored = sorted(set(scanned) & FAVORED_TZ_NAMES)
+        assert tz_names == scanned + favored[:1], offset_seconds
+
+
+@pytest.mark.parametrize("tz_offset, tz_name", [
+    (5.75, 'Asia/Kathmandu'),
+    (8.75, 'Australia/Eucla'),
+    (-3.5, 'America/St_Johns'),
+])
+def test_quarter_and_half_hour_offsets(tz_offset, tz_name):
+    assert tz_name in possible_timezones(tz_offset)
+    assert likely_tz(tz_offset) in possible_timezones(tz_offset)
+
+
+def test_an_unknown_offset():
+    assert possible_timezones(3.1) == []
+    assert likely_tz(3.1) is None
+
+
+@pytest.mark.parametrize("tz_offset, tz_name", [
+    (1, 'Europe/Paris'),
+    (9, 'Asia/Tokyo'),
+    (-11, 'Pacific/Midway'),
+])
+def test_a_favored_name_comes_last(tz_offset, tz_name):
+    assert possible_timezones(tz_offset)[-1] == tz_name
+    assert likely_tz(tz_offset) == tz_name
+
+
+def test_favored_names_sharing_an_offset_pick_the_first_sorted():
+    for tz_names in timezone_index().values():
+        favored = sorted(set(tz_names) & FAVORED_TZ_NAMES)
+        if len(favored) > 1:
+            assert tz_names[-1] == favored[0]
+
+
+def test_callers_get_a_copy():
+    possible_timezones(1).append("Not/A_Zone")
+    assert "Not/A_Zone" not in possible_timezones(1)
+
+
+def test_index_cache_file(tmp_path, monkeypatch, fresh_index):
+    cache = tmp_path / "tz_index.json"
+    monkeypatch.setattr(flux, 'TZ_INDEX_CACHE', str(cache))
+    built = timezone_index()
+    with open(cache) as cache_file:
+        cached = json.load(cache_file)
+    assert cached['pytz'] == delorean.dates.pytz.__version__
+
+    def no_build(common_only):
+        raise AssertionError("the cached index should have been read")
+    monkeypatch.setattr(flux, '_build_tz_index', no_build)
+    monkeypatch.setattr(flux, '_TZ_INDEX', {})
+    assert timezone_index() == built
+
+
+def test_index_cache_from_another_pytz_is_rebuilt(
+        tmp_path, monkeypatch, fresh_index):
+    cache = tmp_path / "tz_index.json"
+    with open(cache, "w") as cache_file:
+        json.dump({'pytz': "0.0", 'common': {"3600": ["Not/A_Zone"]}},
+                  cache_file)
+    monkeypatch.setattr(flux, 'TZ_INDEX_CACHE', str(cache))
+    assert possible_timezones(1)[-1] == 'Europe/Paris'
+
+
+def test_a_numeric_offset_localizes_like_its_zone_name():
+    when = datetime.datetime(2020, 1, 1, 12)
+    by_offset = NewDelorean(when, timezone=1)
+    by_name = NewDelorean(when, timezone='Europe/Paris')
+    assert by_offset.timezone.zone == 'Europe/Paris'
+    assert by_offset.datetime == by_name.datetime
+    assert NewDelorean(timezone=5.75).timezone.zone == 'Asia/Kathmandu'
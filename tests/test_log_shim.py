@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+PipelineHandler: records handed to its listener thread reach the log.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+
+from common.log_shim import LoggingShim, PipelineHandler, flush_pipelines
+
+
+LINES = 2000
+
+
+def log_and_exit(path):
+    """Log through a pipeline, then leave the way a shard process does."""
+    handler = PipelineHandler(logging.FileHandler(path))
+    shim = LoggingShim()
+    for index in range(LINES):
+        handler.handle(shim.make_record("INFO", "line %s", (index,)))
+    flush_pipelines()
+
+
+def test_forked_process_writes_every_line_before_exiting(tmp_path):
+    path = tmp_path / "shard.log"
+    # Process.start under fork ends the child in os._exit, skipping
+    # logging.shutdown.
+    process = multiprocessing.get_context('fork').Process(
+        target=log_and_exit, args=(str(path),))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+    lines = path.read_text().splitlines()
+    assert lines == [f"line {index}" for index in range(LINES)]
+
+
+def test_records_after_a_flush_start_a_new_listener(tmp_path):
+    path = tmp_path / "daemon.log"
+    target = logging.FileHandler(str(path))
+    handler = PipelineHandler(target)
+    shim = LoggingShim()
+    handler.handle(shim.make_record("INFO", "before"))
+    handler.flush()
+    assert path.read_text().splitlines() == ["before"]
+    handler.handle(shim.make_record("WARNING", "after {}", ("flush",)))
+    handler.close()
+    target.close()
+    assert path.read_text().splitlines() == ["before", "after flush"]
+
+
+class ParentGate(logging.FileHandler):
+    """Holds the parent's listener on its first record, so the rest are
+    still queued when it forks."""
+
+    def __init__(self, path, released):
+        super().__init__(path)
+        self.parent = os.getpid()
+        self.released = released
+
+    def emit(self, record):
+        if os.getpid() == self.parent:
+            self.released.wait(30)
+        super().emit(record)
+
+
+def log_once_and_exit(handler):
+    handler.handle(LoggingShim().make_record("INFO", "child"))
+    flush_pipelines()
+
+
+def test_a_forked_process_leaves_the_parents_records_to_it(tmp_path):
+    path = tmp_path / "daemon.log"
+    released = threading.Event()
+    target = ParentGate(str(path), released)
+    handler = PipelineHandler(target)
+    shim = LoggingShim()
+    for index in range(5):
+        handler.handle(shim.make_record("INFO", "parent %s", (index,)))
+    process = multiprocessing.get_context('fork').Process(
+        target=log_once_and_exit, args=(handler,))
+    process.start()
+    process.join(30)
+    released.set()
+    handler.close()
+    target.close()
+    lines = path.read_text().splitlines()
+    assert sorted(lines) == ["child"] + [
+        f"parent {index}" for index in range(5)]
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+MailQueue and PooledSMTPConnection against a local stand-in SMTP server.
+"""
+import email
+import socketserver
+import threading
+import time
+
+import pytest
+
+from common.mail_relay import MailQueue, PooledSMTPConnection
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: no auth, no TLS."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if server.hang_up.is_set():
+                # Drop the connection mid-session, as a server restart or
+                # an idle timeout on its side would.
+                server.hang_up.clear()
+                return
+            command = line.decode('ascii').strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-stub")
+                self.reply("250 8BITMIME")
+            elif command.startswith("DATA"):
+                self.reply("354 go ahead")
+                lines = []
+                for data in iter(self.rfile.readline, b""):
+                    if data == b".\r\n":
+                        break
+                    lines.append(data)
+                with server.lock:
+                    server.messages.append(
+                        email.message_from_bytes(b"".join(lines)))
+                self.reply("250 queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.hang_up = threading.Event()
+
+
+@pytest.fixture
+def smtp_server():
+    server = StubSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def connection_to(server):
+    host, port = server.server_address
+    return PooledSMTPConnection(host, port, starttls=False, timeout=5)
+
+
+def test_connection_is_reused(smtp_server):
+    connection = connection_to(smtp_server)
+    for index in range(3):
+        connection.sendmail(
+            "bot@example.com", ["ops@example.com"],
+            f"Subject: {index}\r\n\r\nbody {index}\r\n")
+    connection.close()
+    assert smtp_server.connections == 1
+    assert [message['Subject'] for message in smtp_server.messages] == [
+        "0", "1", "2"]
+
+
+def test_reconnects_after_server_drops_connection(smtp_server):
+    connection = connection_to(smtp_server)
+    connection.sendmail(
+        "bot@example.com", ["ops@example.com"], "Subject: one\r\n\r\n1\r\n")
+    smtp_server.hang_up.set()
+    connection.sendmail(
+        "bot@example.com", ["ops@example.com"], "Subject: two\r\n\r\n2\r\n")
+    connection.close()
+    assert smtp_server.connections == 2
+    assert [message['Subject'] for message in smtp_server.messages] == [
+        "one", "two"]
+
+
+def test_reconnects_after_idle_timeout(smtp_server):
+    connection = connection_to(smtp_server)
+    connection.idle_timeout = 0
+    for index in range(2):
+        connection.sendmail(
+            "bot@example.com", ["ops@example.com"],
+            f"Subject: {index}\r\n\r\n{index}\r\n")
+    connection.close()
+    assert smtp_server.connections == 2
+    assert len(smtp_server.messages) == 2
+
+
+def test_burst_is_sent_as_one_digest(smtp_server):
+    mail = MailQueue(
+        connection_to(smtp_server), "bot@example.com",
+        ["ops@example.com", "oncall@example.com"], digest_window=0.5)
+    for index in range(3):
+        mail.notify(f"Banned member {index}", f"details {index}")
+    mail.close(timeout=10)
+    assert mail.sent == 3
+    assert smtp_server.connections == 1
+    [digest] = smtp_server.messages
+    assert digest['Subject'] == "[3 notifications] Banned member 0"
+    assert digest['To'] == "ops@example.com, oncall@example.com"
+    body = digest.get_payload(decode=True).decode('utf-8')
+    assert all(f"details {index}" in body for index in range(3))
+
+
+def test_lone_notification_is_sent_as_is(smtp_server):
+    mail = MailQueue(
+        connection_to(smtp_server), "bot@example.com", "ops@example.com",
+        digest_window=0.1)
+    mail.notify("Ban-h0nde started", "started")
+    mail.close(timeout=10)
+    [message] = smtp_server.messages
+    assert message['Subject'] == "Ban-h0nde started"
+    assert message.get_payload(decode=True).decode('utf-8') == "started"
+
+
+def test_notifications_across_windows_share_the_connection(smtp_server):
+    mail = MailQueue(
+        connection_to(smtp_server), "bot@example.com", "ops@example.com",
+        digest_window=0.05)
+    mail.notify("first", "1")
+    deadline = time.monotonic() + 10
+    while not smtp_server.messages and time.monotonic() < deadline:
+        time.sleep(0.01)
+    mail.notify("second", "2")
+    mail.close(timeout=10)
+    assert [message['Subject'] for message in smtp_server.messages] == [
+        "first", "second"]
+    assert smtp_server.connections == 1
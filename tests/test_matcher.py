@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+NameMatcher: the literal prefilter never changes what matches.
+"""
+import re
+
+import pytest
+
+from benchmarks import corpus
+from watcher.matcher import NameMatcher, diff_rules, leading_literal
+
+
+RULES = {
+    'twitter-h0nde': r"(?i)twitter\.com/h0nde",
+    'nitro': r"(?i)discord\.gg/(free)?nitro",
+    'invite': r"discord\.gg/[A-Za-z0-9]{6,}",
+    'case': r"SPAMBOT",
+    # its literal, "twitter.com/", is a prefix of the first rule's
+    'shared': r"(?i)twitter\.com/[a-z]+bot",
+    'branch': r"buy|sell",  # no literal to filter on
+    'quantified': r"ab?c",
+    # the same literal, once case-sensitive and once not
+    'lower': r"spambot",
+    'anycase': r"(?i)spambot",
+    'verbose': r"(?x) free \s* robux  # spaces are not literal here",
+}
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    (r"(?i)twitter\.com/h0nde", "twitter.com/h0nde"),
+    (r"discord\.gg/[a-z]+", "discord.gg/"),
+    (r"ab?c", "a"),
+    (r"buy|sell", ""),
+    (r"(group)", ""),
+    (r"\d+ coins", ""),
+    (r"(?x) free \s* robux", ""),
+    (r"(?ix)free", ""),
+])
+def test_leading_literal(pattern, literal):
+    assert leading_literal(pattern) == literal
+
+
+def brute_force(rules, name):
+    return [
+        rule_id for rule_id, pattern in rules.items()
+        if re.search(pattern, name)]
+
+
+@pytest.mark.parametrize("rules", [
+    RULES,
+    # Every rule prefiltered, so benign names take the one-scan path.
+    {rule_id: pattern for rule_id, pattern in RULES.items()
+     if rule_id != 'branch'},
+])
+def test_matches_what_every_regex_would(rules):
+    matcher = NameMatcher(rules)
+    names = list(corpus.generate(3000, 'raid', seed=3)) + [
+        "TWITTER.COM/H0NDE", "twitter.com/spambot", "discord.gg/nitro",
+        "discord.gg/AbC123x", "spambot", "SPAMBOT", "I sell", "ac abc",
+        "twitter.com/h0ndtwitter.com/h0nde", "free robux", "FREEROBUX",
+        "freerobux", " free robux", "twıtter.com/h0nde", "TWİTTER.COM/H0NDE",
+        "ſpambot", ""]
+    for name in names:
+        expected = brute_force(rules, name)
+        assert matcher.match_all(name) == expected, name
+        if expected:
+            assert matcher.match(name) in expected, name
+            assert matcher.prefilter(name), name
+        else:
+            assert matcher.match(name) is None, name
+
+
+def test_prefilter_passes_over_benign_names():
+    matcher = NameMatcher({
+        rule_id: pattern for rule_id, pattern in RULES.items()
+        if rule_id not in ('branch', 'quantified', 'verbose')})
+    assert not matcher.prefilter("just a regular member")
+    assert matcher.prefilter("see Twitter.com/whoever")
+
+
+def test_version_follows_the_rules_not_their_order():
+    reordered = dict(reversed(list(RULES.items())))
+    assert NameMatcher(RULES).version == NameMatcher(reordered).version
+    changed = dict(RULES, case="SPAMBOTS")
+    assert NameMatcher(changed).version != NameMatcher(RULES).version
+    assert diff_rules(RULES, changed) == (['case'], [])
+    assert diff_rules(changed, {'case': "SPAMBOTS"}) == (
+        [], [rule_id for rule_id in RULES if rule_id != 'case'])
+
+
+def test_verbose_rules_still_fire():
+    matcher = NameMatcher({'verbose': RULES['verbose']})
+    assert matcher.match("free   robux") == 'verbose'
+    assert matcher.match("free robux") == 'verbose'
+    assert matcher.match("fr ee robux") is None
+
+
+def test_case_folding_follows_the_regex_engine():
+    # `str.lower` keeps "ı" and "ſ" apart from "i" and "s"; `re` does not.
+    matcher = NameMatcher({'anycase': RULES['anycase']})
+    assert matcher.match("ſpambot") == 'anycase'
+    assert matcher.match_all("SPAMBOT") == ['anycase']
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics: bucket placement, the text format, the endpoint, and what the
+daemon counts.
+"""
+import asyncio
+import socket
+import urllib.request
+
+import pytest
+
+from benchmarks.fake_client import FakeClient
+from common.metrics import CONTENT_TYPE, Counter, Histogram, MetricsRegistry
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram(
+        "latency_seconds", "Latency.", buckets=(1.0, 0.1))
+    histogram.batch_size = 2  # some folded, some still pending
+    for value in (0.05, 0.1, 0.5, 5.0, 1.0):
+        histogram.observe(value)
+    assert len(histogram.pending) == 1
+    assert histogram.count == 5
+    assert histogram.render().splitlines() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 4',
+        'latency_seconds_bucket{le="+Inf"} 5',
+        "latency_seconds_sum 6.65",
+        "latency_seconds_count 5",
+    ]
+
+
+def test_histogram_keeps_labels_apart():
+    histogram = Histogram("h", "H.", ('guild',), buckets=(1.0,))
+    histogram.observe(0.5, (1,))
+    histogram.observe(2.0, (2,))
+    lines = histogram.render().splitlines()
+    assert 'h_bucket{guild="1",le="1"} 1' in lines
+    assert 'h_bucket{guild="2",le="1"} 0' in lines
+    assert 'h_count{guild="2"} 1' in lines
+
+
+def test_labelled_counter():
+    counter = Counter("matches_total", "Matches.", ('rule',))
+    assert counter.render().splitlines()[2:] == []  # no samples yet
+    counter.inc(('b',))
+    counter.inc(('a"\n',), 2)
+    counter.inc(('b',))
+    assert counter.render().splitlines()[2:] == [
+        'matches_total{rule="a\\"\\n"} 2',
+        'matches_total{rule="b"} 2',
+    ]
+    assert Counter("total", "Total.").render().endswith("\ntotal 0")
+
+
+def test_registry_refuses_a_name_twice():
+    registry = MetricsRegistry()
+    registry.counter("total", "Total.")
+    with pytest.raises(ValueError):
+        registry.gauge("total", "Total.")
+
+
+def port_is_free(port):
+    with socket.socket() as probe:
+        # as the server does, so a scrape just closed doesn't count
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            probe.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+
+def test_metrics_true_serves_the_registry(make_app):
+    if not port_is_free(9464):
+        pytest.skip("the default metrics port is in use")
+    app = make_app(metrics=True)
+    app.start_metrics()
+    try:
+        assert app.metrics_server is not None
+        app.metrics.screened.inc()
+        with urllib.request.urlopen(
+                "http://127.0.0.1:9464/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            body = response.read().decode('utf-8')
+    finally:
+        app.metrics_server.close()
+    assert "\nban_h0nde_members_screened_total 1\n" in body
+    assert "\nban_h0nde_known_clean_members 0\n" in body
+
+
+def test_metrics_are_off_by_default(make_app):
+    app = make_app()
+    app.start_metrics()
+    assert app.metrics_server is None
+
+
+def test_a_member_already_queued_is_counted_once(make_app):
+    app = make_app()
+    client = FakeClient.from_names(["twitter.com/h0nde"])
+    [member] = client.get_all_members()
+
+    async def join_then_rename():
+        app.executor.start()
+        app.screen_member(member, urgent=True)  # the join
+        member.nick = "twitter.com/h0nde"
+        app.screen_member(member, urgent=True)  # the update, still queued
+        await app.executor.close()
+    asyncio.run(join_then_rename())
+    assert app.metrics.matches.values == {('twitter-h0nde',): 1}
+    assert app.metrics.screened.values == {(): 2}
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+NameNormalizer: what folds to what, and what its cache reports.
+"""
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.fake_client import FakeClient
+from watcher.normalize import INVISIBLE_CHARS, NameNormalizer, fold_name
+
+
+@pytest.mark.parametrize("name, folded", [
+    ("twitter.com/h0nde", "twitter.com/h0nde"),
+    ("TWITTER.COM/H0NDE", "twitter.com/h0nde"),
+    # Cyrillic е and і
+    ("twіttеr.com/h0ndе", "twitter.com/h0nde"),
+    # fullwidth letters and full stop
+    ("ｔｗｉｔｔｅｒ．ｃｏｍ/ｈ0ｎｄｅ", "twitter.com/h0nde"),
+    # zero-width space, joiner and non-joiner, word joiner, BOM
+    ("tw\u200bit\u200dter\u200c.c\u2060om\ufeff/h0nde", "twitter.com/h0nde"),
+    ("Dіscord．Gg\u200d/Freenіtrо", "discord.gg/freenitro"),
+])
+def test_fold_name(name, folded):
+    assert fold_name(name) == folded
+
+
+@pytest.mark.parametrize("char", [
+    "\u00ad", "\u034f", "\u061c", "\u115f", "\u1160", "\u17b4", "\u180e",
+    "\u200b", "\u200f", "\u202a", "\u202e", "\u2060", "\u206f", "\u3164",
+    "\ufe00", "\ufe0f", "\ufeff", "\uffa0", "\U000e0001", "\U000e007f"])
+def test_invisible_chars_are_dropped(char):
+    assert INVISIBLE_CHARS.fullmatch(char)
+    assert fold_name(f"a{char}b") == "ab"
+
+
+def test_visible_chars_are_kept():
+    assert not INVISIBLE_CHARS.search("a b-c_d.e/f\u00a0")
+
+
+def test_cache_stats():
+    normalizer = NameNormalizer(cache_size=2)
+    assert normalizer.stats() == {
+        'hits': 0, 'misses': 0, 'cached': 0, 'hit_rate': 0.0}
+    for name in ("a", "a", "b", "a", "c", "b"):
+        normalizer(name)
+    # "b" was the least recently used when "c" came in.
+    assert normalizer.stats() == {
+        'hits': 2, 'misses': 4, 'cached': 2, 'hit_rate': 2 / 6}
+    normalizer.clear()
+    assert normalizer.stats()['cached'] == 0
+
+
+@pytest.mark.parametrize("name, lookups", [
+    ("twіttеr.com/h0ndе", 1),  # folded to match, once
+    ("twitter.com/h0nde", 0),  # matched as it is, never folded
+])
+def test_an_audited_match_is_folded_once(make_app, tmp_path, name, lookups):
+    app = make_app(audit={'flush_every': 1}, raid=False)
+    app.open_audit()
+    [member] = FakeClient.from_names([name]).get_all_members()
+
+    async def screen():
+        app.executor.start()
+        app.screen_member(member)
+        await app.executor.close()
+    asyncio.run(screen())
+    app.audit.close()
+    stats = app.normalizer.stats()
+    assert stats['hits'] + stats['misses'] == lookups
+    with open(tmp_path / "audit.jsonl") as audit_file:
+        [entry] = [json.loads(line) for line in audit_file]
+    assert entry['normalized'] == "twitter.com/h0nde"
+    assert entry['rule'] == 'twitter-h0nde'
+
+
+def test_a_join_is_folded_once_for_raids_and_rules(make_app):
+    app = make_app()
+    [member] = FakeClient.from_names(["a member"]).get_all_members()
+
+    async def join():
+        app.executor.start()
+        folded = app.observe_join(member)
+        app.screen_member(member, urgent=True, folded=folded)
+        await app.executor.close()
+    asyncio.run(join())
+    assert app.normalizer.stats()['misses'] == 1
+    assert app.normalizer.stats()['hits'] == 0
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Offline screening of exports, in parallel chunks.
+"""
+import csv
+import json
+
+from watcher.matcher import DEFAULT_RULES
+from watcher.offline import join_records, read_tasks, screen_file
+
+
+BAD = "twitter.com/h0nde"
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as export:
+        writer = csv.writer(export)
+        writer.writerow(["guild", "id", "name", "nick"])
+        writer.writerows(rows)
+
+
+def test_join_records_keeps_quoted_newlines_together():
+    lines = ['1,"two\n', 'lines ""quoted""",x\n', '2,plain,y\n', '3,"open\n']
+    records, pending = join_records(lines)
+    assert records == ['1,"two\nlines ""quoted""",x\n', '2,plain,y\n']
+    assert pending == ['3,"open\n']
+    records, pending = join_records(['still",z\n'], pending)
+    assert records == ['3,"open\nstill",z\n']
+    assert pending == []
+
+
+def test_chunks_end_on_record_boundaries(tmp_path):
+    export = tmp_path / "members.csv"
+    rows = [
+        [1, member_id, f"line one\nline two {member_id}", ""]
+        for member_id in range(50)]
+    write_csv(export, rows)
+    parsed = []
+    for _, header, records in read_tasks(export, 'csv', chunk_rows=3,
+                                         read_hint=64):
+        parsed.extend(csv.reader(records))
+        assert header == ["guild", "id", "name", "nick"]
+    assert [row[2] for row in parsed] == [row[2] for row in rows]
+
+
+def test_screen_file_with_multiline_names(tmp_path):
+    export = tmp_path / "members.csv"
+    rows = []
+    for member_id in range(200):
+        name = f"member {member_id}"
+        if member_id % 10 == 0:
+            name = f"follow\n{BAD} {member_id}"
+        elif member_id % 7 == 0:
+            name = f"a \"quoted\"\nname {member_id}"
+        rows.append([1, member_id, name, BAD if member_id == 3 else ""])
+    write_csv(export, rows)
+    output = tmp_path / "matches.jsonl"
+    totals = screen_file(
+        export, output, DEFAULT_RULES, processes=2, chunk_rows=7)
+    assert totals['screened'] == 200
+    with open(output, "r", encoding="utf-8") as matches:
+        matched = [json.loads(line) for line in matches]
+    assert [int(row['id']) for row in matched] == sorted(
+        [member_id for member_id in range(0, 200, 10)] + [3])
+    assert matched[0]['name'] == f"follow\n{BAD} 0"
+
+
+def test_screen_file_jsonl(tmp_path):
+    export = tmp_path / "members.jsonl"
+    with open(export, "w", encoding="utf-8") as lines:
+        for member_id in range(20):
+            name = BAD if member_id in (4, 9) else f"member {member_id}"
+            lines.write(json.dumps({'id': member_id, 'name': name}) + "\n")
+    output = tmp_path / "matches.csv"
+    totals = screen_file(export, output, DEFAULT_RULES, processes=1)
+    assert (totals['screened'], totals['matched']) == (20, 2)
+    with open(output, "r", encoding="utf-8", newline="") as matches:
+        assert [row['id'] for row in csv.DictReader(matches)] == ["4", "9"]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+RaidDetector: configuration, bursts, and forgetting quiet guilds.
+"""
+import json
+import re
+
+import pytest
+
+from common.log_shim import QuietLogManager
+from watcher.core_app import CoreApplication
+from watcher.raid import SHINGLE, WINDOW, RaidDetector
+
+
+@pytest.mark.parametrize("raid_config", [True, None, {}])
+def test_from_config_takes_true_for_the_defaults(raid_config):
+    raid = RaidDetector.from_config(raid_config)
+    assert raid.window == WINDOW
+    assert raid.shingle == SHINGLE
+
+
+def test_from_config_passes_every_setting_through():
+    raid = RaidDetector.from_config({'shingle': 4, 'window': 30})
+    assert raid.shingle == 4
+    assert raid.window == 30.0
+
+
+def test_similar_names_make_one_alert():
+    raid = RaidDetector(cluster_size=4, window=60.0)
+    alerts = [
+        raid.observe(1, f"join my server discord.gg/spam{index}", index)
+        for index in range(6)]
+    names = [alert for alert in alerts if alert is not None]
+    assert len(names) == 1
+    assert names[0].kind == 'names'
+    assert re.search(names[0].pattern, "JOIN MY SERVER discord.gg/spam99")
+
+
+def test_join_burst_alerts_once_a_window():
+    raid = RaidDetector(burst_joins=5, window=10.0)
+    alerts = [
+        raid.observe(1, f"member {index * 7919}", index * 0.1)
+        for index in range(12)]
+    # ("member ..." names are alike, so there may be a 'names' alert too.)
+    assert [alert.count for alert in alerts
+            if alert and alert.kind == 'joins'] == [5]
+    assert raid.join_rate(1, 1.2) == 12
+
+
+def test_quiet_guilds_are_evicted():
+    raid = RaidDetector(window=10.0)
+    for guild_id in range(100):
+        raid.observe(guild_id, f"member {guild_id}", 0.0)
+    assert len(raid.guilds) == 100
+    raid.observe(0, "member again", 5.0)
+    assert len(raid.guilds) == 100  # not a window since the last pass
+    raid.observe(1, "member later", 10.5)
+    # Only the guilds seen within the window before this join are kept.
+    assert sorted(raid.guilds) == [0, 1]
+    assert raid.join_rate(2, 10.5) == 0
+
+
+class App(CoreApplication):
+    log_mgr_class = QuietLogManager
+
+
+@pytest.mark.parametrize("raid_config", [True, {}])
+def test_raid_true_loads(tmp_path, raid_config):
+    App._sys_path = str(tmp_path)
+    with open(tmp_path / "settings.json", "w") as settings:
+        json.dump({'raid': raid_config, 'state_db': False}, settings)
+    app = App()
+    app.load_config()
+    assert isinstance(app.raid, RaidDetector)
+    assert app.raid_candidates_file == str(
+        tmp_path / "raid_candidates.json")
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Hot reloads: only what changed is screened again, and a ruleset that
+doesn't compile is never swapped in.
+"""
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.fake_client import FakeClient, FakeMember
+from watcher.matcher import NameMatcher
+from watcher.state_store import CLEAN, name_hash
+
+
+OLD_RULES = {'h0nde': r"(?i)twitter\.com/h0nde", 'nitro': r"free nitro"}
+NAMES = ["alice", "bob", "spam bot", "free nitro", "carol", "spam botte"]
+
+
+def write_rules(tmp_path, rules):
+    with open(tmp_path / "rules.json", "w") as rules_file:
+        json.dump(rules, rules_file)
+
+
+@pytest.fixture
+def loop():
+    """One loop for the whole test, as the executor's events are bound to
+    the loop they were made in."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def swept(make_app, tmp_path, loop):
+    """An app that has screened `NAMES` against `OLD_RULES`."""
+    write_rules(tmp_path, OLD_RULES)
+    app = make_app(raid=False, ban_rate=1000, ban_burst=1000)
+    client = app.client = FakeClient.from_names(NAMES)
+
+    async def sweep():
+        app.executor.start()
+        await app.sweep(client)
+        await app.executor.join()
+    loop.run_until_complete(sweep())
+    app.swept = True
+    yield app, client
+    loop.run_until_complete(app.executor.close())
+
+
+def reload(app, client, loop):
+    async def run():
+        await app.reload_rules(client)
+        await app.executor.join()
+    loop.run_until_complete(run())
+
+
+def banned(client):
+    return sorted(
+        member.name for member in client.get_all_members()
+        if any(ban[0] == member.id for ban in member.guild.bans))
+
+
+def test_an_added_rule_only_screens_the_clean_against_it(
+        swept, tmp_path, loop):
+    app, client = swept
+    assert banned(client) == ["free nitro"]
+    old_version = app.matcher.version
+    # Stored as clean, though an unchanged rule would match it: it is only
+    # screened against the new rule, so it stays.
+    [guild] = client.guilds
+    vouched = FakeMember(99, "free nitro too", guild)
+    guild.members.append(vouched)
+    app.state.record(
+        guild.id, vouched.id, name_hash(vouched.name, vouched.nick),
+        old_version, CLEAN)
+    app.state.flush()
+    new_rules = dict(OLD_RULES, spam=r"spam bot")
+    write_rules(tmp_path, new_rules)
+    screened_before = sum(app.metrics.screened.values.values())
+
+    reload(app, client, loop)
+    assert app.matcher.version == NameMatcher(new_rules).version
+    assert banned(client) == ["free nitro", "spam bot", "spam botte"]
+    # Everyone was looked at once more.
+    assert sum(app.metrics.screened.values.values()) == (
+        screened_before + len(NAMES) + 1)
+    # The verdicts now stand under the new ruleset only.
+    assert app.state.load(app.matcher.version) == 4
+    assert app.state.load(old_version) == 0
+
+
+def test_removing_rules_rebases_the_clean_verdicts(swept, tmp_path, loop):
+    app, client = swept
+    old_version = app.matcher.version
+    assert app.state.known_clean == len(NAMES) - 1
+    write_rules(tmp_path, {'h0nde': OLD_RULES['h0nde']})
+    screened_before = sum(app.metrics.screened.values.values())
+
+    reload(app, client, loop)
+    assert app.matcher.version != old_version
+    # Nobody is screened again, and everyone clean stays clean.
+    assert sum(app.metrics.screened.values.values()) == screened_before
+    assert app.state.load(app.matcher.version) == len(NAMES) - 1
+    assert banned(client) == ["free nitro"]
+
+
+def test_a_rule_that_does_not_compile_keeps_the_old_ruleset(
+        swept, tmp_path, loop):
+    app, client = swept
+    old_matcher = app.matcher
+    write_rules(tmp_path, dict(OLD_RULES, broken=r"spam (bot"))
+    reload(app, client, loop)
+    assert app.matcher is old_matcher
+    assert banned(client) == ["free nitro"]
+
+
+def test_an_unreadable_rules_file_keeps_the_old_ruleset(
+        swept, tmp_path, loop):
+    app, client = swept
+    old_matcher = app.matcher
+    with open(tmp_path / "rules.json", "w") as rules_file:
+        rules_file.write("{not json")
+    reload(app, client, loop)
+    assert app.matcher is old_matcher
+
+
+def test_a_reload_before_the_sweep_waits_for_it(make_app, tmp_path):
+    write_rules(tmp_path, OLD_RULES)
+    app = make_app(raid=False)
+    write_rules(tmp_path, dict(OLD_RULES, spam=r"spam bot"))
+    app.request_reload()  # no client or loop yet
+    assert app.reload_pending
+    app.client = FakeClient.from_names(NAMES)
+
+    async def ready():
+        await app.apply_reload()
+        await app.executor.close()
+    asyncio.run(ready())
+    assert not app.reload_pending
+    assert 'spam' in app.matcher.patterns
+    # No sweep yet: the startup sweep screens everyone against it.
+    assert not app.executor.pending
+    assert app.state.known_clean == 0
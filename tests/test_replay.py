@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+End to end, against `benchmarks.fake_discord`: the daemon bans every member
+its rules match, through Discord's rate limits and a shard process dying.
+"""
+import pytest
+
+from benchmarks.fake_discord import synthetic_joins, synthetic_snapshot
+from benchmarks.replay import replay
+from watcher import shards
+
+
+STORM_DELAY = 1.0
+TIMEOUT = 60.0
+
+
+def run(members, joins=100, guild_count=3, **options):
+    guilds = synthetic_snapshot(members, guild_count, seed=1)
+    storm = synthetic_joins(joins, sorted(guilds), rate=500.0, seed=1)
+    return replay(
+        guilds, storm, storm_delay=STORM_DELAY, timeout=TIMEOUT, **options)
+
+
+@pytest.mark.parametrize("bulk_ban", [True, False])
+def test_every_match_is_banned_once(bulk_ban):
+    result = run(600, bulk_ban=bulk_ban)
+    assert result['expected'] > 0
+    assert result['banned'] == result['expected']
+    assert result['bans'] == result['expected']
+    assert result['join_latency_ms']
+    assert result['requests']['chunk'] >= result['guilds']
+    if bulk_ban:
+        assert result['requests'].get('bulk-ban')
+    else:
+        assert result['requests']['ban'] >= result['expected']
+
+
+def test_streamed_members_are_all_screened():
+    result = run(600, settings={'stream_members': True})
+    assert result['banned'] == result['expected']
+    # Paged in over REST, not requested from the gateway in chunks.
+    assert result['requests']['members'] >= result['guilds']
+    assert 'chunk' not in result['requests']
+    assert result['screened'] >= result['members'] + result['joins']
+
+
+def test_rate_limits_are_waited_out():
+    # Single bans only, a tight limit, and 429s nothing warned of.
+    result = run(
+        600, joins=50, bulk_ban=False, ban_limit=10, ban_period=1.0,
+        rate_limit_share=0.1)
+    assert result['banned'] == result['expected']
+    assert result['rate_limited'] > 0
+    # Each 429 reached the executor, and was retried.
+    assert result['retried'] == result['rate_limited']
+    assert result['requests']['ban'] >= (
+        result['bans'] + result['rate_limited'])
+    # Paced by the limit the headers reported, not the default.
+    assert result['ban_rates']
+    for rate in result['ban_rates'].values():
+        assert rate == pytest.approx(10.0, rel=0.1)
+
+
+def test_a_killed_shard_process_is_restarted(monkeypatch):
+    monkeypatch.setattr(shards, 'RESTART_BACKOFF', 0.2)
+    monkeypatch.setattr(shards, 'POLL_INTERVAL', 0.1)
+    result = run(
+        600, guild_count=4, kill_shard=0.2,
+        settings={'shard_count': 2, 'shard_processes': 2})
+    assert result['logins'] == {'0': 2, '1': 1}
+    assert result['banned'] == result['expected']
+    # Stopped through the supervisor well inside drain_timeout.
+    assert result['elapsed'] < TIMEOUT / 2
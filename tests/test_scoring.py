@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+MemberScorer: metadata features and scores, in plain Python and NumPy.
+"""
+import asyncio
+import datetime
+import pathlib
+import subprocess
+import sys
+import time
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.fake_client import FakeClient, FakeGuild, FakeMember
+from common.flux import NewDelorean
+from watcher import scoring
+from watcher.scoring import DISCORD_EPOCH, WEIGHTS, MemberScorer
+
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def member(index, made, joined=None, avatar=None, guild=None):
+    member_id = (int((made - DISCORD_EPOCH) * 1000) << 22) | index
+    joined_at = None if joined is None else (
+        datetime.datetime.utcfromtimestamp(joined))
+    return FakeMember(
+        member_id, f"member {index}", guild or FakeGuild(1), avatar=avatar,
+        joined_at=joined_at)
+
+
+def crowd(size=500):
+    guild = FakeGuild(1)
+    return [
+        FakeMember(member_id, f"member {index}", guild, joined_at=joined_at,
+                   avatar="a" if avatar else None)
+        for index, (member_id, joined_at, avatar) in enumerate(
+            corpus.accounts(size, time.time(), raid_share=0.3))]
+
+
+def test_features_of_a_raid_account_and_an_old_one():
+    now = time.time()
+    members = [member(index, now - 3600 + index, now - 3000)
+               for index in range(5)]
+    members.append(member(9, now - 3 * 365 * 86400, now - 86400, "a"))
+    features = MemberScorer().features(members, NewDelorean())
+    assert {name: bool(flags[0]) for name, flags in features.items()} == {
+        'young': True, 'no_avatar': True, 'quick_join': True,
+        'cohort': True}
+    assert not any(bool(flags[-1]) for flags in features.values())
+
+
+def test_default_weights_stop_short_of_a_ban():
+    now = time.time()
+    members = [member(index, now - 600, now - 500) for index in range(5)]
+    scorer = MemberScorer()
+    scores = scorer.score(members)
+    assert scores == [pytest.approx(sum(WEIGHTS.values()))] * 5
+    assert scorer.review_threshold <= scores[0] < scorer.ban_threshold
+
+
+def test_a_name_weight_is_refused():
+    # Members a rule matched are banned for it, and never scored on.
+    with pytest.raises(ValueError):
+        MemberScorer(weights={'name': 1.0})
+
+
+def test_pure_python_is_the_default_path(monkeypatch):
+    monkeypatch.setattr(scoring, 'numpy', None)
+    members = crowd()
+    features = MemberScorer().features(members)
+    assert all(isinstance(flags, list) for flags in features.values())
+    assert sum(MemberScorer().score(members)) > 0
+
+
+def test_numpy_matches_pure_python(monkeypatch):
+    pytest.importorskip('numpy')
+    members = crowd()
+    now = NewDelorean()
+    scorer = MemberScorer()
+    with_numpy = scorer.score(members, now)
+    monkeypatch.setattr(scoring, 'numpy', None)
+    assert scorer.score(members, now) == pytest.approx(with_numpy)
+
+
+def test_importing_scoring_leaves_flux_unloaded():
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, watcher.scoring\n"
+         "print(type(sys.modules['common.flux']).__name__)"],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '_LazyModule'
+
+
+
+def sweep(make_app, client, **scoring):
+    """Start up, sweep `client` once, and return the metadata flags."""
+    app = make_app(raid=False, scoring=dict({'batch_size': 100}, **scoring))
+
+    async def run():
+        app.executor.start()
+        await app.sweep(client)
+        await app.executor.close()
+    asyncio.run(run())
+    app.state.flush()
+    return dict(app.metrics.metadata_flags.values)
+
+
+def test_a_restart_does_not_flag_the_same_members_again(make_app):
+    members = crowd(300)
+    guild = members[0].guild
+    guild.members = members
+    client = FakeClient([guild])
+    flagged = sweep(make_app, client)[('review',)]
+    assert flagged > 0
+    assert sweep(make_app, client) == {}
+
+    # New metadata is looked at afresh...
+    scorer = MemberScorer()
+    raider = next(
+        member for member, score in zip(members, scorer.score(members))
+        if score >= scorer.review_threshold + WEIGHTS['no_avatar'])
+    raider.avatar = "a"
+    assert sweep(make_app, client) == {('review',): 1}
+    # ...and so is everyone, under new settings.
+    assert sweep(make_app, client, ban_threshold=1.5) == {
+        ('review',): flagged}
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+ShadowReport: what it counts, and what it times.
+"""
+from benchmarks.fake_client import FakeGuild, FakeMember
+from watcher.matcher import NameMatcher
+from watcher.shadow import ShadowReport
+
+
+def members(count, guild=None):
+    guild = guild or FakeGuild(1)
+    return [
+        FakeMember(index, f"member {index}", guild) for index in range(count)]
+
+
+def test_each_member_counts_once_per_ruleset():
+    current = NameMatcher({'a': "a"})
+    report = ShadowReport(current)
+    crowd = members(3)
+    for _ in range(2):
+        report.start_sweep()
+        for member in crowd:
+            report.observe(member, None)
+        report.end_sweep()
+    assert report.summary()['screened'] == 3
+    assert report.summary()['swept'] == 6
+
+    report.current = NameMatcher({'b': "b"})  # a reload
+    report.start_sweep()
+    report.observe(crowd[0], 'b')
+    report.end_sweep()
+    assert report.summary()['screened'] == 1
+    assert report.summary()['current'] == 1
+
+
+def test_rate_is_taken_over_sweeps_only():
+    report = ShadowReport(NameMatcher({'a': "a"}))
+    crowd = members(4)
+    report.observe(crowd[0], None)  # a join, before the sweep
+    assert report.summary()['elapsed'] == 0.0
+    assert report.summary()['rate'] == 0.0
+    report.start_sweep()
+    for member in crowd:
+        report.observe(member, None)
+    report.end_sweep()
+    summary = report.summary()
+    assert summary['swept'] == 4
+    assert 0.0 < summary['elapsed'] < 1.0
+    assert summary['rate'] == 4 / summary['elapsed']
+
+
+def test_compares_against_the_candidate_ruleset():
+    report = ShadowReport(
+        NameMatcher({'a': "a"}), NameMatcher({'b': "b"}))
+    crowd = members(3)
+    report.observe(crowd[0], 'a', 'b')
+    report.observe(crowd[1], 'a', None)
+    report.observe(crowd[2], None, 'b')
+    summary = report.summary()
+    assert summary['both'] == 1
+    assert summary['current_only'] == [(1, 1)]
+    assert summary['candidate_only'] == [(1, 2)]
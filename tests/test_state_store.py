@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+ScreeningStore: verdicts across rulesets, flushes and a small cache.
+"""
+import pytest
+
+from watcher.state_store import CLEAN, ScreeningStore, name_hash
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ScreeningStore(str(tmp_path / "screening.sqlite3"))
+    yield store
+    store.close()
+
+
+def record_guild(store, guild_id, count, ruleset='v1', verdict=CLEAN):
+    for member_id in range(count):
+        store.record(
+            guild_id, member_id, name_hash(f"member {member_id}"), ruleset,
+            verdict)
+
+
+def test_clean_under_the_same_names_only(store):
+    hashed = name_hash("alice", None)
+    store.record(1, 10, hashed, 'v1', CLEAN)
+    store.record(1, 11, name_hash("bob"), 'v1', 'rule')
+    assert store.is_clean(1, 10, hashed)
+    assert not store.is_clean(1, 10, name_hash("alice", "nick"))
+    assert not store.is_clean(1, 11, name_hash("bob"))
+    assert not store.is_clean(2, 10, hashed)  # another guild
+
+
+def test_verdicts_outlive_the_store(tmp_path):
+    path = str(tmp_path / "screening.sqlite3")
+    store = ScreeningStore(path, flush_every=3)
+    record_guild(store, 1, 10)
+    store.close()
+    reopened = ScreeningStore(path)
+    assert reopened.load('v1') == 10
+    assert reopened.is_clean(1, 9, name_hash("member 9"))
+    assert reopened.load('v2') == 0  # another ruleset's are dropped
+    assert not reopened.is_clean(1, 9, name_hash("member 9"))
+    reopened.close()
+
+
+def test_rebase_carries_clean_verdicts_over(store):
+    record_guild(store, 1, 5)
+    store.record(1, 99, name_hash("spam"), 'v1', 'rule')
+    store.rebase('v1', 'v2')
+    assert store.load('v2') == 5
+    assert not store.is_clean(1, 99, name_hash("spam"))
+
+
+def test_prefetch_stays_within_the_cache(tmp_path):
+    store = ScreeningStore(
+        str(tmp_path / "screening.sqlite3"), cache_size=100)
+    record_guild(store, 1, 1000)
+    record_guild(store, 2, 1000)
+    store.flush()
+    store.cached.clear()
+    keys = [(1, member_id) for member_id in range(50)]
+    store.prefetch(keys)
+    assert len(store.cached) == 50
+    assert all(store.is_clean(*key, name_hash(f"member {key[1]}"))
+               for key in keys)
+    for member_id in range(1000):
+        assert store.is_clean(2, member_id, name_hash(f"member {member_id}"))
+    assert len(store.cached) == 100
+    # A batch bigger than the cache is kept whole until it is read.
+    store.prefetch([(1, member_id) for member_id in range(500)])
+    assert len(store.cached) == 500
+    store.close()
+
+
+def test_known_clean_follows_new_verdicts(store):
+    record_guild(store, 1, 4)
+    assert store.known_clean == 0  # counted on `load`, then kept up
+    store.flush()
+    assert store.load('v1') == 4
+    hashed = name_hash("member 0")
+    assert store.is_clean(1, 0, hashed)
+    store.record(1, 0, hashed, 'v1', 'rule')
+    assert store.known_clean == 3
+    assert store.is_clean(1, 5, name_hash("new")) is False
+    store.record(1, 5, name_hash("new"), 'v1', CLEAN)
+    assert store.known_clean == 4
+
+
+def test_queued_bans_are_taken_once_per_guild(store):
+    store.save_queued([(1, 10, 'rule', 2.0), (1, 11, 'rule', 1.0),
+                       (2, 20, 'rule', 0.5)])
+    assert store.take_queued([1]) == [(1, 11, 'rule', 1.0),
+                                      (1, 10, 'rule', 2.0)]
+    assert store.take_queued([1]) == []
+    assert store.take_queued([1, 2]) == [(2, 20, 'rule', 0.5)]
+
+
+def test_score_verdicts_outlive_the_store(tmp_path):
+    path = str(tmp_path / "screening.sqlite3")
+    store = ScreeningStore(path)
+    store.record_score(1, 10, "abc", 'review')
+    assert store.scored([(1, 10), (1, 11), (2, 10)]) == {
+        (1, 10): ("abc", 'review')}
+    store.close()
+    reopened = ScreeningStore(path)
+    assert reopened.load('v2') == 0  # not tied to the name ruleset
+    assert reopened.scored([(1, 10)]) == {(1, 10): ("abc", 'review')}
+    reopened.close()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Line-delimited JSON audit trail of screening decisions.
+
+Entries are buffered and written in batches, and at least every
+`flush_interval` seconds while the daemon's loop runs.  Once the live file
+grows past `max_bytes` or gets older than `max_age` seconds it is renamed
+with a timestamp and, optionally, compressed in a background thread, so a
+raid's worth of decisions can be reviewed offline without parsing syslog.
+"""
+import gzip
+import json
+import pathlib
+import shutil
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+AUDIT_FILE = "audit.jsonl"
+MAX_BYTES = 64 * 1024 * 1024
+MAX_AGE = 24 * 3600
+FLUSH_EVERY = 500
+FLUSH_INTERVAL = 5.0
+
+
+def _gzip(path):
+    with open(path, 'rb') as source, gzip.open(f"{path}.gz", 'wb') as target:
+        shutil.copyfileobj(source, target)
+    return f"{path}.gz"
+
+
+def _zstd(path):
+    compressor = zstandard.ZstdCompressor()
+    with open(path, 'rb') as source, open(f"{path}.zst", 'wb') as target:
+        compressor.copy_stream(source, target)
+    return f"{path}.zst"
+
+
+COMPRESSORS = {
+    'gzip': _gzip,
+    'zstd': _zstd,
+}
+
+
+class AuditLog:
+    """Buffered, rotating JSONL writer."""
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, path, max_bytes=MAX_BYTES, max_age=MAX_AGE,
+                 compress=None, flush_every=FLUSH_EVERY,
+                 flush_interval=FLUSH_INTERVAL):
+        if compress == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        if compress is not None and compress not in COMPRESSORS:
+            raise ValueError(f"Unknown audit compression: {compress}")
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._flushed = time.monotonic()
+        self._opened = time.time()
+        self._file = None
+        self._compressing = []
+
+    @classmethod
+    def from_config(cls, audit_config, sys_path, suffix=""):
+        """`suffix` keeps processes that share a config (shards) from
+        writing, and rotating, the same file.  `true` means the defaults."""
+        audit_config = dict(
+            audit_config if isinstance(audit_config, dict) else {})
+        path = pathlib.Path(audit_config.get(
+            'path', pathlib.os.path.join(sys_path, AUDIT_FILE)))
+        if suffix:
+            path = path.with_name(f"{path.stem}{suffix}{path.suffix}")
+        return cls(
+            path,
+            max_bytes=audit_config.get('max_bytes', MAX_BYTES),
+            max_age=audit_config.get('max_age', MAX_AGE),
+            compress=audit_config.get('compress'),
+            flush_every=audit_config.get('flush_every', FLUSH_EVERY),
+            flush_interval=audit_config.get(
+                'flush_interval', FLUSH_INTERVAL))
+
+    def record(self, **entry):
+        entry.setdefault('ts', time.time())
+        self._buffer.append(json.dumps(entry, ensure_ascii=False))
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush if `flush_interval` has passed since the last flush."""
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if self.path.stat().st_size == 0:
+                self._opened = time.time()
+            else:
+                self._opened = self.path.stat().st_mtime
+        return self._file
+
+    def flush(self):
+        self._flushed = time.monotonic()
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        audit_file = self._open()
+        audit_file.write("\n".join(lines))
+        audit_file.write("\n")
+        audit_file.flush()
+        if (audit_file.tell() >= self.max_bytes or
+                time.time() - self._opened >= self.max_age):
+            self.rotate()
+
+    def rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not self.path.exists() or not self.path.stat().st_size:
+            return None
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        rotated = self.path.with_name(
+            f"{self.path.stem}-{stamp}{self.path.suffix}")
+        counter = 1
+        while rotated.exists():
+            rotated = self.path.with_name(
+                f"{self.path.stem}-{stamp}.{counter}{self.path.suffix}")
+            counter += 1
+        self.path.rename(rotated)
+        self._compressing = [
+            worker for worker in self._compressing if worker.is_alive()]
+        if self.compress:
+            worker = threading.Thread(
+                target=self._compress, args=(rotated,),
+                name="audit-compress", daemon=True)
+            worker.start()
+            self._compressing.append(worker)
+        return rotated
+
+    def _compress(self, rotated):
+        COMPRESSORS[self.compress](str(rotated))
+        rotated.unlink()
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for worker in self._compressing:
+            worker.join()
+        self._compressing = []
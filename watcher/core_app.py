@@ -12,39 +12,75 @@
 4 - Invite bot to the servers you want to ban members from.
 5 - Wait until banning is done. Don't close the terminal. This may take a while.
 """
-# from json import load
-# import pathlib
+from json import dump, load
+import itertools
+import pathlib
 import re
+import signal
 import time
 
-import discord
-
 # from common.assist import coercelist, kwargset
-# from common.exceptions import NoConfiguration, ValidationError
-from common.get_path import BASE_DIR
-from common.log_shim import EmailLogManager
+from common.assist import lazy_import
+from common.control import (
+    DEFAULT_TIMEOUT, ControlServer, control_request)
+from common.exceptions import ControlError, NoConfiguration
+from common.log_shim import EmailLogManager, flush_pipelines
+from common.metrics import MetricsServer
+
+from watcher.audit import AuditLog
+from watcher.executor import BanExecutor
+from watcher.matcher import DEFAULT_RULES, NameMatcher, diff_rules
+from watcher.metrics import ScreeningMetrics
+from watcher.normalize import DEFAULT_CACHE_SIZE, NameNormalizer, fold_name
+from watcher.offline import screen_file
+from watcher.raid import RaidDetector
+from watcher.scoring import BATCH_SIZE, MemberScorer
+from watcher.settings import DRAIN_TIMEOUT, DaemonSettings
+from watcher.shadow import ShadowReport
+from watcher.shards import ShardSupervisor
+from watcher.state_store import (
+    CACHE_SIZE as STATE_CACHE_SIZE, CLEAN, STATE_DB, ScreeningStore,
+    name_hash)
 
+# discord.py (and aiohttp under it) and the event loop are only loaded once
+# a client is made, so stop, status and the offline screen don't pay for
+# them.
+asyncio = lazy_import('asyncio')
+discord = lazy_import('discord')
 
 TOKEN = ""      # Put your Bot token here
-BAD_NAME = re.compile(
-    r'.*([Tt][Ww][Ii][Tt]{2}[Ee][Rr]\.[Cc][Oo][Mm])(\/)[Hh]0[Nn][Dd][Ee].*')
+RULES_FILE = "rules.json"
+RAID_CANDIDATES_FILE = "raid_candidates.json"
+METADATA_RULE = "account-metadata"
+
 
-class CoreApplication(EmailLogManager):
+class CoreApplication(DaemonSettings, EmailLogManager):
     """Core Daemon/Service Application Logic"""
-    _svc_name_ = "ban_h0nde"
-    _svc_display_name_ = "Discord Bot to Ban h0nde"
-    _svc_description_ = "Ban any user found on the server with the wrong name"
-    _sys_path = BASE_DIR
     isrunning = False
-
-    @property
-    def sys_path(self):
-        return self._sys_path
+    matcher = None
+    normalizer = None
+    executor = None
+    state = None
+    audit = None
+    metrics = None
+    metrics_server = None
+    control = None
+    draining = False
+    stopping = False
+    started_at = None
+    shadow = None
+    raid = None
+    scorer = None
+    join_timer = None
+    swept = False
+    reload_pending = False
+    client = None
+    loop = None
+    supervisor = None
 
     def __init__(self, *args, **kwargs):
-        # self.settings_conf = pathlib.os.path.join(
-        #     self.sys_path, "settings.json")
         super().__init__(*args, **kwargs)
+        self.join_batch = []
 
     def normal_start_email(self):
         running_on = self.config.get('running_on', "DEFAULT")
@@ -59,34 +95,821 @@ class CoreApplication(EmailLogManager):
             "through user agency or normal server operations.",
             "[{deployed_context}] Ban-h0nde (on {running_on}) stopped")
 
-    def main(self):
-        client = discord.Client()
+    def screen_name(self, name, matcher=None):
+        """Return the id of the rule `name` falls foul of, or None.
+
+        The raw name is checked first so case-sensitive rules still apply,
+        then its folded form, which catches homoglyph and zero-width
+        variations.
+        """
+        return self.screen_folded(name, matcher)[0]
+
+    def screen_folded(self, name, matcher=None, folded=None):
+        """Like `screen_name`, but return `(rule_id, folded)`: `name` folded,
+        as passed in if the caller has it already, or None if the raw name
+        matched and never needed folding."""
+        if matcher is None:
+            matcher = self.matcher
+        rule_id = matcher.match(name)
+        if rule_id is None:
+            if folded is None:
+                folded = self.normalizer(name)
+            if folded != name:
+                rule_id = matcher.match(folded)
+        return rule_id, folded
+
+    def screen_member(self, member, skip_clean=False, delta=None,
+                      urgent=False, folded=None):
+        """Queue a ban for `member` if its name or nickname breaks a rule.
+
+        With `skip_clean`, a member the state store already found clean
+        under the current ruleset and the same names is not re-screened.
+        With a `delta` matcher, such a member is only checked against the
+        rules in it.  An `urgent` (live event's) ban goes ahead of any
+        sweep backlog.  `folded` is the member's name already folded, if
+        the caller has it.  Returns the id of the rule that matched, or
+        None.
+        """
+        if self.draining:
+            return None
+        started = time.perf_counter()
+        hashed = name_hash(member.name, member.nick)
+        guild_id = member.guild.id
+        matcher = self.matcher
+        if self.state.is_clean(guild_id, member.id, hashed):
+            if skip_clean:
+                self.metrics.skipped.inc()
+                self.metrics.screen_latency.observe(
+                    time.perf_counter() - started)
+                return None
+            if delta is not None:
+                matcher = delta
+        rule_id, folded = self.screen_folded(member.name, matcher, folded)
+        if rule_id is None and member.nick:
+            rule_id = self.screen_name(member.nick, matcher)
+        if rule_id is not None and (
+                self.executor.submit(member, rule_id, urgent) is not None):
+            # Not counted again if the member was already queued.
+            self.count_match(rule_id)
+        self.metrics.screened.inc()
+        latency = time.perf_counter() - started
+        self.metrics.screen_latency.observe(latency)
+        if self.shadow is not None:
+            self.screen_shadow(member, rule_id)
+        if self.audit is not None and (
+                rule_id is not None or self.config.get('audit_clean')):
+            if folded is None:
+                # Matched as it was; folded for the record alone, outside
+                # the cache so its hit rate only counts screening.
+                folded = fold_name(member.name)
+            self.audit.record(
+                event='screen', guild=guild_id, member=member.id,
+                name=member.name, nick=member.nick,
+                normalized=folded, rule=rule_id,
+                ruleset=self.matcher.version,
+                latency_ms=round(latency * 1000, 3),
+                outcome='clean' if rule_id is None else (
+                    'would-ban' if self.shadow is not None else 'queued'))
+        self.state.record(
+            guild_id, member.id, hashed, self.matcher.version,
+            CLEAN if rule_id is None else rule_id)
+        return rule_id
+
+    def count_match(self, rule_id):
+        """Count a match as a ban, or, in shadow mode, as one that would
+        have been."""
+        if self.shadow is None:
+            self.metrics.matches.inc((rule_id,))
+        else:
+            self.metrics.shadow_matches.inc((rule_id,))
+
+    def screen_shadow(self, member, rule_id):
+        """Tally a shadow verdict, screening the candidate ruleset too."""
+        candidate = self.shadow.candidate
+        candidate_rule_id = None
+        if candidate is not None:
+            candidate_rule_id = self.screen_name(member.name, candidate)
+            if candidate_rule_id is None and member.nick:
+                candidate_rule_id = self.screen_name(member.nick, candidate)
+            if candidate_rule_id is not None and self.audit is not None:
+                self.audit.record(
+                    event='shadow', guild=member.guild.id, member=member.id,
+                    name=member.name, nick=member.nick,
+                    rule=candidate_rule_id, ruleset=candidate.version,
+                    outcome='would-ban')
+        self.shadow.observe(member, rule_id, candidate_rule_id)
+
+    def screen_batch(self, members, skip_clean=False, delta=None):
+        """Screen `members` by name, then score them together on their
+        account metadata."""
+        self.state.prefetch(
+            [(member.guild.id, member.id) for member in members])
+        verdicts = [
+            self.screen_member(member, skip_clean, delta)
+            for member in members]
+        self.score_members(members, verdicts)
+
+    def score_members(self, members, verdicts, urgent=False):
+        """Score a batch of screened members, given the rule each matched
+        (or None), banning those the rules let through whose score reaches
+        the ban threshold and reporting those that reach the review one.
+
+        A member flagged the same way before, with the same metadata and
+        scoring settings, is passed over: it was banned or reported then.
+        """
+        scorer = self.scorer
+        if scorer is None or self.draining or not members:
+            return
+        flagged = [
+            (member, score, METADATA_RULE if score >= scorer.ban_threshold
+             else 'review')
+            for member, rule_id, score in zip(
+                members, verdicts, scorer.score(members))
+            if rule_id is None and score >= scorer.review_threshold]
+        if not flagged:
+            return
+        stored = self.state.scored(
+            [(member.guild.id, member.id) for member, _, _ in flagged])
+        for member, score, verdict in flagged:
+            joined_at = getattr(member, 'joined_at', None)
+            hashed = name_hash(
+                scorer.version, getattr(member, 'avatar', None),
+                joined_at and joined_at.isoformat())
+            if stored.get((member.guild.id, member.id)) == (hashed, verdict):
+                continue
+            self.state.record_score(
+                member.guild.id, member.id, hashed, verdict)
+            if verdict == METADATA_RULE:
+                if self.executor.submit(
+                        member, METADATA_RULE, urgent) is not None:
+                    self.count_match(METADATA_RULE)
+                outcome = (
+                    'would-ban' if self.shadow is not None else 'queued')
+            else:
+                outcome = 'review'
+                self.log_manager.LogInfoMsg(
+                    f"Review {member.name} ({member.id}) in guild "
+                    f"{member.guild.id}: account metadata scores "
+                    f"{score:.2f}")
+            self.metrics.metadata_flags.inc((outcome,))
+            if self.audit is not None:
+                self.audit.record(
+                    event='score', guild=member.guild.id, member=member.id,
+                    name=member.name, nick=member.nick, score=round(score, 3),
+                    rule=METADATA_RULE if outcome != 'review' else None,
+                    outcome=outcome)
+
+    def score_join(self, member, rule_id):
+        """Hold a screened join back to be scored with the ones that come
+        after it, so accounts made together are scored together; the batch
+        is scored once full or `join_delay` seconds after it was started."""
+        if self.scorer is None:
+            return
+        self.join_batch.append((member, rule_id))
+        if len(self.join_batch) >= self.scorer.batch_size:
+            self.flush_joins()
+        elif self.join_timer is None:
+            self.join_timer = asyncio.get_event_loop().call_later(
+                self.scorer.join_delay, self.flush_joins)
+
+    def flush_joins(self):
+        if self.join_timer is not None:
+            self.join_timer.cancel()
+            self.join_timer = None
+        batch, self.join_batch = self.join_batch, []
+        if batch:
+            members, verdicts = zip(*batch)
+            self.score_members(list(members), list(verdicts), urgent=True)
+
+    def observe_join(self, member):
+        """Feed a join to the raid detector, reporting any burst it
+        completes; returns the member's name folded, if it had to be."""
+        if self.raid is None:
+            return None
+        folded = self.normalizer(member.name)
+        alert = self.raid.observe(member.guild.id, folded, time.monotonic())
+        if alert is not None:
+            self.report_raid(alert)
+        return folded
+
+    def report_raid(self, alert):
+        message = alert.describe()
+        self.log_manager.LogWarningMsg(message)
+        self.metrics.raid_alerts.inc((alert.kind,))
+        if self.audit is not None:
+            self.audit.record(
+                event='raid', guild=alert.guild_id, kind=alert.kind,
+                count=alert.count, names=alert.names, rule=alert.rule_id,
+                pattern=alert.pattern)
+        if alert.pattern is not None:
+            self.add_raid_candidate(alert.rule_id, alert.pattern)
+        self.email_notify(
+            message, "[{deployed_context}] Ban-h0nde (on {running_on}) "
+            f"raid alert in guild {alert.guild_id}")
+
+    @property
+    def raid_candidates_file(self):
+        raid_config = self.config.get('raid')
+        if not isinstance(raid_config, dict):
+            raid_config = {}
+        return raid_config.get(
+            'candidates_file',
+            pathlib.os.path.join(self.sys_path, RAID_CANDIDATES_FILE))
+
+    def add_raid_candidate(self, rule_id, pattern):
+        """Add a signature the raid detector came up with to the candidate
+        rules file, in the rules file's format, for review; in shadow mode
+        it is screened as part of the candidate ruleset straight away."""
+        path = self.raid_candidates_file
+        try:
+            with open(path, "r") as candidates_file:
+                candidates = load(candidates_file)
+        except (OSError, ValueError):
+            candidates = {}
+        if rule_id in candidates:
+            return
+        candidates[rule_id] = pattern
+        try:
+            with open(f"{path}.tmp", "w") as candidates_file:
+                dump(candidates, candidates_file, indent=2)
+            pathlib.os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            self.log_manager.LogErrorMsg(
+                f"Unable to save candidate rule {rule_id} to {path}: {e}")
+        else:
+            self.log_manager.LogInfoMsg(
+                f"Candidate rule {rule_id} saved to {path} for review")
+        if self.shadow is not None:
+            candidate = self.shadow.candidate or self.matcher
+            self.shadow.candidate = NameMatcher(
+                dict(candidate.patterns, **{rule_id: pattern}))
+
+    def open_audit(self, shard_ids=None):
+        if self.config.get('audit', True) is False:
+            return
+        suffix = f"-shards-{shard_ids[0]}-{shard_ids[-1]}" if shard_ids else ""
+        self.audit = AuditLog.from_config(
+            self.config.get('audit'), self.sys_path, suffix)
+        self.executor.audit = self.audit
+
+    def flush_audit(self, loop):
+        """Flush the audit trail every `flush_interval` seconds, so a quiet
+        spell doesn't leave entries buffered until the next one."""
+        if self.audit is None:
+            return
+        self.audit.flush_if_due()
+        loop.call_later(
+            max(self.audit.flush_interval, 0.1), self.flush_audit, loop)
+
+    def start_metrics(self, shard_ids=None):
+        """Serve metrics if `metrics` is configured; each shard process
+        serves on the configured port plus its first shard id."""
+        metrics_config = self.config.get('metrics')
+        if not metrics_config:
+            return
+        if not isinstance(metrics_config, dict):
+            metrics_config = {}  # `true`: the defaults
+        port = metrics_config.get('port', 9464)
+        if shard_ids:
+            port += shard_ids[0]
+        self.metrics_server = MetricsServer(
+            self.metrics, metrics_config.get('host', "127.0.0.1"), port)
+        try:
+            self.metrics_server.start()
+        except OSError as e:
+            self.metrics_server = None
+            self.log_manager.LogErrorMsg(
+                f"Unable to serve metrics on port {port}: {e}")
+            return
+        self.log_manager.LogInfoMsg(f"Serving metrics on port {port}")
+
+    def start_control(self, shard_ids=None):
+        path = self.control_path(shard_ids)
+        if path is None:
+            return
+        self.control = ControlServer(path, {
+            'status': self.control_status,
+            'stop': self.request_stop,
+            'reload': self.request_reload,
+            'drain': self.request_drain,
+            'resume': self.request_resume,
+        })
+        try:
+            self.control.start()
+        except OSError as e:
+            self.control = None
+            self.log_manager.LogErrorMsg(
+                f"Unable to serve control socket {path}: {e}")
+            return
+        self.log_manager.LogInfoMsg(f"Serving control socket {path}")
+
+    def close_control(self):
+        if self.control is not None:
+            self.control.close()
+            self.control = None
+
+    def forward_to_shards(self, command, *args, shards=None,
+                          timeout=DEFAULT_TIMEOUT):
+        """Send a control command to every shard process (or to `shards`);
+        returns their results, or the error for each that couldn't be
+        reached."""
+        results = []
+        for shard in shards or self.supervisor.shards:
+            try:
+                result = control_request(
+                    self.control_path(shard.shard_ids), command, *args,
+                    timeout=timeout)
+            except (OSError, ControlError) as e:
+                result = {'error': str(e)}
+            if isinstance(result, dict):
+                result.setdefault('shards', shard.shard_ids)
+            results.append(result)
+        return results
+
+    def control_status(self):
+        """Live figures for `main.py status`."""
+        status = {
+            'pid': pathlib.os.getpid(),
+            'uptime': round(time.time() - (self.started_at or time.time())),
+            'draining': self.draining,
+            'shadow': self.shadow is not None,
+            'ruleset': self.matcher.version,
+            'rules': len(self.matcher),
+        }
+        if self.supervisor is not None:
+            status['shards'] = self.forward_to_shards('status', timeout=2.0)
+            for result, shard in zip(status['shards'], self.supervisor.shards):
+                process = shard.process
+                result['alive'] = process is not None and process.is_alive()
+            return status
+        client = self.client
+        executor = self.executor
+        depths = {} if executor is None else dict(
+            list(executor.depths.items()))
+        status.update({
+            'swept': self.swept,
+            'guilds': 0 if client is None else len(client.guilds),
+            'cached_members': 0 if client is None else sum(
+                len(guild.members) for guild in list(client.guilds)),
+            'screened': sum(list(self.metrics.screened.values.values())),
+            'skipped': sum(list(self.metrics.skipped.values.values())),
+            'matched': sum(list(self.metrics.matches.values.values())),
+            'shadow_matched': sum(
+                list(self.metrics.shadow_matches.values.values())),
+            'queue_depth': sum(depths.values()),
+            'queue_by_guild': {
+                str(guild_id): depth for guild_id, depth in depths.items()},
+            'bans': {} if executor is None else dict(
+                list(executor.stats.items())),
+            'known_clean': (
+                0 if self.state is None else self.state.known_clean),
+            'name_cache': self.normalizer.stats(),
+        })
+        return status
+
+    def request_stop(self):
+        """Shut down, from any thread: the ban queue is drained and the
+        client closed, and the main loop let run out."""
+        self.isrunning = False
+        client = self.client
+        if self.supervisor is None and client is not None and (
+                not self.stopping):
+            self.stopping = True
+            asyncio.run_coroutine_threadsafe(
+                self.shutdown(client), client.loop)
+        return {'pid': pathlib.os.getpid(), 'stopping': True}
+
+    async def shutdown(self, client):
+        """Stop screening, give the queued bans until `drain_timeout` to go
+        through, save whatever is left for the next run and close the
+        client."""
+        self.draining = True
+        executor = self.executor
+        try:
+            if executor is not None:
+                timeout = self.config.get('drain_timeout', DRAIN_TIMEOUT)
+                if not await executor.drain(timeout):
+                    self.log_manager.LogWarningMsg(
+                        f"{len(executor.pending)} ban(s) still queued after "
+                        f"{timeout}s")
+                await executor.close()
+                self.save_queued()
+        finally:
+            await client.close()
+
+    def save_queued(self):
+        """Persist the bans the executor didn't get to."""
+        jobs = self.executor.unfinished()
+        if not jobs or self.shadow is not None:
+            return
+        wall_offset = time.time() - time.monotonic()
+        self.state.save_queued(
+            (job.guild_id, job.member.id, job.rule_id,
+             job.queued + wall_offset)
+            for job in jobs)
+        self.log_manager.LogWarningMsg(
+            f"Saved {len(jobs)} unmade ban(s) to replay on the next start")
+
+    async def replay_queued(self, client):
+        """Re-screen, ahead of everyone else, the members whose bans the
+        last run shut down before making.  They are screened rather than
+        banned outright, in case the rules have changed since."""
+        saved = self.state.take_queued(guild.id for guild in client.guilds)
+        if not saved:
+            return
+        replayed = 0
+        for guild_id, member_id, _rule_id, _queued in saved:
+            guild = client.get_guild(guild_id)
+            member = guild.get_member(member_id)
+            if member is None:
+                try:
+                    member = await guild.fetch_member(member_id)
+                except discord.HTTPException:
+                    continue  # left, or already banned
+            if self.screen_member(member) is not None:
+                replayed += 1
+        self.log_manager.LogInfoMsg(
+            f"Replaying {replayed} of {len(saved)} ban(s) left queued "
+            f"at the last shutdown")
+
+    def handle_signals(self, loop):
+        """Have SIGTERM shut down gracefully instead of just stopping the
+        loop, which is what discord.py's `Client.run` sets it to do."""
+        try:
+            loop.add_signal_handler(signal.SIGTERM, self.request_stop)
+        except NotImplementedError:
+            pass
+
+    def request_drain(self, timeout=None):
+        """Stop screening and wait up to `timeout` seconds (by default
+        `drain_timeout`) for the bans already queued to be worked off."""
+        if timeout is None:
+            timeout = self.config.get('drain_timeout', DRAIN_TIMEOUT)
+        timeout = float(timeout)
+        started = time.monotonic()
+        self.draining = True
+        if self.supervisor is not None:
+            # Stop every shard screening first, then wait on each in turn.
+            self.forward_to_shards('drain', 0)
+            shards = []
+            for shard in self.supervisor.shards:
+                remaining = max(0.0, timeout - (time.monotonic() - started))
+                shards.extend(self.forward_to_shards(
+                    'drain', remaining, shards=[shard],
+                    timeout=remaining + DEFAULT_TIMEOUT))
+            return {
+                'drained': all(shard.get('drained') for shard in shards),
+                'elapsed': round(time.monotonic() - started, 3),
+                'shards': shards}
+        executor = self.executor
+        while (executor is not None and executor.pending and
+               time.monotonic() - started < timeout):
+            time.sleep(0.05)
+        pending = 0 if executor is None else len(executor.pending)
+        return {
+            'drained': not pending,
+            'pending': pending,
+            'elapsed': round(time.monotonic() - started, 3)}
+
+    def request_resume(self):
+        """Undo a drain: screen members again."""
+        self.draining = False
+        if self.supervisor is not None:
+            return {'shards': self.forward_to_shards('resume')}
+        return {'draining': False}
+
+    def open_state(self):
+        state_db = self.config.get(
+            'state_db', pathlib.os.path.join(self.sys_path, STATE_DB))
+        if self.shadow is not None:
+            # A shadow pass screens everyone and vouches for no one.
+            state_db = ":memory:"
+        self.state = ScreeningStore(
+            state_db, cache_size=self.config.get(
+                'state_cache_size', STATE_CACHE_SIZE))
+        known_clean = self.state.load(self.matcher.version)
+        self.log_manager.LogInfoMsg(
+            f"{known_clean} member(s) already screened clean "
+            f"by ruleset {self.matcher.version}")
+
+    def make_client(self, shard_ids=None, shard_count=None):
+        api_base = self.config.get('api_base')
+        if api_base:
+            # e.g. the local stand-in in benchmarks.fake_discord; the gateway
+            # URL is whatever this API hands out.
+            discord.http.Route.BASE = api_base.rstrip('/')
+        intents = discord.Intents.default()
+        intents.members = True  # join/update events and the member list
+        options = {'intents': intents}
+        if self.config.get('stream_members'):
+            # Members are paged in over REST for the startup sweep instead,
+            # so only cache those who join while we're connected: those are
+            # the ones name-change events matter for.
+            options['chunk_guilds_at_startup'] = False
+            options['member_cache_flags'] = discord.MemberCacheFlags.none()
+            options['member_cache_flags'].joined = True
+        if shard_count:
+            return discord.AutoShardedClient(
+                shard_ids=shard_ids, shard_count=shard_count, **options)
+        return discord.Client(**options)
+
+    async def sweep(self, client, skip_clean=True, delta=None):
+        """Screen every member of every guild the client can see."""
+        if self.shadow is not None:
+            self.shadow.start_sweep()
+        try:
+            await self._sweep(client, skip_clean, delta)
+        finally:
+            if self.shadow is not None:
+                self.shadow.end_sweep()
+
+    async def _sweep(self, client, skip_clean, delta):
+        batch_size = BATCH_SIZE if self.scorer is None else (
+            self.scorer.batch_size)
+        if not self.config.get('stream_members'):
+            members = client.get_all_members()
+            while True:
+                batch = list(itertools.islice(members, batch_size))
+                if not batch:
+                    break
+                self.screen_batch(batch, skip_clean, delta)
+            self.state.flush()
+            return
+        for guild in client.guilds:
+            screened = 0
+            batch = []
+            async for member in guild.fetch_members(limit=None):
+                batch.append(member)
+                if len(batch) >= batch_size:
+                    self.screen_batch(batch, skip_clean, delta)
+                    screened += len(batch)
+                    batch = []
+            self.screen_batch(batch, skip_clean, delta)
+            screened += len(batch)
+            self.state.flush()
+            self.log_manager.LogInfoMsg(
+                f"Screened {screened} member(s) of {guild.name}")
+
+    def request_reload(self):
+        """Reload the ruleset; safe to call from a signal handler.  Before
+        the client is ready, the reload waits for `on_ready`."""
+        if self.supervisor is not None:
+            self.supervisor.reload()
+            return
+        self.reload_pending = True
+        loop = self.loop
+        if loop is not None and self.client is not None:
+            loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self.apply_reload()))
+
+    async def apply_reload(self):
+        """Reload the ruleset if a reload has been asked for."""
+        if not self.reload_pending:
+            return
+        self.reload_pending = False
+        await self.reload_rules(self.client)
+
+    async def reload_rules(self, client):
+        """Swap in a freshly compiled matcher and re-screen against it.
+
+        Members already found clean are only checked against the rules that
+        were added or changed; everyone else is screened in full.
+        """
+        try:
+            matcher = NameMatcher(self.load_rules())
+        except (NoConfiguration, re.error) as e:
+            self.log_manager.LogErrorMsg(
+                f"Keeping ruleset {self.matcher.version}: {e}")
+            return
+        if matcher.version == self.matcher.version:
+            self.log_manager.LogInfoMsg(
+                f"Ruleset {matcher.version} is unchanged")
+            return
+        changed, removed = diff_rules(self.matcher.patterns, matcher.patterns)
+        previous, self.matcher = self.matcher, matcher
+        if self.shadow is not None:
+            self.shadow.current = matcher
+        self.log_manager.LogInfoMsg(
+            f"Loaded ruleset {matcher.version}: {len(changed)} rule(s) added "
+            f"or changed, {len(removed)} removed")
+        if not changed:
+            # Nobody clean before can match a subset of the same rules.
+            self.state.rebase(previous.version, matcher.version)
+            return
+        if not self.swept:
+            # The startup sweep will screen everyone against the new
+            # ruleset; no verdict the old one reached stands.
+            self.state.load(matcher.version)
+            return
+        delta = NameMatcher({
+            rule_id: matcher.patterns[rule_id] for rule_id in changed})
+        self.executor.start()
+        await self.sweep(client, skip_clean=False, delta=delta)
+        self.log_manager.LogInfoMsg(
+            f"Re-screened members against ruleset {matcher.version}")
+
+    def member_updated(self, before, after):
+        """Re-screen a member whose name or nickname changed, ahead of any
+        sweep backlog."""
+        if before.nick != after.nick or before.name != after.name:
+            self.executor.start()
+            self.screen_member(after, urgent=True)
+
+    def user_updated(self, client, before, after):
+        """Re-screen a renamed user in every guild `client` has it cached
+        in."""
+        if before.name == after.name:
+            return
+        self.executor.start()
+        for guild in client.guilds:
+            member = guild.get_member(after.id)
+            if member is not None:
+                self.screen_member(member, urgent=True)
+
+    def run_client(self, shard_ids=None, shard_count=None):
+        """Connect to the gateway and screen until the client is closed.
+
+        Called directly for a single process, or as the target of each
+        shard process in sharded mode.
+        """
+        self.supervisor = None  # in a shard process, the parent supervises
+        if shard_ids is not None:
+            # Forked: any loop the parent had would share its self-pipe,
+            # and so its signals, with every other shard process.
+            asyncio.set_event_loop(asyncio.new_event_loop())
+        self.started_at = time.time()
+        client = self.client = self.make_client(shard_ids, shard_count)
+        self.executor = BanExecutor.from_config(self.log_manager, self.config)
+        self.executor.metrics = self.metrics
+        self.executor.http = client.http
+        self.open_state()
+        self.open_audit(shard_ids)
+        self.start_metrics(shard_ids)
+        self.start_control(shard_ids)
+
         @client.event
         async def on_ready():
+            self.loop = asyncio.get_event_loop()
             self.log_manager.LogInfoMsg('Logged in!')
-            for member in client.get_all_members():
-                if not BAD_NAME.match(member.name):
-                    continue
-                await member.ban(
-                    reason="Banned by Ban-h0nde", delete_message_days=7)
-                self.log_manager.LogInfoMsg(f"Banned {member.display_name}!")
+            # Any reload asked for while connecting.
+            await self.apply_reload()
+            if self.swept:
+                # on_ready fires again after every reconnect; from the first
+                # sweep on, the member events keep screening current.
+                return
+            self.swept = True
+            self.executor.start()
+            await self.replay_queued(client)
+            await self.sweep(client)
+            await self.executor.join()
+            if self.audit is not None:
+                self.audit.flush()
+            self.executor.report_progress()
+            if self.shadow is not None:
+                for line in self.shadow.describe():
+                    self.log_manager.LogInfoMsg(line)
             self.log_manager.LogInfoMsg("Banning is complete!")
+            self.log_manager.LogInfoMsg(
+                "Name cache hit rate: {hit_rate:.1%} "
+                "({hits} hits, {misses} misses)".format(
+                    **self.normalizer.stats()))
+
+        @client.event
+        async def on_member_join(member):
+            self.executor.start()
+            folded = self.observe_join(member)
+            self.score_join(member, self.screen_member(
+                member, urgent=True, folded=folded))
+
+        @client.event
+        async def on_member_update(before, after):
+            self.member_updated(before, after)
+
+        @client.event
+        async def on_user_update(before, after):
+            self.user_updated(client, before, after)
+
+        # Runs once the loop is up, after `client.run` has installed its own
+        # signal handlers.
+        client.loop.call_soon(self.handle_signals, client.loop)
+        client.loop.call_soon(self.flush_audit, client.loop)
         try:
-            client.run(TOKEN)
-            while self.isrunning:
-                time.sleep(5)
+            client.run(self.config.get('token') or TOKEN)
+        finally:
+            self.isrunning = False
+            self.state.close()
+            if self.audit is not None:
+                self.audit.close()
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+            self.close_control()
+            # A shard process ends in `os._exit`, which would drop the
+            # shutdown lines still queued for the log.
+            flush_pipelines()
+
+    def main(self):
+        shard_count = self.config.get('shard_count')
+        shard_processes = self.config.get('shard_processes', 1)
+        self.started_at = time.time()
+        try:
+            if shard_count and shard_processes > 1:
+                self.supervisor = ShardSupervisor(
+                    self, shard_count, shard_processes)
+                self.start_control()
+                self.supervisor.run()
+            else:
+                self.run_client(shard_count=shard_count)
+                while self.isrunning:
+                    time.sleep(5)
         except Exception as e:
             msg = f"Caught exception: {e}\n"
             self.log_manager.LogInfoMsg(msg)
             self.email_notify(msg)
         finally:
+            self.close_control()
             running_on = self.config.get('running_on', "DEFAULT")
             stop_msg = f"Ban-h0nde (on {running_on}) is STOPPED."
             self.log_manager.LogInfoMsg(stop_msg)
         done_msg = "Banb-h0nde main process complete."
         self.log_manager.LogInfoMsg(done_msg)
 
+    def screen_export(self, export_path, output_path=None):
+        """Screen an exported member list without connecting to Discord,
+        writing the matches next to it unless `output_path` is given."""
+        if output_path is None:
+            export = pathlib.Path(export_path)
+            output_path = export.with_name(f"{export.stem}.matches.jsonl")
+        self.log_manager.LogInfoMsg(
+            f"Screening {export_path} with ruleset {self.matcher.version}")
+        totals = screen_file(
+            export_path, output_path, self.matcher.patterns,
+            cache_size=self.config.get('name_cache_size', DEFAULT_CACHE_SIZE),
+            processes=self.config.get('offline_processes'))
+        self.log_manager.LogInfoMsg(
+            f"Screened {totals['screened']} member(s) in "
+            f"{totals['elapsed']:.1f}s ({totals['rate']:,.0f}/s); "
+            f"{totals['matched']} matched {totals['by_rule']}, "
+            f"written to {output_path}")
+        return totals
+
+    @property
+    def rules_file(self):
+        return self.config.get(
+            'rules_file', pathlib.os.path.join(self.sys_path, RULES_FILE))
+
+    def load_rules(self):
+        """Rules from the ruleset file, falling back to the "rules" in
+        settings.json and then to the built-in rules."""
+        try:
+            with open(self.rules_file, "r") as rules_file:
+                return load(rules_file)
+        except FileNotFoundError:
+            return self.config.get('rules', DEFAULT_RULES)
+        except ValueError as e:
+            raise NoConfiguration(
+                f"Unable to parse {self.rules_file}: {e}") from e
+
+    def load_candidate_rules(self):
+        """Rules to compare against the current ones in a shadow pass,
+        from "candidate_rules_file" or "candidate_rules"; None if neither
+        is set."""
+        candidate_file = self.config.get('candidate_rules_file')
+        if candidate_file is None:
+            return self.config.get('candidate_rules')
+        try:
+            with open(candidate_file, "r") as rules_file:
+                return load(rules_file)
+        except (OSError, ValueError) as e:
+            raise NoConfiguration(
+                f"Unable to load {candidate_file}: {e}") from e
+
     def load_config(self):
-        # Check the git commit history for what was here before to read in
-        # settings from a json-formatted file.
-        self.config = {}
+        self.read_settings()
+        self.matcher = NameMatcher(self.load_rules())
+        self.normalizer = NameNormalizer(
+            self.config.get('name_cache_size', DEFAULT_CACHE_SIZE))
+        self.metrics = ScreeningMetrics(self)
+        self.log_manager.metrics = self.metrics
+        self.raid = None
+        if self.config.get('raid', True) is not False:
+            self.raid = RaidDetector.from_config(self.config.get('raid'))
+        self.scorer = None
+        if self.config.get('scoring'):
+            self.scorer = MemberScorer.from_config(self.config['scoring'])
+        self.shadow = None
+        if self.config.get('shadow'):
+            candidate_rules = self.load_candidate_rules()
+            self.shadow = ShadowReport(
+                self.matcher,
+                None if candidate_rules is None else NameMatcher(
+                    candidate_rules))
+            self.log_manager.LogWarningMsg(
+                "Shadow mode: matches are recorded, nobody will be banned")
+            if self.shadow.candidate is not None:
+                self.log_manager.LogInfoMsg(
+                    f"Comparing against candidate ruleset "
+                    f"{self.shadow.candidate.version} "
+                    f"({len(self.shadow.candidate)} rule(s))")
+        self.log_manager.LogInfoMsg(
+            f"Loaded {len(self.matcher)} screening rule(s), "
+            f"ruleset {self.matcher.version}")
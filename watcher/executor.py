@@ -0,0 +1,631 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent ban execution.
+
+Matches are queued as `BanJob`s, one queue per guild, and worked off by a
+bounded pool of asyncio workers.  Every guild gets its own `TokenBucket`,
+since Discord rate limits the ban route per guild.  Given the client's
+`http`, the executor sends the ban routes itself rather than through
+discord.py's `HTTPClient.request`, which waits out 429s on its own and
+keeps the headers to itself: so every response's `X-RateLimit-*` headers
+keep the bucket in step with Discord's, and when Discord answers 429
+anyway the job is retried with exponential backoff.
+
+Workers take jobs through a `FairScheduler`, a deficit round-robin over the
+guilds with work, so a sweep of one huge guild can't hold up the bans of
+every other; bans for live events (joins, name changes) go ahead of any
+sweep backlog, and a guild whose bucket is empty is passed over, rather
+than waited on, until it refills.
+
+Given the client's `http`, a worker that takes a job also takes whatever
+else is queued behind it in that guild, up to `bulk_size`, and bans them
+with one bulk-ban request; a guild that turns out not to support it (or
+not to grant the bot Manage Server, which it needs) falls back to banning
+one member at a time.
+"""
+import collections
+import time
+import urllib.parse
+
+from common.assist import lazy_import
+
+
+aiohttp = lazy_import('aiohttp')
+asyncio = lazy_import('asyncio')
+discord = lazy_import('discord')
+
+BAN_REASON = "Banned by Ban-h0nde"
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 5.0  # bans per second, per guild, until Discord says otherwise
+DEFAULT_BURST = 5
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+DEFAULT_QUANTUM = 1.0  # bans per guild per round, times the guild's weight
+BULK_BAN_MAX = 200  # user ids per bulk-ban request, the API's maximum
+# Bulk bans the guild doesn't do: no such route, or not allowed to use it.
+BULK_UNSUPPORTED = (403, 404, 405)
+BULK_NONE_BANNED = 500000  # error code when not one of the users was banned
+PROGRESS_EVERY = 100
+
+
+class TokenBucket:
+    """Token-bucket pacer; `acquire` waits until a token is available."""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST,
+                 clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token can be taken (0 if one is ready)."""
+        now = self.clock()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1.0:
+            wait = max(wait, (1.0 - self.tokens) / self.rate)
+        return wait
+
+    async def acquire(self):
+        wait = self.delay()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.delay()
+        self.take()
+
+    def take(self):
+        """Take a token `delay` said was ready."""
+        self.tokens -= 1.0
+
+    def retune(self, limit, period):
+        """Match the bucket to a limit reported by Discord."""
+        if limit > 0 and period > 0:
+            self.capacity = float(limit)
+            self.rate = limit / period
+            self.tokens = min(self.tokens, self.capacity)
+
+    def sync(self, limit, remaining, reset_after):
+        """Match the bucket to what a response said is left: `remaining`
+        of `limit` requests until the limit resets, `reset_after` seconds
+        from now."""
+        if limit < 1 or reset_after <= 0:
+            return
+        if remaining >= limit - 1:
+            # The first request of a window: it resets a window later.
+            self.retune(limit, reset_after)
+        else:
+            self.capacity = float(limit)
+        self.tokens = min(self.tokens, float(remaining))
+        if remaining < 1:
+            self.block(reset_after)
+
+    def block(self, seconds):
+        """Hand out no tokens for the next `seconds`."""
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+        self.tokens = 0.0
+
+
+class BanJob:
+    __slots__ = ['member', 'rule_id', 'attempts', 'queued', 'urgent',
+                 'running']
+
+    def __init__(self, member, rule_id, urgent=False):
+        self.member = member
+        self.rule_id = rule_id
+        self.attempts = 0
+        self.queued = time.monotonic()
+        self.urgent = urgent
+        self.running = False
+
+    @property
+    def guild_id(self):
+        return self.member.guild.id
+
+
+class GuildQueue:
+    """One guild's jobs, live-event (urgent) ones apart from the backlog,
+    with the deficit the scheduler keeps for each."""
+    __slots__ = ['jobs', 'deficits', 'weight']
+
+    def __init__(self, weight=1.0):
+        self.jobs = (collections.deque(), collections.deque())
+        self.deficits = [0.0, 0.0]
+        self.weight = weight
+
+
+class FairScheduler:
+    """Deficit round-robin between per-guild queues.
+
+    Guilds with work take turns; each turn a guild is credited `quantum`
+    times its weight and takes one job per whole credit, so with the
+    default weights every guild gets one ban per round however deep its
+    queue.  Urgent jobs are served, by the same rule, before any backlog.
+    `delay(guild_id)` says how long until a guild may ban again; guilds
+    that may not are passed over, and `pop` reports the shortest wait.
+
+    A backlog job promoted to urgent is queued again as such; its backlog
+    entry is left where it is, skipped when it comes up, and counted in
+    `stale` until then.
+    """
+    URGENT, BACKLOG = 0, 1
+
+    def __init__(self, delay=None, weights=None, quantum=DEFAULT_QUANTUM):
+        self.delay = delay or (lambda guild_id: 0.0)
+        self.weights = {
+            int(guild_id): float(weight)
+            for guild_id, weight in (weights or {}).items()}
+        if quantum <= 0 or any(
+                weight <= 0 for weight in self.weights.values()):
+            raise ValueError("Scheduler quantum and weights must be > 0")
+        self.quantum = quantum
+        self.guilds = {}  # guild id -> GuildQueue
+        self.rings = (collections.deque(), collections.deque())
+        self.stale = 0  # promoted jobs' entries left in the backlog
+
+    def push(self, job, front=False):
+        """Queue `job` by its urgency, at the back (or `front`) of its
+        guild's queue."""
+        guild_id = job.guild_id
+        try:
+            queue = self.guilds[guild_id]
+        except KeyError:
+            queue = self.guilds[guild_id] = GuildQueue(
+                self.weights.get(guild_id, 1.0))
+        level = self.URGENT if job.urgent else self.BACKLOG
+        jobs = queue.jobs[level]
+        if not jobs:
+            self.rings[level].append(guild_id)
+        if front:
+            jobs.appendleft(job)
+        else:
+            jobs.append(job)
+
+    def promote(self, job):
+        """Move `job`, queued in the backlog, up to the urgent queue."""
+        job.urgent = True
+        self.stale += 1
+        self.push(job)
+
+    def pop(self):
+        """Return (the next job, None), or (None, seconds until a guild
+        with work may ban again; None if no guild has work)."""
+        wait = None
+        for level, ring in enumerate(self.rings):
+            while ring:
+                short = False  # a guild had too little credit for a job
+                for _ in range(len(ring)):
+                    guild_id = ring[0]
+                    queue = self.guilds[guild_id]
+                    jobs = queue.jobs[level]
+                    if level == self.BACKLOG:
+                        # promoted to the urgent queue since being queued
+                        while jobs and jobs[0].urgent:
+                            jobs.popleft()
+                            self.stale -= 1
+                    if not jobs:
+                        ring.popleft()
+                        queue.deficits[level] = 0.0
+                        continue
+                    delay = self.delay(guild_id)
+                    if delay > 0:
+                        wait = delay if wait is None else min(wait, delay)
+                        ring.rotate(-1)
+                        continue
+                    if queue.deficits[level] < 1.0:
+                        queue.deficits[level] += self.quantum * queue.weight
+                    if queue.deficits[level] < 1.0:
+                        short = True
+                        ring.rotate(-1)
+                        continue
+                    queue.deficits[level] -= 1.0
+                    job = jobs.popleft()
+                    if not jobs:
+                        ring.popleft()
+                        queue.deficits[level] = 0.0
+                    elif queue.deficits[level] < 1.0:
+                        ring.rotate(-1)
+                    return job, None
+                if not short:
+                    break
+        return None, wait
+
+    def pop_more(self, job, limit):
+        """Up to `limit` more jobs from behind `job` in its guild's queue,
+        to go in the same request."""
+        level = self.URGENT if job.urgent else self.BACKLOG
+        jobs = self.guilds[job.guild_id].jobs[level]
+        if not jobs:
+            return []  # `pop` has taken the guild off the ring already
+        more = []
+        while jobs and len(more) < limit:
+            other = jobs.popleft()
+            if level == self.URGENT or not other.urgent:
+                more.append(other)
+            else:
+                self.stale -= 1
+        if not jobs:
+            self.rings[level].remove(job.guild_id)
+            self.guilds[job.guild_id].deficits[level] = 0.0
+        return more
+
+    def __len__(self):
+        return sum(
+            len(jobs) for queue in self.guilds.values()
+            for jobs in queue.jobs) - self.stale
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class BanExecutor:
+    """Bounded worker pool that bans queued members, paced per guild."""
+
+    def __init__(self, log_manager, workers=DEFAULT_WORKERS,
+                 rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 max_retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 reason=BAN_REASON, delete_message_days=7,
+                 progress_every=PROGRESS_EVERY, dry_run=False,
+                 guild_weights=None, quantum=DEFAULT_QUANTUM,
+                 bulk_size=BULK_BAN_MAX):
+        # pylint: disable=too-many-arguments
+        self.log_manager = log_manager
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.reason = reason
+        self.delete_message_days = delete_message_days
+        self.progress_every = progress_every
+        self.dry_run = dry_run
+        self.scheduler = FairScheduler(
+            None if dry_run else self._delay, guild_weights, quantum)
+        self.bulk_size = min(bulk_size, BULK_BAN_MAX)
+        self.http = None  # the client's HTTPClient, to send bans with
+        self.session = None  # made from `http` on the first request
+        self.bulk_unsupported = set()  # guild ids
+        self.buckets = {}
+        self.depths = collections.Counter()
+        self.stats = collections.Counter()
+        self.pending = {}  # (guild id, member id) -> BanJob
+        self.audit = None
+        self.metrics = None
+        self._tasks = []
+        self._wakeup = None  # set when there may be a job to take
+        self._idle = None  # set while nothing is pending
+
+    @classmethod
+    def from_config(cls, log_manager, config):
+        return cls(
+            log_manager,
+            workers=config.get('ban_workers', DEFAULT_WORKERS),
+            rate=config.get('ban_rate', DEFAULT_RATE),
+            burst=config.get('ban_burst', DEFAULT_BURST),
+            max_retries=config.get('ban_retries', DEFAULT_RETRIES),
+            backoff=config.get('ban_backoff', DEFAULT_BACKOFF),
+            delete_message_days=config.get('delete_message_days', 7),
+            dry_run=bool(config.get('shadow', False)),
+            guild_weights=config.get('guild_weights'),
+            quantum=config.get('ban_quantum', DEFAULT_QUANTUM),
+            bulk_size=config.get('bulk_ban_size', BULK_BAN_MAX))
+
+    def start(self):
+        """Spawn the workers; must be called from inside the event loop."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            if not self.pending:
+                self._idle.set()
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.ensure_future(self._worker()))
+
+    def submit(self, member, rule_id, urgent=False):
+        """Queue `member` for banning, unless it already is; `urgent` (a
+        live event's) jobs go ahead of the sweep backlog, and one already
+        in the backlog is moved up."""
+        key = (member.guild.id, member.id)
+        job = self.pending.get(key)
+        if job is not None:
+            if urgent and not job.urgent and not job.running:
+                self.scheduler.promote(job)
+                self._wakeup.set()
+            return None
+        job = self.pending[key] = BanJob(member, rule_id, urgent)
+        self.depths[job.guild_id] += 1
+        self.stats['queued'] += 1
+        self.scheduler.push(job)
+        self._idle.clear()
+        self._wakeup.set()
+        return job
+
+    async def join(self):
+        """Wait until every queued ban has been attempted."""
+        await self._idle.wait()
+
+    async def drain(self, timeout):
+        """Wait up to `timeout` seconds for the queue to empty; returns
+        whether it did."""
+        if self._idle is None:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def unfinished(self):
+        """The jobs not yet banned (or given up on), oldest first."""
+        return sorted(self.pending.values(), key=lambda job: job.queued)
+
+    def bucket(self, guild_id):
+        try:
+            return self.buckets[guild_id]
+        except KeyError:
+            bucket = self.buckets[guild_id] = TokenBucket(
+                self.rate, self.burst)
+            return bucket
+
+    def _delay(self, guild_id):
+        return self.bucket(guild_id).delay()
+
+    def bulk(self, guild_id):
+        """Whether bans in `guild_id` go in bulk-ban requests."""
+        return (
+            self.http is not None and self.bulk_size > 1 and not self.dry_run
+            and guild_id not in self.bulk_unsupported)
+
+    async def _next_jobs(self):
+        """The jobs for the next request: one, or a bulk ban's worth from
+        one guild."""
+        while True:
+            job, wait = self.scheduler.pop()
+            if job is not None:
+                jobs = [job]
+                if self.bulk(job.guild_id):
+                    jobs.extend(
+                        self.scheduler.pop_more(job, self.bulk_size - 1))
+                for taken in jobs:
+                    taken.running = True
+                if not self.dry_run:
+                    self.bucket(job.guild_id).take()
+                return jobs
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            jobs = await self._next_jobs()
+            if len(jobs) == 1:
+                await self._execute(jobs[0])
+            else:
+                await self._execute_bulk(jobs)
+
+    def _retry(self, jobs):
+        """Put `jobs` back at the head of their guild's queue, in order."""
+        for job in reversed(jobs):
+            job.running = False
+            self.scheduler.push(job, front=True)
+        self._wakeup.set()
+
+    async def _execute(self, job):
+        member = job.member
+        if self.dry_run:
+            self._finish(job, 'shadowed')
+            self.log_manager.LogInfoMsg(
+                f"Would have banned {member.display_name}! "
+                f"(rule: {job.rule_id})")
+            return
+        job.attempts += 1
+        sent = time.perf_counter()
+        try:
+            if self.http is None:
+                await member.ban(
+                    reason=self.reason,
+                    delete_message_days=self.delete_message_days)
+            else:
+                await self._request(
+                    discord.http.Route(
+                        'PUT', '/guilds/{guild_id}/bans/{user_id}',
+                        guild_id=job.guild_id, user_id=member.id),
+                    params={
+                        'delete_message_days': self.delete_message_days})
+        except Exception as e:  # pylint: disable=broad-except
+            self._round_trip(sent)
+            if (isinstance(e, discord.HTTPException) and e.status == 429
+                    and job.attempts <= self.max_retries):
+                self.stats['rate_limited'] += 1
+                if self.metrics is not None:
+                    self.metrics.rate_limited.inc()
+                self._throttled(self.bucket(job.guild_id), job, e)
+                # Back to the head of its guild's queue; the worker moves
+                # on to another guild meanwhile.
+                self._retry([job])
+                return
+            self._finish(job, 'failed')
+            self.log_manager.LogErrorMsg(
+                f"Unable to ban {member.display_name} "
+                f"({member.id}): {e}")
+            return
+        self._round_trip(sent)
+        self._finish(job, 'banned')
+        self.log_manager.LogInfoMsg(
+            f"Banned {member.display_name}! (rule: {job.rule_id})")
+
+    async def _execute_bulk(self, jobs):
+        guild_id = jobs[0].guild_id
+        for job in jobs:
+            job.attempts += 1
+        sent = time.perf_counter()
+        try:
+            result = await self._request(
+                discord.http.Route(
+                    'POST', '/guilds/{guild_id}/bulk-ban', guild_id=guild_id),
+                json={
+                    'user_ids': [str(job.member.id) for job in jobs],
+                    'delete_message_seconds':
+                        self.delete_message_days * 86400})
+        except Exception as e:  # pylint: disable=broad-except
+            self._round_trip(sent)
+            if not isinstance(e, discord.HTTPException):
+                self._bulk_failed(jobs, e)
+                return
+            if e.status == 429 and jobs[0].attempts <= self.max_retries:
+                self.stats['rate_limited'] += 1
+                if self.metrics is not None:
+                    self.metrics.rate_limited.inc()
+                self._throttled(self.bucket(guild_id), jobs[0], e)
+                self._retry(jobs)
+                return
+            if e.status in BULK_UNSUPPORTED:
+                if guild_id not in self.bulk_unsupported:
+                    self.bulk_unsupported.add(guild_id)
+                    self.log_manager.LogWarningMsg(
+                        f"Bulk bans unavailable in guild {guild_id} ({e}); "
+                        f"banning one member at a time")
+                for job in jobs:
+                    job.attempts -= 1  # not a try at banning them
+                self._retry(jobs)
+                return
+            if e.code != BULK_NONE_BANNED:
+                self._bulk_failed(jobs, e)
+                return
+            result = {}  # refused every one of them
+        else:
+            self._round_trip(sent)
+        self.stats['bulk_requests'] += 1
+        banned = set(result.get('banned_users') or ())
+        for job in jobs:
+            member = job.member
+            if str(member.id) in banned:
+                self._finish(job, 'banned')
+                self.log_manager.LogInfoMsg(
+                    f"Banned {member.display_name}! (rule: {job.rule_id})")
+            else:
+                self._finish(job, 'failed')
+                self.log_manager.LogErrorMsg(
+                    f"Unable to ban {member.display_name} ({member.id}): "
+                    f"refused in bulk ban")
+
+    async def _request(self, route, **kwargs):
+        """Send `route` on the client's token and connection, and return
+        the response's data; its rate limit headers re-tune the guild's
+        bucket, and any error status, 429 included, is raised as
+        discord.py would."""
+        http = self.http
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=http.connector,
+                connector_owner=http.connector is None)
+        headers = {
+            'User-Agent': http.user_agent,
+            'Authorization':
+                f"Bot {http.token}" if http.bot_token else http.token,
+            'X-Audit-Log-Reason': urllib.parse.quote(self.reason, safe='/ '),
+        }
+        async with self.session.request(
+                route.method, route.url, headers=headers, proxy=http.proxy,
+                proxy_auth=http.proxy_auth, **kwargs) as response:
+            data = await discord.http.json_or_text(response)
+            if response.status != 429:
+                self._rate_limits(
+                    self.bucket(route.guild_id), response.headers)
+            if 300 > response.status >= 200:
+                return data
+            if response.status == 403:
+                raise discord.Forbidden(response, data)
+            if response.status == 404:
+                raise discord.NotFound(response, data)
+            raise discord.HTTPException(response, data)
+
+    @staticmethod
+    def _rate_limits(bucket, headers):
+        """Keep `bucket` in step with the limit `headers` report."""
+        limit = _header_float(headers, 'X-RateLimit-Limit')
+        remaining = _header_float(headers, 'X-RateLimit-Remaining')
+        reset_after = _header_float(headers, 'X-RateLimit-Reset-After')
+        if None not in (limit, remaining, reset_after):
+            bucket.sync(limit, remaining, reset_after)
+
+    def _bulk_failed(self, jobs, error):
+        for job in jobs:
+            self._finish(job, 'failed')
+        self.log_manager.LogErrorMsg(
+            f"Unable to bulk ban {len(jobs)} member(s) in guild "
+            f"{jobs[0].guild_id}: {error}")
+
+    def _throttled(self, bucket, job, error):
+        """Re-tune `bucket` from a 429 response and back off the retry."""
+        headers = getattr(error.response, 'headers', None) or {}
+        self._rate_limits(bucket, headers)
+        retry_after = _header_float(headers, 'Retry-After') or 0.0
+        delay = max(retry_after, self.backoff * 2 ** (job.attempts - 1))
+        bucket.block(delay)
+        self.log_manager.LogWarningMsg(
+            f"Rate limited banning in guild {job.guild_id}, "
+            f"retrying in {delay:.2f}s (attempt {job.attempts})")
+
+    def _round_trip(self, sent):
+        if self.metrics is not None:
+            self.metrics.ban_latency.observe(time.perf_counter() - sent)
+
+    def _finish(self, job, outcome):
+        self.pending.pop((job.guild_id, job.member.id), None)
+        if not self.pending and self._idle is not None:
+            self._idle.set()
+        if self.audit is not None:
+            self.audit.record(
+                event='ban', guild=job.guild_id, member=job.member.id,
+                name=job.member.name, rule=job.rule_id, outcome=outcome,
+                attempts=job.attempts,
+                latency_ms=round((time.monotonic() - job.queued) * 1000, 3))
+        self.depths[job.guild_id] -= 1
+        if not self.depths[job.guild_id]:
+            del self.depths[job.guild_id]
+        self.stats[outcome] += 1
+        if self.metrics is not None:
+            self.metrics.bans.inc((outcome,))
+        done = (
+            self.stats['banned'] + self.stats['failed'] +
+            self.stats['shadowed'])
+        if self.progress_every and not done % self.progress_every:
+            self.report_progress()
+
+    def report_progress(self):
+        stats = self.stats
+        depths = ", ".join(
+            f"{guild_id}: {depth}" for guild_id, depth in self.depths.items())
+        if self.dry_run:
+            self.log_manager.LogInfoMsg(
+                f"Shadow progress: {stats['shadowed']} would have been "
+                f"banned, of {stats['queued']} queued; queue depth by "
+                f"guild: {{{depths}}}")
+            return
+        self.log_manager.LogInfoMsg(
+            f"Ban progress: {stats['banned']} banned, {stats['failed']} "
+            f"failed, {stats['rate_limited']} rate limited, of "
+            f"{stats['queued']} queued; queue depth by guild: "
+            f"{{{depths}}}")
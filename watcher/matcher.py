@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-pattern member-name matching.
+
+Every rule is a regular expression with an identifier.  The literal text each
+rule starts with is pulled out of the pattern and all of those literals are
+folded into a single alternation, so a benign name (which is nearly every
+name) costs exactly one scan.  Only when that prefilter finds a literal are
+the rules keyed on it confirmed, each anchored at the offset where its
+literal was found rather than being re-scanned with a leading `.*`.
+"""
+import hashlib
+import json
+import re
+
+from frozendict import frozendict
+
+from common.assist import regexp_list
+
+
+DEFAULT_RULES = frozendict({
+    "twitter-h0nde": r"(?i)twitter\.com/h0nde",
+})
+
+_INLINE_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+_META_CHARS = frozenset('.^$*+?{}[]|()')
+_QUANTIFIERS = frozenset('*+?{')
+
+
+def _has_top_level_branch(pattern):
+    depth = 0
+    in_class = False
+    escaped = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and not depth:
+            return True
+    return False
+
+
+def _literal_prefix(pattern):
+    """Return (literal, whole): the literal text every match of `pattern`
+    must start with, and whether that literal is the entire pattern."""
+    flags = _INLINE_FLAGS.match(pattern)
+    if flags:
+        if 'x' in flags.group(1):
+            # Verbose patterns ignore their whitespace and `#` comments, so
+            # the text as written isn't what they match.
+            return "", False
+        pattern = pattern[flags.end():]
+    if _has_top_level_branch(pattern):
+        return "", False
+    literal = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        step = 1
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if not escaped or escaped.isalnum():
+                break
+            char = escaped
+            step = 2
+        elif char in _META_CHARS:
+            break
+        if pattern[i + step:i + step + 1] in _QUANTIFIERS:
+            break
+        literal.append(char)
+        i += step
+    return "".join(literal), i == len(pattern)
+
+
+def leading_literal(pattern):
+    """Return the literal text every match of `pattern` must start with.
+
+    Only the simple cases are recognized (plain characters and escaped
+    punctuation); anything else ends the literal.  A character followed by a
+    quantifier is dropped since it may not be present at all.  An empty
+    string means the rule can't be prefiltered.
+    """
+    return _literal_prefix(pattern)[0]
+
+
+class Rule:
+    """A single compiled screening rule."""
+    __slots__ = ['rule_id', 'pattern', 'regex', 'literal', 'exact']
+
+    def __init__(self, rule_id, pattern, regex):
+        self.rule_id = rule_id
+        self.pattern = pattern
+        self.regex = regex
+        self.literal, whole = _literal_prefix(pattern)
+        # Finding the literal is finding a match, unless ASCII-only case
+        # folding makes the rule stricter than the prefilter.
+        self.exact = bool(self.literal) and whole and not (
+            regex.flags & re.ASCII)
+
+    def confirm(self, name, pos=None):
+        if pos is None:
+            return self.regex.search(name) is not None
+        return self.regex.match(name, pos) is not None
+
+    def __repr__(self):
+        return f"Rule({self.rule_id!r}, {self.pattern!r})"
+
+
+class NameMatcher:
+    """Compiled set of rules, checked against member names in one pass."""
+
+    def __init__(self, rules=DEFAULT_RULES):
+        rules = dict(rules)
+        self.patterns = rules
+        rule_ids = list(rules)
+        compiled = regexp_list([rules[rule_id] for rule_id in rule_ids])
+        self.rules = tuple(
+            Rule(rule_id, rules[rule_id], regex)
+            for rule_id, regex in zip(rule_ids, compiled))
+        self.version = ruleset_version(rules)
+        # Rules without a usable literal have to search the whole name.
+        self._unfiltered = tuple(
+            rule for rule in self.rules if not rule.literal)
+        by_literal = {}
+        ignorecase = set()
+        for rule in self.rules:
+            if not rule.literal:
+                continue
+            key = rule.literal
+            if rule.regex.flags & re.IGNORECASE:
+                key = key.lower()
+                ignorecase.add(key)
+            by_literal.setdefault(key, []).append(rule)
+        self._by_literal = {
+            key: tuple(found) for key, found in by_literal.items()}
+        self._literal_lengths = sorted(set(map(len, by_literal)))
+        # Case-insensitive literals are told apart with the regex engine's
+        # own folding: `str.lower` misses pairs like "ı" and "i".
+        folded = {}
+        for key in ignorecase:
+            folded.setdefault(len(key), []).append(
+                (re.compile(re.escape(key), re.IGNORECASE).fullmatch,
+                 self._by_literal[key]))
+        self._folded = {
+            length: tuple(found) for length, found in folded.items()}
+        # Literals that are a whole rule need no confirming once found.
+        self._exact = {}
+        for key, found in self._by_literal.items():
+            for rule in found:
+                if rule.exact and bool(rule.regex.flags & re.IGNORECASE) == (
+                        key in ignorecase):
+                    self._exact[key] = rule.rule_id
+                    break
+        # One prefilter per case sensitivity, since scoped `(?i:...)` groups
+        # defeat the engine's literal optimizations.  Each gets a twin that
+        # reports the longest literal found at every offset, overlaps
+        # included, for confirming the names the prefilter lets through.
+        automata = [
+            (literal_trie(keys), flags)
+            for keys, flags in (
+                ([key for key in by_literal if key in ignorecase],
+                 re.IGNORECASE),
+                ([key for key in by_literal if key not in ignorecase], 0))
+            if keys]
+        self._prefilters = tuple(
+            (re.compile(trie, flags).search, bool(flags))
+            for trie, flags in automata)
+        self._locators = tuple(
+            (re.compile(f"(?=({trie}))", flags).finditer, bool(flags))
+            for trie, flags in automata)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def prefilter(self, name):
+        """True if `name` contains any rule's literal (or if some rule has
+        no literal to filter on)."""
+        if self._unfiltered:
+            return True
+        for prefilter, _ in self._prefilters:
+            if prefilter(name):
+                return True
+        return False
+
+    def _candidates(self, name):
+        """Yield (rule, offset) pairs worth confirming for `name`; an offset
+        of None means the rule has to search the whole name."""
+        for locate, folded in self._locators:
+            for found in locate(name):
+                text = found.group(1)
+                for length in self._literal_lengths:
+                    if length > len(text):
+                        break
+                    if not folded:
+                        for rule in self._by_literal.get(text[:length], ()):
+                            yield rule, found.start()
+                        continue
+                    for same, rules in self._folded.get(length, ()):
+                        if same(text, 0, length):
+                            for rule in rules:
+                                yield rule, found.start()
+        for rule in self._unfiltered:
+            yield rule, None
+
+    def match(self, name):
+        """Return the id of the first rule found to match `name`, or None."""
+        # This is the hot path, so the prefilter is inlined here.
+        if not self._unfiltered:
+            for prefilter, folded in self._prefilters:
+                found = prefilter(name)
+                if found:
+                    break
+            else:
+                return None
+            # The leftmost literal found is usually a whole rule by itself.
+            text = found.group()
+            rule_id = self._exact.get(text.lower() if folded else text)
+            if rule_id is not None:
+                return rule_id
+        for rule, pos in self._candidates(name):
+            if rule.confirm(name, pos):
+                return rule.rule_id
+        return None
+
+    def match_all(self, name):
+        """Return the ids of every rule matching `name`, in rule order."""
+        if not self.prefilter(name):
+            return []
+        matched = set()
+        for rule, pos in self._candidates(name):
+            if rule.rule_id not in matched and rule.confirm(name, pos):
+                matched.add(rule.rule_id)
+        return [rule.rule_id for rule in self.rules if rule.rule_id in matched]
+
+
+def literal_trie(literals):
+    """Build a regular expression matching any of `literals`, shaped as a
+    trie so that the regex engine walks shared prefixes only once (which is
+    effectively an Aho-Corasick automaton without the failure links)."""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = None
+
+    def render(node):
+        ends_here = '' in node
+        branches = [
+            re.escape(char) + render(child)
+            for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        group = "(?:{})".format("|".join(branches))
+        return group + "?" if ends_here else group
+
+    return render(trie)
+
+
+def diff_rules(old_rules, new_rules):
+    """Return (changed, removed): ids of the rules in `new_rules` that are
+    new or have a different pattern, and ids only `old_rules` has."""
+    changed = [
+        rule_id for rule_id, pattern in new_rules.items()
+        if old_rules.get(rule_id) != pattern]
+    removed = [rule_id for rule_id in old_rules if rule_id not in new_rules]
+    return changed, removed
+
+
+def ruleset_version(rules):
+    """Stable digest identifying a set of rules, independent of order."""
+    encoded = json.dumps(dict(rules), sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:12]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+The screening daemon's metrics.
+
+Counters and histograms are bumped inline by the screening and ban paths;
+gauges read the application's state only when the endpoint is scraped.
+"""
+from common.metrics import MetricsRegistry, resident_memory
+
+
+PREFIX = "ban_h0nde"
+
+
+class ScreeningMetrics(MetricsRegistry):
+    def __init__(self, app=None):
+        super().__init__()
+        self.skipped = self.counter(
+            f"{PREFIX}_members_skipped_total",
+            "Members skipped as already screened clean.")
+        self.matches = self.counter(
+            f"{PREFIX}_rule_matches_total",
+            "Members matched and queued for a ban, by rule.", ('rule',))
+        self.shadow_matches = self.counter(
+            f"{PREFIX}_shadow_matches_total",
+            "Members matched in shadow mode, and so not banned, by rule.",
+            ('rule',))
+        self.bans = self.counter(
+            f"{PREFIX}_bans_total", "Bans attempted, by outcome.",
+            ('outcome',))
+        self.rate_limited = self.counter(
+            f"{PREFIX}_rate_limited_total",
+            "Ban requests answered with 429.")
+        self.raid_alerts = self.counter(
+            f"{PREFIX}_raid_alerts_total", "Raid bursts detected, by kind.",
+            ('kind',))
+        self.metadata_flags = self.counter(
+            f"{PREFIX}_metadata_flags_total",
+            "Members flagged on account metadata, by outcome.",
+            ('outcome',))
+        self.log_messages = self.counter(
+            f"{PREFIX}_log_messages_total", "Log messages, by level.",
+            ('level',))
+        self.screened = self.counter(
+            f"{PREFIX}_members_screened_total",
+            "Members screened against the rules.")
+        self.screen_latency = self.histogram(
+            f"{PREFIX}_screen_seconds",
+            "Time taken to screen a member, or to skip one.")
+        self.ban_latency = self.histogram(
+            f"{PREFIX}_ban_request_seconds",
+            "Round-trip time of ban requests.")
+        self.gauge(
+            f"{PREFIX}_resident_memory_bytes", "Resident set size.",
+            function=resident_memory)
+        if app is not None:
+            self.bind(app)
+
+    def bind(self, app):
+        """Register the gauges that read `app`'s state."""
+        def queue_depth():
+            executor = app.executor
+            if executor is None:
+                return {}
+            return {
+                (guild_id,): depth
+                for guild_id, depth in list(executor.depths.items())}
+
+        def cached_members():
+            client = app.client
+            if client is None:
+                return 0
+            return sum(len(guild.members) for guild in list(client.guilds))
+
+        def known_clean():
+            return 0 if app.state is None else app.state.known_clean
+
+        def name_cache():
+            return 0 if app.normalizer is None else app.normalizer.stats()[
+                'cached']
+
+        self.gauge(
+            f"{PREFIX}_ban_queue_depth", "Bans waiting, by guild.",
+            ('guild',), queue_depth)
+        self.gauge(
+            f"{PREFIX}_cached_members", "Members in the client's cache.",
+            function=cached_members)
+        self.gauge(
+            f"{PREFIX}_known_clean_members",
+            "Members the state store holds as clean.", function=known_clean)
+        self.gauge(
+            f"{PREFIX}_name_cache_entries", "Folded names cached.",
+            function=name_cache)
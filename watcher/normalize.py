@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Member-name normalization ahead of matching.
+
+Spam accounts dodge literal rules with homoglyphs (Cyrillic or fullwidth
+letters), mixed case and invisible characters.  `NameNormalizer` folds all of
+those down to lowercase ASCII via `common.assist.fold_text`.  During a raid
+the same handful of names shows up thousands of times, so folded names are
+kept in a bounded LRU keyed by the raw name.
+"""
+import functools
+import re
+
+from common.assist import fold_text
+
+
+# Zero-width and formatting characters that render as nothing at all.
+INVISIBLE_CHARS = re.compile(
+    '[\u00ad\u034f\u061c\u115f\u1160\u17b4\u17b5\u180b-\u180e'
+    '\u200b-\u200f\u202a-\u202e\u2060-\u206f\u3164\ufe00-\ufe0f\ufeff'
+    '\uffa0\U000e0000-\U000e007f]')
+DEFAULT_CACHE_SIZE = 65536
+
+
+def fold_name(name):
+    """Fold `name` to the form the screening rules are written against."""
+    return fold_text(INVISIBLE_CHARS.sub('', name))
+
+
+class NameNormalizer:
+    """Callable that folds member names, caching the most recent results."""
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._fold = functools.lru_cache(maxsize=cache_size)(fold_name)
+
+    def __call__(self, name):
+        return self._fold(name)
+
+    def clear(self):
+        self._fold.cache_clear()
+
+    def stats(self):
+        info = self._fold.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'cached': info.currsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0,
+        }
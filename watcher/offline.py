@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Offline screening of exported member lists.
+
+An export is either CSV with a header row (`id` and `name` columns, `nick`
+and `guild` optional) or JSON Lines with the same keys, one member per line.
+The file is read in large blocks of lines, each block is cut into chunks
+with `common.assist.chunks` on record boundaries (a quoted CSV field, such as
+a display name, can span lines), and the chunks are parsed and screened in a
+pool of worker processes, each with its own matcher and name cache.  Only
+the matches come back to be written out, in input order.
+"""
+import collections
+import csv
+import json
+import pathlib
+import time
+
+from common.assist import chunks, lazy_import
+
+from watcher.matcher import NameMatcher
+from watcher.normalize import DEFAULT_CACHE_SIZE, NameNormalizer
+
+
+multiprocessing = lazy_import('multiprocessing')
+
+CHUNK_ROWS = 10000
+READ_HINT = 16 * 1024 * 1024  # bytes of lines to read per block
+IN_FLIGHT = 4  # chunks queued per worker process
+OUTPUT_FIELDS = ('guild', 'id', 'name', 'nick', 'rule')
+
+_screener = None
+
+
+class OfflineScreener:
+    """Screens names with the same verdicts as
+    `CoreApplication.screen_name`."""
+
+    def __init__(self, rules, cache_size=DEFAULT_CACHE_SIZE):
+        self.matcher = NameMatcher(rules)
+        self.normalizer = NameNormalizer(cache_size)
+
+    def screen(self, name):
+        if not name:
+            return None
+        rule_id = self.matcher.match(name)
+        if rule_id is None:
+            # ASCII folds to its lowercase; exports are mostly unique names,
+            # so skip the cache lookup for those.
+            folded = name.lower() if name.isascii() else self.normalizer(name)
+            if folded != name:
+                rule_id = self.matcher.match(folded)
+        return rule_id
+
+
+def _init_worker(rules, cache_size):
+    global _screener  # pylint: disable=global-statement
+    _screener = OfflineScreener(rules, cache_size)
+
+
+def _parse(export_format, header, lines):
+    """Yield (guild, id, name, nick) for each row in `lines`."""
+    if export_format == 'csv':
+        columns = [
+            header.index(field) if field in header else None
+            for field in ('guild', 'id', 'name', 'nick')]
+        width = len(header)
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            if len(row) < width:
+                row += [''] * (width - len(row))
+            yield tuple(
+                None if column is None else row[column]
+                for column in columns)
+        return
+    for line in lines:
+        if line.strip():
+            row = json.loads(line)
+            yield (
+                row.get('guild'), row.get('id'), row.get('name'),
+                row.get('nick'))
+
+
+def _screen_chunk(task):
+    """Worker: return (rows screened, matched rows) for one chunk."""
+    export_format, header, lines = task
+    screen = _screener.screen
+    screened = 0
+    matched = []
+    for guild, member_id, name, nick in _parse(export_format, header, lines):
+        screened += 1
+        rule_id = screen(name)
+        if rule_id is None and nick:
+            rule_id = screen(nick)
+        if rule_id is not None:
+            matched.append({
+                'guild': guild or None, 'id': member_id, 'name': name,
+                'nick': nick or None, 'rule': rule_id})
+    return screened, matched
+
+
+def export_format_of(path):
+    suffix = pathlib.Path(path).suffix.lower()
+    if suffix == '.csv':
+        return 'csv'
+    if suffix in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    raise ValueError(f"Can't tell the format of {path}; use .csv or .jsonl")
+
+
+def join_records(lines, pending=()):
+    """Join CSV `lines` into whole records, a record running on for as long
+    as it has a quoted field open; returns the records and the lines of the
+    one left open at the end, to go in front of the next lines read.
+
+    A quote always toggles whether a field is open (an escaped quote is
+    two of them), so a line with an odd number of quotes opens or closes
+    one.
+    """
+    records = []
+    pending = list(pending)
+    for line in lines:
+        if pending:
+            pending.append(line)
+            if line.count('"') & 1:
+                records.append("".join(pending))
+                pending = []
+        elif line.count('"') & 1:
+            pending = [line]
+        else:
+            records.append(line)
+    return records, pending
+
+
+def read_tasks(path, export_format, chunk_rows=CHUNK_ROWS,
+               read_hint=READ_HINT):
+    """Yield (format, header, records) chunks of the export at `path`."""
+    with open(path, 'r', encoding='utf-8', newline='') as export:
+        header = None
+        if export_format == 'csv':
+            header = next(csv.reader([export.readline()]))
+            header = [field.strip().lower() for field in header]
+            if 'name' not in header:
+                raise ValueError(f"{path} has no `name` column")
+        pending = []
+        while True:
+            block = export.readlines(read_hint)
+            if not block:
+                if pending:  # unterminated quote; let the parser have it
+                    yield export_format, header, ["".join(pending)]
+                return
+            if export_format == 'csv' and (
+                    pending or '"' in "".join(block)):
+                block, pending = join_records(block, pending)
+            for lines in chunks(block, chunk_rows):
+                yield export_format, header, lines
+
+
+def _writer(output, output_format):
+    if output_format == 'csv':
+        writer = csv.DictWriter(output, OUTPUT_FIELDS)
+        writer.writeheader()
+        return writer.writerow
+    return lambda row: output.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def screen_file(path, output_path, rules, cache_size=DEFAULT_CACHE_SIZE,
+                processes=None, chunk_rows=CHUNK_ROWS, export_format=None):
+    """Screen the export at `path`, writing matches to `output_path` (CSV if
+    it ends in .csv, JSON Lines otherwise).  Returns a dict of totals."""
+    # pylint: disable=too-many-arguments,too-many-locals
+    export_format = export_format or export_format_of(path)
+    output_format = 'csv' if str(output_path).lower().endswith(
+        '.csv') else 'jsonl'
+    processes = processes or multiprocessing.cpu_count()
+    tasks = read_tasks(path, export_format, chunk_rows)
+    started = time.perf_counter()
+    screened = 0
+    by_rule = collections.Counter()
+    context = multiprocessing.get_context('fork')
+    with context.Pool(processes, _init_worker, (dict(rules), cache_size)) \
+            as pool, open(output_path, 'w', encoding='utf-8',
+                          newline='') as output:
+        write = _writer(output, output_format)
+        # Keep a bounded number of chunks in flight, collected in order, so
+        # memory stays flat however large the export is.
+        in_flight = collections.deque()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < processes * IN_FLIGHT:
+                try:
+                    task = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight.append(pool.apply_async(_screen_chunk, (task,)))
+            if not in_flight:
+                break
+            count, matched = in_flight.popleft().get()
+            screened += count
+            for row in matched:
+                by_rule[row['rule']] += 1
+                write(row)
+    elapsed = time.perf_counter() - started
+    return {
+        'screened': screened,
+        'matched': sum(by_rule.values()),
+        'by_rule': dict(by_rule),
+        'elapsed': elapsed,
+        'rate': screened / elapsed if elapsed else 0.0,
+    }
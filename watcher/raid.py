@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Raid detection over the member-join stream.
+
+Rules only catch a campaign once someone has written one for it.  This
+watches joins as they happen instead: each guild keeps its join counts in a
+ring of one-second buckets, and the recent joiners' (folded) names in a ring
+of MinHash sketches over their character trigrams.  The sketches are cut
+into bands, and names sharing a band are near-identical with high
+probability, so counting band hits over the window finds a burst of similar
+new names within seconds of it starting, in memory fixed per guild.  A
+guild with no joins for a whole window has nothing left in either ring, and
+is dropped.
+
+The sketches are one-permutation MinHash: each trigram is hashed once and
+kept as the minimum of the bin its hash falls in, instead of being hashed
+once per sketch value, which keeps a join well under 100us.
+
+A burst of similar names comes with a candidate signature (the text every
+name in it has in common) to review as a rule; nothing is banned on the
+detector's say-so.
+"""
+import collections
+import hashlib
+import re
+
+
+WINDOW = 60.0  # seconds
+BUCKETS = 60
+CAPACITY = 1024  # recent joins sketched, per guild
+CLUSTER_SIZE = 8  # similar names within the window that make a burst
+BURST_JOINS = 100  # joins within the window that make a burst
+BANDS = 6
+ROWS = 3
+SHINGLE = 3
+MIN_SIGNATURE = 5  # characters a candidate signature must have in common
+SAMPLE_SIZE = 10
+_EMPTY = 1 << 64  # above any hash()
+
+
+class RaidAlert:
+    """A burst of joins (`kind` 'joins') or of similar names ('names')."""
+    __slots__ = ['kind', 'guild_id', 'count', 'names', 'pattern']
+
+    def __init__(self, kind, guild_id, count, names=(), pattern=None):
+        self.kind = kind
+        self.guild_id = guild_id
+        self.count = count
+        self.names = list(names)
+        self.pattern = pattern
+
+    @property
+    def rule_id(self):
+        """A stable id for the candidate rule, if there is one."""
+        if self.pattern is None:
+            return None
+        digest = hashlib.sha1(self.pattern.encode('utf-8')).hexdigest()
+        return f"raid-{digest[:8]}"
+
+    def describe(self):
+        if self.kind == 'joins':
+            return (
+                f"Join burst in guild {self.guild_id}: {self.count} joins "
+                f"within the window")
+        candidate = (
+            f"; candidate rule {self.rule_id}: {self.pattern}"
+            if self.pattern is not None else "; no common signature")
+        return (
+            f"Burst of {self.count} similar names in guild "
+            f"{self.guild_id}, e.g. {self.names[:3]}{candidate}")
+
+
+class GuildWindow:
+    """One guild's join-count ring and ring of recent name sketches."""
+    __slots__ = [
+        'counts', 'slots', 'recent', 'bands', 'flagged', 'reported',
+        'burst_flagged', 'last_join']
+
+    def __init__(self, buckets, capacity):
+        self.counts = [0] * buckets
+        self.slots = [-1] * buckets  # which second each bucket counts
+        self.recent = collections.deque(maxlen=capacity)
+        self.bands = {}  # band key -> recent names sharing it
+        self.flagged = {}  # band key -> when it was reported
+        self.reported = {}  # candidate pattern -> when it was reported
+        self.burst_flagged = None
+        self.last_join = None
+
+
+class RaidDetector:
+    """Flags join bursts and bursts of similar names, per guild."""
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+
+    def __init__(self, window=WINDOW, buckets=BUCKETS, capacity=CAPACITY,
+                 cluster_size=CLUSTER_SIZE, burst_joins=BURST_JOINS,
+                 bands=BANDS, rows=ROWS, shingle=SHINGLE,
+                 min_signature=MIN_SIGNATURE):
+        self.window = float(window)
+        self.buckets = buckets
+        self.bucket_width = self.window / buckets
+        self.capacity = capacity
+        self.cluster_size = cluster_size
+        self.burst_joins = burst_joins
+        self.bands = bands
+        self.rows = rows
+        self.shingle = shingle
+        self.min_signature = min_signature
+        self.guilds = {}
+        self.evicted_at = None
+
+    @classmethod
+    def from_config(cls, raid_config):
+        """`true` (or nothing) means the defaults."""
+        raid_config = dict(
+            raid_config if isinstance(raid_config, dict) else {})
+        return cls(
+            window=raid_config.get('window', WINDOW),
+            buckets=raid_config.get('buckets', BUCKETS),
+            capacity=raid_config.get('capacity', CAPACITY),
+            cluster_size=raid_config.get('cluster_size', CLUSTER_SIZE),
+            burst_joins=raid_config.get('burst_joins', BURST_JOINS),
+            bands=raid_config.get('bands', BANDS),
+            rows=raid_config.get('rows', ROWS),
+            shingle=raid_config.get('shingle', SHINGLE),
+            min_signature=raid_config.get('min_signature', MIN_SIGNATURE))
+
+    def signature(self, name):
+        """The MinHash sketch of `name`'s character shingles."""
+        size = self.shingle
+        bins = self.bands * self.rows
+        padded = f"\x02{name}\x03"
+        sketch = [_EMPTY] * bins
+        for start in range(max(1, len(padded) - size + 1)):
+            shingle_hash = hash(padded[start:start + size])
+            slot = shingle_hash % bins
+            if shingle_hash < sketch[slot]:
+                sketch[slot] = shingle_hash
+        if _EMPTY not in sketch:
+            return sketch
+        # Short names leave bins empty; each borrows from the nearest full
+        # bin to its right, offset by the distance to keep them apart.
+        dense = list(sketch)
+        for slot in range(bins):
+            if sketch[slot] != _EMPTY:
+                continue
+            for distance in range(1, bins):
+                borrowed = sketch[(slot + distance) % bins]
+                if borrowed != _EMPTY:
+                    dense[slot] = borrowed + distance
+                    break
+        return dense
+
+    def band_keys(self, name):
+        """The MinHash band keys of `name`."""
+        signature = self.signature(name)
+        rows = self.rows
+        return [
+            hash((band, *signature[band * rows:band * rows + rows]))
+            for band in range(self.bands)]
+
+    def join_rate(self, guild_id, now):
+        """Joins seen in `guild_id` within the window ending `now`."""
+        window = self.guilds.get(guild_id)
+        if window is None:
+            return 0
+        oldest = int(now / self.bucket_width) - self.buckets
+        return sum(
+            count for slot, count in zip(window.slots, window.counts)
+            if slot > oldest)
+
+    def observe(self, guild_id, name, now):
+        """Record a join at `now` (seconds, monotonic) of a member with
+        (folded) `name`; returns a RaidAlert if it completes a burst."""
+        if self.evicted_at is None:
+            self.evicted_at = now
+        elif now - self.evicted_at >= self.window:
+            self.evict(now)
+        try:
+            window = self.guilds[guild_id]
+        except KeyError:
+            window = self.guilds[guild_id] = GuildWindow(
+                self.buckets, self.capacity)
+        window.last_join = now
+        slot = int(now / self.bucket_width)
+        index = slot % self.buckets
+        if window.slots[index] != slot:
+            window.slots[index] = slot
+            window.counts[index] = 0
+            self._expire_reports(window, now)
+        window.counts[index] += 1
+
+        keys = self.band_keys(name)
+        recent = window.recent
+        horizon = now - self.window
+        while recent and recent[0][0] <= horizon:
+            self._forget(window, recent.popleft())
+        if len(recent) == recent.maxlen:
+            self._forget(window, recent.popleft())
+        recent.append((now, name, keys))
+        bands = window.bands
+        largest = None
+        for key in keys:
+            members = bands.get(key)
+            if members is None:
+                bands[key] = [name]
+                continue
+            members.append(name)
+            if len(members) >= self.cluster_size and (
+                    largest is None or len(members) > len(bands[largest])):
+                largest = key
+        flagged = window.flagged
+        if largest is not None and not any(key in flagged for key in keys):
+            # Reported once per window, whichever of its bands fills first.
+            for key in keys:
+                flagged[key] = now
+            alert = self._name_alert(guild_id, bands[largest])
+            if alert.pattern not in window.reported:
+                if alert.pattern is not None:
+                    window.reported[alert.pattern] = now
+                return alert
+        if window.burst_flagged is None:
+            joins = self.join_rate(guild_id, now)
+            if joins >= self.burst_joins:
+                window.burst_flagged = now
+                return RaidAlert('joins', guild_id, joins)
+        return None
+
+    def evict(self, now):
+        """Drop the guilds that have had no joins for a window before
+        `now`; run from `observe` about once a window."""
+        horizon = now - self.window
+        self.guilds = {
+            guild_id: window for guild_id, window in self.guilds.items()
+            if window.last_join > horizon}
+        self.evicted_at = now
+
+    def _expire_reports(self, window, now):
+        """Let bursts reported a window ago be reported again."""
+        horizon = now - self.window
+        if window.flagged:
+            window.flagged = {
+                key: flagged for key, flagged in window.flagged.items()
+                if flagged > horizon}
+            window.reported = {
+                pattern: reported
+                for pattern, reported in window.reported.items()
+                if reported > horizon}
+        if window.burst_flagged is not None and (
+                window.burst_flagged <= horizon):
+            window.burst_flagged = None
+
+    @staticmethod
+    def _forget(window, entry):
+        _, name, keys = entry
+        bands = window.bands
+        for key in keys:
+            members = bands[key]
+            if len(members) == 1:
+                del bands[key]
+            else:
+                members.remove(name)
+
+    def _name_alert(self, guild_id, names):
+        sample = names[-SAMPLE_SIZE:]
+        common = common_substring(sample)
+        pattern = None
+        if len(common.strip()) >= self.min_signature:
+            pattern = f"(?i){re.escape(common)}"
+        return RaidAlert('names', guild_id, len(names), sample, pattern)
+
+
+def common_substring(names):
+    """The longest text found in every one of `names`."""
+    shortest = min(names, key=len)
+    others = [name for name in names if name is not shortest]
+    for length in range(len(shortest), 0, -1):
+        for start in range(len(shortest) - length + 1):
+            candidate = shortest[start:start + length]
+            if all(candidate in name for name in others):
+                return candidate
+    return ""
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Account-metadata scoring, alongside the name rules.
+
+Accounts made for a raid give themselves away by more than their names:
+they are hours old, have no avatar, join as soon as they are made, and are
+made within minutes of each other.  This scores a batch of members on those
+features, as a weighted sum.  Members a name rule matched are banned for
+that already, so only those the rules let through are acted on: banned at
+`ban_threshold` and reported for review at `review_threshold`.  The whole
+batch still counts towards each member's cohort.  With the default weights
+no member reaches the ban threshold, so scoring only ever flags members for
+review until the weights or thresholds are tuned.
+
+Features are computed a batch at a time in plain Python.  NumPy is not a
+requirement; where it happens to be installed the same features are
+computed as arrays instead, which is faster for large batches.  Creation
+times come from the member ids (Discord snowflakes) and join times from
+`common.flux`, read against one clock reading per batch.
+"""
+import bisect
+import hashlib
+import json
+
+from common.assist import lazy_import
+
+
+# Both are loaded by the first batch scored, not by whatever imports this.
+flux = lazy_import('common.flux')
+try:
+    numpy = lazy_import('numpy')
+except ImportError:
+    numpy = None
+
+
+DISCORD_EPOCH = 1420070400  # seconds; snowflake timestamps count from here
+WEIGHTS = {
+    'young': 0.3,  # the account is younger than `young_account`
+    'no_avatar': 0.15,
+    'quick_join': 0.25,  # joined within `quick_join` of being made
+    'cohort': 0.25,  # made within `cohort_window` of others in the batch
+}
+YOUNG_ACCOUNT = 7 * 86400  # seconds
+QUICK_JOIN = 3600  # seconds
+COHORT_WINDOW = 600  # seconds either side
+COHORT_SIZE = 5  # accounts made together, counting the member itself
+REVIEW_THRESHOLD = 0.5
+BAN_THRESHOLD = 1.0
+BATCH_SIZE = 1024
+JOIN_DELAY = 2.0  # seconds a join waits for others to be scored with
+
+
+class MemberScorer:
+    """Scores batches of members on their account metadata."""
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+
+    def __init__(self, weights=None, young_account=YOUNG_ACCOUNT,
+                 quick_join=QUICK_JOIN, cohort_window=COHORT_WINDOW,
+                 cohort_size=COHORT_SIZE, review_threshold=REVIEW_THRESHOLD,
+                 ban_threshold=BAN_THRESHOLD, batch_size=BATCH_SIZE,
+                 join_delay=JOIN_DELAY):
+        self.weights = dict(WEIGHTS, **(weights or {}))
+        unknown = set(self.weights) - set(WEIGHTS)
+        if unknown:
+            raise ValueError(
+                f"Unknown scoring feature(s) {', '.join(sorted(unknown))}; "
+                f"expected {', '.join(WEIGHTS)}")
+        self.young_account = young_account
+        self.quick_join = quick_join
+        self.cohort_window = cohort_window
+        self.cohort_size = cohort_size
+        self.review_threshold = review_threshold
+        self.ban_threshold = ban_threshold
+        self.batch_size = batch_size
+        self.join_delay = join_delay
+        self.version = settings_version({
+            'weights': self.weights, 'young_account': young_account,
+            'quick_join': quick_join, 'cohort_window': cohort_window,
+            'cohort_size': cohort_size, 'review_threshold': review_threshold,
+            'ban_threshold': ban_threshold})
+
+    @classmethod
+    def from_config(cls, scoring_config):
+        scoring_config = dict(
+            scoring_config if isinstance(scoring_config, dict) else {})
+        return cls(
+            weights=scoring_config.get('weights'),
+            young_account=scoring_config.get('young_account', YOUNG_ACCOUNT),
+            quick_join=scoring_config.get('quick_join', QUICK_JOIN),
+            cohort_window=scoring_config.get('cohort_window', COHORT_WINDOW),
+            cohort_size=scoring_config.get('cohort_size', COHORT_SIZE),
+            review_threshold=scoring_config.get(
+                'review_threshold', REVIEW_THRESHOLD),
+            ban_threshold=scoring_config.get('ban_threshold', BAN_THRESHOLD),
+            batch_size=scoring_config.get('batch_size', BATCH_SIZE),
+            join_delay=scoring_config.get('join_delay', JOIN_DELAY))
+
+    def features(self, members, now=None):
+        """A dict of feature name to one flag per member, as boolean arrays
+        with NumPy and lists of bools without."""
+        if now is None:
+            now = flux.NewDelorean()
+        joined = flux.batch_epochs(
+            [getattr(member, 'joined_at', None) for member in members], now)
+        now = now.epoch
+        if numpy is not None:
+            return self._array_features(members, joined, now)
+        created = [
+            (member.id >> 22) / 1000 + DISCORD_EPOCH for member in members]
+        ordered = sorted(created)
+        window = self.cohort_window
+        return {
+            'young': [
+                now - made < self.young_account for made in created],
+            'no_avatar': [
+                getattr(member, 'avatar', None) is None
+                for member in members],
+            'quick_join': [
+                when is not None and when - made < self.quick_join
+                for when, made in zip(joined, created)],
+            'cohort': [
+                bisect.bisect_right(ordered, made + window)
+                - bisect.bisect_left(ordered, made - window)
+                >= self.cohort_size
+                for made in created],
+        }
+
+    def _array_features(self, members, joined, now):
+        count = len(members)
+        ids = numpy.fromiter(
+            (member.id for member in members), numpy.uint64, count)
+        created = numpy.right_shift(ids, numpy.uint64(22)) / 1000.0 + (
+            DISCORD_EPOCH)
+        joined = numpy.array(joined, dtype=numpy.float64)  # None is NaN
+        ordered = numpy.sort(created)
+        window = self.cohort_window
+        together = (
+            numpy.searchsorted(ordered, created + window, 'right')
+            - numpy.searchsorted(ordered, created - window, 'left'))
+        with numpy.errstate(invalid='ignore'):
+            quick_join = joined - created < self.quick_join
+        return {
+            'young': now - created < self.young_account,
+            'no_avatar': numpy.fromiter(
+                (getattr(member, 'avatar', None) is None
+                 for member in members), bool, count),
+            'quick_join': quick_join,
+            'cohort': together >= self.cohort_size,
+        }
+
+    def score(self, members, now=None):
+        """The score of each of `members`."""
+        if not members:
+            return []
+        features = self.features(members, now)
+        weights = self.weights
+        if numpy is not None:
+            scores = numpy.zeros(len(members))
+            for feature, flags in features.items():
+                scores += weights[feature] * flags
+            return scores.tolist()
+        scores = [0.0] * len(members)
+        for feature, flags in features.items():
+            weight = weights[feature]
+            for index, flag in enumerate(flags):
+                if flag:
+                    scores[index] += weight
+        return scores
+
+
+def settings_version(settings):
+    """Stable digest of the settings a score depends on."""
+    encoded = json.dumps(settings, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:12]
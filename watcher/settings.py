@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Where the daemon keeps its settings and control socket, and how long it
+takes to stop.
+
+This is all `stop`, `status`, `drain` and `reload` need to find and talk to
+a running daemon, so it is kept apart from `CoreApplication` (which builds
+on it) and everything the application imports.
+"""
+from json import load
+import pathlib
+
+from common.exceptions import NoConfiguration
+from common.get_path import BASE_DIR
+from common.log_shim import LogManager
+
+
+SETTINGS_FILE = "settings.json"
+DRAIN_TIMEOUT = 30.0  # seconds to work off the queue before shutting down
+STOP_GRACE = 10.0  # seconds, past the drain, to close the client and exit
+
+
+class DaemonSettings(LogManager):
+    """The daemon's name, paths and settings, without the application."""
+    _svc_name_ = "ban_h0nde"
+    _svc_display_name_ = "Discord Bot to Ban h0nde"
+    _svc_description_ = "Ban any user found on the server with the wrong name"
+    _sys_path = BASE_DIR
+
+    @property
+    def sys_path(self):
+        return self._sys_path
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.settings_conf = pathlib.os.path.join(
+            self.sys_path, SETTINGS_FILE)
+
+    def read_settings(self):
+        """Read settings.json alone, for commands that only need to find
+        the running daemon."""
+        try:
+            with open(self.settings_conf, "r") as settings_file:
+                self.config = load(settings_file)
+        except FileNotFoundError:
+            self.config = {}
+        except ValueError as e:
+            raise NoConfiguration(
+                f"Unable to parse {self.settings_conf}: {e}") from e
+
+    def control_path(self, shard_ids=None):
+        """Where the daemon, or the shard process for `shard_ids`, serves
+        its control socket; None if `control_socket` is false."""
+        path = self.config.get('control_socket', True)
+        if not path:
+            return None
+        if path is True:
+            path = pathlib.os.path.join(
+                self.sys_path, f"{self._svc_name_}.sock")
+        if shard_ids:
+            path = pathlib.Path(path)
+            path = path.with_name(
+                f"{path.stem}-shards-{shard_ids[0]}-{shard_ids[-1]}"
+                f"{path.suffix}")
+        return str(path)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Shadow (dry-run) screening.
+
+With `shadow` set, members are enumerated and matched exactly as usual, but
+the ban executor only records what it would have done.  A candidate ruleset
+can be screened in the same pass, and the report compares what each ruleset
+would have banned.
+
+Each member is counted once per ruleset, however many sweeps and events
+screen it, and the rate is taken over the time spent sweeping, not the
+time the daemon has been up.
+"""
+import collections
+import time
+
+
+class ShadowReport:
+    """Tally of a shadow pass under the current and, optionally, a
+    candidate ruleset."""
+
+    def __init__(self, current, candidate=None):
+        self.current = current
+        self.candidate = candidate
+        self.screened = {}  # ruleset version -> (guild id, member id)s
+        self.swept = 0  # members screened by sweeps
+        self.elapsed = 0.0  # seconds spent in sweeps
+        self._sweep_started = None
+        self.hits = {'current': {}, 'candidate': {}}
+
+    def start_sweep(self):
+        self._sweep_started = time.perf_counter()
+
+    def end_sweep(self):
+        if self._sweep_started is not None:
+            self.elapsed += time.perf_counter() - self._sweep_started
+            self._sweep_started = None
+
+    def observe(self, member, rule_id, candidate_rule_id=None):
+        key = (member.guild.id, member.id)
+        self.screened.setdefault(self.current.version, set()).add(key)
+        if self._sweep_started is not None:
+            self.swept += 1
+        if rule_id is not None:
+            self.hits['current'][key] = rule_id
+        if candidate_rule_id is not None:
+            self.hits['candidate'][key] = candidate_rule_id
+
+    def summary(self):
+        elapsed = self.elapsed
+        if self._sweep_started is not None:
+            elapsed += time.perf_counter() - self._sweep_started
+        current = self.hits['current']
+        candidate = self.hits['candidate']
+        summary = {
+            'screened': len(self.screened.get(self.current.version, ())),
+            'swept': self.swept,
+            'elapsed': elapsed,
+            'rate': self.swept / elapsed if elapsed else 0.0,
+            'current': len(current),
+            'current_rules': collections.Counter(current.values()),
+        }
+        if self.candidate is not None:
+            summary.update({
+                'candidate': len(candidate),
+                'candidate_rules': collections.Counter(candidate.values()),
+                'both': len(current.keys() & candidate.keys()),
+                'current_only': sorted(current.keys() - candidate.keys()),
+                'candidate_only': sorted(candidate.keys() - current.keys()),
+            })
+        return summary
+
+    def describe(self):
+        """Human-readable lines summarizing the pass so far."""
+        summary = self.summary()
+        lines = [
+            f"Shadow pass screened {summary['screened']} member(s) under "
+            f"ruleset {self.current.version}; sweeps screened "
+            f"{summary['swept']} in {summary['elapsed']:.1f}s "
+            f"({summary['rate']:,.0f}/s)",
+            f"Ruleset {self.current.version} would ban "
+            f"{summary['current']}: {dict(summary['current_rules'])}"]
+        if self.candidate is not None:
+            lines.extend([
+                f"Candidate ruleset {self.candidate.version} would ban "
+                f"{summary['candidate']}: "
+                f"{dict(summary['candidate_rules'])}",
+                f"Both would ban {summary['both']}; only the current "
+                f"ruleset {len(summary['current_only'])}, only the "
+                f"candidate {len(summary['candidate_only'])}"])
+        return lines
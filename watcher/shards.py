@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Process-per-shard-range gateway supervision.
+
+With `shard_processes` greater than one, the shards configured by
+`shard_count` are split into contiguous ranges and each range runs in its
+own process under a `discord.AutoShardedClient`, so gateway handling and
+name matching spread over that many cores.  The supervisor lives in the
+daemon process and restarts any shard process that dies for as long as the
+daemon is running.
+"""
+import pathlib
+import signal
+import time
+
+from common.assist import lazy_import
+
+from watcher.settings import DRAIN_TIMEOUT, STOP_GRACE
+
+
+multiprocessing = lazy_import('multiprocessing')
+
+RESTART_BACKOFF = 5.0
+MAX_RESTART_BACKOFF = 300.0
+POLL_INTERVAL = 1.0
+
+
+def shard_ranges(shard_count, processes):
+    """Split shard ids 0..shard_count-1 into `processes` contiguous ranges
+    of (nearly) equal size."""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        stop = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, stop)))
+        start = stop
+    return ranges
+
+
+class ShardProcess:
+    __slots__ = ['shard_ids', 'process', 'started', 'backoff']
+
+    def __init__(self, shard_ids):
+        self.shard_ids = shard_ids
+        self.process = None
+        self.started = 0.0
+        self.backoff = RESTART_BACKOFF
+
+
+class ShardSupervisor:
+    """Runs `app.run_client` once per shard range, each in a child process,
+    and restarts children that exit while `app.isrunning`."""
+
+    def __init__(self, app, shard_count, processes):
+        self.app = app
+        self.shard_count = shard_count
+        self.shards = [
+            ShardProcess(shard_ids)
+            for shard_ids in shard_ranges(shard_count, processes)]
+        self.context = multiprocessing.get_context('fork')
+
+    def _spawn(self, shard):
+        shard.process = self.context.Process(
+            target=self.app.run_client,
+            kwargs={
+                'shard_ids': shard.shard_ids,
+                'shard_count': self.shard_count},
+            name=f"{self.app._svc_name_}-shards-"
+                 f"{shard.shard_ids[0]}-{shard.shard_ids[-1]}",
+            daemon=True)
+        shard.process.start()
+        shard.started = time.monotonic()
+        self.app.log_manager.LogInfoMsg(
+            f"Started shard(s) {shard.shard_ids} of {self.shard_count} "
+            f"in process {shard.process.pid}")
+
+    def _check(self, shard):
+        process = shard.process
+        if process.is_alive():
+            if time.monotonic() - shard.started > MAX_RESTART_BACKOFF:
+                shard.backoff = RESTART_BACKOFF
+            return
+        if time.monotonic() - shard.started < shard.backoff:
+            return
+        self.app.log_manager.LogWarningMsg(
+            f"Shard process for {shard.shard_ids} exited with code "
+            f"{process.exitcode}; restarting")
+        shard.backoff = min(shard.backoff * 2, MAX_RESTART_BACKOFF)
+        self._spawn(shard)
+
+    def run(self):
+        for shard in self.shards:
+            self._spawn(shard)
+        try:
+            while self.app.isrunning:
+                time.sleep(POLL_INTERVAL)
+                for shard in self.shards:
+                    self._check(shard)
+        finally:
+            # Each shard process drains its ban queue before exiting.
+            self.stop(self.app.config.get('drain_timeout', DRAIN_TIMEOUT) +
+                      STOP_GRACE)
+
+    def reload(self):
+        """Have every shard process reload its ruleset."""
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                pathlib.os.kill(shard.process.pid, signal.SIGHUP)
+
+    def stop(self, timeout=10.0):
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+        deadline = time.monotonic() + timeout
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            shard.process.join(max(0.0, deadline - time.monotonic()))
+            if shard.process.is_alive():
+                shard.process.kill()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk record of screening verdicts.
+
+Every screened member is stored with a hash of the names it was screened
+under, the version of the ruleset that screened it and the verdict (the id
+of the rule it matched, or an empty string).  Members that were clean last
+time and haven't renamed since can be skipped without touching the matcher.
+Members flagged on their account metadata are stored the same way, with a
+hash of the metadata and scoring settings they were flagged under, so a
+restart doesn't flag them all over again.
+
+Verdicts are looked up a batch at a time, by primary key, and the most
+recent `cache_size` of them kept in memory, so memory stays flat however
+many members the guilds have.
+"""
+import collections
+import hashlib
+
+from common.assist import lazy_import
+
+
+sqlite3 = lazy_import('sqlite3')
+
+STATE_DB = "screening.sqlite3"
+CLEAN = ""
+FLUSH_EVERY = 1000
+CACHE_SIZE = 65536  # verdicts kept in memory
+LOOKUP_BATCH = 500  # SQLite caps the number of parameters per statement
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS screened (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    name_hash TEXT NOT NULL,
+    ruleset TEXT NOT NULL,
+    verdict TEXT NOT NULL,
+    PRIMARY KEY (guild_id, member_id)
+)
+"""
+_SCORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scored (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    score_hash TEXT NOT NULL,
+    verdict TEXT NOT NULL,
+    PRIMARY KEY (guild_id, member_id)
+)
+"""
+_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queued_bans (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    rule_id TEXT NOT NULL,
+    queued REAL NOT NULL,
+    PRIMARY KEY (guild_id, member_id)
+)
+"""
+
+
+def name_hash(*names):
+    """Digest of every name a member was screened under."""
+    joined = "\x00".join(name or "" for name in names)
+    return hashlib.blake2b(
+        joined.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class ScreeningStore:
+    """SQLite-backed verdict store; writes are buffered and flushed in
+    batches, one transaction per batch."""
+
+    def __init__(self, path, flush_every=FLUSH_EVERY, cache_size=CACHE_SIZE):
+        self.path = path
+        self.flush_every = flush_every
+        self.cache_size = cache_size
+        # Shard processes share the database, so wait out their writes.
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.execute(_SCORE_SCHEMA)
+        self.conn.execute(_QUEUE_SCHEMA)
+        self.conn.commit()
+        # (guild id, member id) -> name hash if clean, else None; LRU order
+        self.cached = collections.OrderedDict()
+        self.known_clean = 0
+        self._pending = []
+        self._pending_scores = []
+
+    def load(self, ruleset):
+        """Forget any verdicts reached under rulesets other than `ruleset`;
+        returns how many members it found clean."""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM screened WHERE ruleset != ?", (ruleset,))
+        self.cached.clear()
+        self.known_clean, = self.conn.execute(
+            "SELECT COUNT(*) FROM screened WHERE verdict = ?",
+            (CLEAN,)).fetchone()
+        return self.known_clean
+
+    def _remember(self, key, hashed):
+        cached = self.cached
+        cached[key] = hashed
+        cached.move_to_end(key)
+        while len(cached) > self.cache_size:
+            cached.popitem(last=False)
+
+    def prefetch(self, keys):
+        """Look up the verdicts for the (guild id, member id) `keys` not
+        already in memory, in as few queries as SQLite allows."""
+        missing = [key for key in keys if key not in self.cached]
+        if not missing:
+            return
+        # A batch mustn't push its own verdicts out before they are read.
+        self.cache_size = max(self.cache_size, len(keys))
+        # Unflushed verdicts are newer than the table's.
+        self.flush()
+        by_guild = collections.defaultdict(list)
+        for guild_id, member_id in missing:
+            by_guild[guild_id].append(member_id)
+        for guild_id, member_ids in by_guild.items():
+            for start in range(0, len(member_ids), LOOKUP_BATCH):
+                batch = member_ids[start:start + LOOKUP_BATCH]
+                marks = ", ".join("?" * len(batch))
+                found = dict(self.conn.execute(
+                    "SELECT member_id, name_hash FROM screened "
+                    f"WHERE guild_id = ? AND member_id IN ({marks}) "
+                    "AND verdict = ?", [guild_id, *batch, CLEAN]))
+                for member_id in batch:
+                    self._remember((guild_id, member_id), found.get(member_id))
+
+    def is_clean(self, guild_id, member_id, hashed):
+        """True if the member was found clean under the same names."""
+        key = (guild_id, member_id)
+        if key not in self.cached:
+            self.prefetch([key])
+        return self.cached[key] == hashed
+
+    def record(self, guild_id, member_id, hashed, ruleset, verdict):
+        key = (guild_id, member_id)
+        if key in self.cached:  # as it is after `is_clean`
+            self.known_clean -= self.cached[key] is not None
+            self.known_clean += verdict == CLEAN
+        self._remember(key, hashed if verdict == CLEAN else None)
+        self._pending.append((guild_id, member_id, hashed, ruleset, verdict))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def scored(self, keys):
+        """The (score hash, verdict) stored for each of the (guild id,
+        member id) `keys` that was flagged on its metadata before."""
+        self.flush()
+        by_guild = collections.defaultdict(list)
+        for guild_id, member_id in keys:
+            by_guild[guild_id].append(member_id)
+        found = {}
+        for guild_id, member_ids in by_guild.items():
+            for start in range(0, len(member_ids), LOOKUP_BATCH):
+                batch = member_ids[start:start + LOOKUP_BATCH]
+                marks = ", ".join("?" * len(batch))
+                for member_id, hashed, verdict in self.conn.execute(
+                        "SELECT member_id, score_hash, verdict FROM scored "
+                        f"WHERE guild_id = ? AND member_id IN ({marks})",
+                        [guild_id, *batch]):
+                    found[guild_id, member_id] = (hashed, verdict)
+        return found
+
+    def record_score(self, guild_id, member_id, hashed, verdict):
+        """Keep what a member was flagged as on its metadata (hashed as
+        `hashed`)."""
+        self._pending_scores.append((guild_id, member_id, hashed, verdict))
+        if len(self._pending_scores) >= self.flush_every:
+            self.flush()
+
+    def rebase(self, old_ruleset, new_ruleset):
+        """Carry clean verdicts over to a ruleset that can't have changed
+        them."""
+        self.flush()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE screened SET ruleset = ? "
+                "WHERE ruleset = ? AND verdict = ?",
+                (new_ruleset, old_ruleset, CLEAN))
+
+    def flush(self):
+        if not self._pending and not self._pending_scores:
+            return
+        pending, self._pending = self._pending, []
+        scores, self._pending_scores = self._pending_scores, []
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO screened "
+                "(guild_id, member_id, name_hash, ruleset, verdict) "
+                "VALUES (?, ?, ?, ?, ?)", pending)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scored "
+                "(guild_id, member_id, score_hash, verdict) "
+                "VALUES (?, ?, ?, ?)", scores)
+
+    def save_queued(self, bans):
+        """Keep (guild id, member id, rule id, queued at) for bans a
+        shutdown left unmade, to be taken up by the next run."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO queued_bans "
+                "(guild_id, member_id, rule_id, queued) VALUES (?, ?, ?, ?)",
+                bans)
+
+    def take_queued(self, guild_ids):
+        """Remove and return the saved bans for `guild_ids`, oldest first.
+        Shard processes share the database, so each takes its own
+        guilds'."""
+        guild_ids = list(guild_ids)
+        taken = []
+        with self.conn:
+            # SQLite caps the number of parameters per statement.
+            for start in range(0, len(guild_ids), 500):
+                batch = guild_ids[start:start + 500]
+                marks = ", ".join("?" * len(batch))
+                taken.extend(self.conn.execute(
+                    "SELECT guild_id, member_id, rule_id, queued "
+                    f"FROM queued_bans WHERE guild_id IN ({marks})", batch))
+                self.conn.execute(
+                    f"DELETE FROM queued_bans WHERE guild_id IN ({marks})",
+                    batch)
+        return sorted(taken, key=lambda ban: ban[3])
+
+    def close(self):
+        self.flush()
+        self.conn.close()